@@ -0,0 +1,60 @@
+// Times Graph.decodeColumnar in graph.js against JSON.parse of the same
+// chart points, and Graph.decodeColumns, i.e. without building the point
+// objects, on payloads written by the benchmark_results_payload command:
+//
+//     node benchmarks/results_payload.js points.json points.bin [repeat]
+var fs = require('fs'),
+    path = require('path'),
+    vm = require('vm');
+
+var root = path.join(__dirname, '..', 'herana', 'static'),
+    context = vm.createContext({});
+
+vm.runInContext(fs.readFileSync(path.join(root, 'bower_components/underscore/underscore-min.js'), 'utf8'), context);
+// Without the graph.init() which draws the page
+vm.runInContext(fs.readFileSync(path.join(root, 'javascript/graph.js'), 'utf8')
+                .replace(/var graph = new Graph\(\);\s*graph\.init\(\);\s*$/, ''), context);
+
+var _ = context._,
+    graph = new context.Graph(),
+    text = fs.readFileSync(process.argv[2], 'utf8'),
+    bytes = fs.readFileSync(process.argv[3]),
+    buffer = bytes.buffer.slice(bytes.byteOffset, bytes.byteOffset + bytes.length),
+    repeat = parseInt(process.argv[4] || '20', 10);
+
+var time = function(fn) {
+  // Once to warm up, as the page only decodes each response once
+  fn();
+  var start = process.hrtime();
+  for (var i = 0; i < repeat; i++) {
+    fn();
+  }
+  var elapsed = process.hrtime(start);
+  return (elapsed[0] * 1e3 + elapsed[1] / 1e6) / repeat;
+};
+
+var pad = function(value, width) {
+  value = String(value);
+  while (value.length < width) {
+    value = ' ' + value;
+  }
+  return value;
+};
+
+var parsed = JSON.parse(text),
+    decoded = graph.decodeColumnar(buffer);
+// The same points, scores as float32
+if (!_.isEqual(parsed.units, decoded.units) ||
+    parsed.projects.length !== decoded.projects.length ||
+    _.some(parsed.projects, function(p, i) {
+      var d = decoded.projects[i];
+      return p.id !== d.id || p.unit !== d.unit || p.duration !== d.duration ||
+        Math.abs(p.score.x - d.score.x) > 1e-4 || Math.abs(p.score.y - d.score.y) > 1e-4;
+    })) {
+  throw new Error('The columnar payload decodes to different points');
+}
+
+console.log(pad('decoder', 16) + pad('ms', 10));
+console.log(pad('JSON.parse', 16) + pad(time(function() { JSON.parse(text); }).toFixed(2), 10));
+console.log(pad('decodeColumnar', 16) + pad(time(function() { graph.decodeColumnar(buffer); }).toFixed(2), 10));
+console.log(pad('decodeColumns', 16) + pad(time(function() { graph.decodeColumns(buffer); }).toFixed(2), 10));
@@ -0,0 +1,94 @@
+// Times Graph.filterSnapshot in graph.js against the full scan it replaced,
+// on a snapshot written by the benchmark_snapshot_filters command:
+//
+//     node benchmarks/snapshot_filters.js snapshot.json [repeat]
+var fs = require('fs'),
+    path = require('path'),
+    vm = require('vm');
+
+var root = path.join(__dirname, '..', 'herana', 'static'),
+    context = vm.createContext({});
+
+vm.runInContext(fs.readFileSync(path.join(root, 'bower_components/underscore/underscore-min.js'), 'utf8'), context);
+// Without the graph.init() which draws the page
+vm.runInContext(fs.readFileSync(path.join(root, 'javascript/graph.js'), 'utf8')
+                .replace(/var graph = new Graph\(\);\s*graph\.init\(\);\s*$/, ''), context);
+
+var _ = context._,
+    graph = new context.Graph(),
+    snapshot = JSON.parse(fs.readFileSync(process.argv[2], 'utf8')),
+    repeat = parseInt(process.argv[3] || '20', 10);
+
+var scanSnapshot = function(snapshot, filters) {
+  // filterSnapshot before the index: a scan, copy and sort of the projects
+  var level = 'org_level_' + filters.org_level;
+  var projects = _.filter(snapshot.projects, function(project) {
+    var unit = project[level];
+    return unit &&
+      filters.units[unit] !== false &&
+      (!filters.status || project.status == filters.status) &&
+      (!filters.duration || project.duration == filters.duration);
+  });
+  projects = _.map(projects, function(project) {
+    return _.extend({unit: project[level]}, project);
+  });
+  return _.sortBy(projects, 'duration').reverse();
+};
+
+var hideHalf = function(level) {
+  var units = {};
+  _.each(snapshot.units[level], function(unit, i) {
+    units[unit] = i % 2 === 0;
+  });
+  return units;
+};
+
+var cases = [
+  ['all projects', {org_level: '1', units: {}}],
+  ['status', {org_level: '1', status: '2', units: {}}],
+  ['duration', {org_level: '1', duration: '3', units: {}}],
+  ['status and duration', {org_level: '1', status: '1', duration: '0', units: {}}],
+  ['half the units hidden', {org_level: '1', units: hideHalf('1')}],
+  ['level 3, all filters', {org_level: '3', status: '1', duration: '4', units: hideHalf('3')}]
+];
+
+var time = function(fn) {
+  var start = process.hrtime();
+  for (var i = 0; i < repeat; i++) {
+    fn();
+  }
+  var elapsed = process.hrtime(start);
+  return (elapsed[0] * 1e3 + elapsed[1] / 1e6) / repeat;
+};
+
+var pad = function(value, width) {
+  value = String(value);
+  while (value.length < width) {
+    value = ' ' + value;
+  }
+  return value;
+};
+
+// The index is decoded on the first filter, when the snapshot is loaded
+var start = process.hrtime();
+graph.snapshotIndex(snapshot);
+var decoded = process.hrtime(start);
+console.log('decode index: ' + (decoded[0] * 1e3 + decoded[1] / 1e6).toFixed(2) + ' ms');
+console.log(pad('case', 24) + pad('projects', 10) + pad('scan ms', 10) + pad('index ms', 10));
+
+_.each(cases, function(item) {
+  var filters = item[1],
+      scanned = scanSnapshot(snapshot, filters);
+
+  graph.filters = filters;
+  var indexed = graph.filterSnapshot(snapshot).projects;
+  // The same projects, in an order which draws larger durations first
+  if (!_.isEqual(_.sortBy(_.pluck(scanned, 'id')), _.sortBy(_.pluck(indexed, 'id'))) ||
+      _.some(indexed, function(p, i) { return i && p.duration > indexed[i - 1].duration; })) {
+    throw new Error('The index gives different results for ' + item[0]);
+  }
+
+  console.log(pad(item[0], 24) + pad(indexed.length, 10) +
+              pad(time(function() { scanSnapshot(snapshot, filters); }).toFixed(2), 10) +
+              pad(time(function() { graph.filterSnapshot(snapshot); }).toFixed(2), 10));
+});
@@ -1,16 +1,27 @@
 from datetime import date
-from copy import deepcopy
 
 from django import forms
+from django.conf.urls import url
 from django.contrib import admin
-from django.contrib.admin.options import InlineModelAdmin
+from django.contrib.admin.options import InlineModelAdmin, IncorrectLookupParameters
+from django.contrib.admin.utils import unquote
+from django.contrib.admin.views.main import ChangeList, ORDER_VAR
 from django.utils.translation import ugettext_lazy as _
 from django.forms import CheckboxSelectMultiple
 from django.db import models
 
+from django.contrib import messages
 from django.contrib.auth import get_permission_codename
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.forms import UserCreationForm
+from django.core.exceptions import PermissionDenied
+from django.core.files.storage import default_storage
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.core.urlresolvers import reverse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.defaultfilters import pluralize
+from django.template.response import TemplateResponse
 
 from models import (
     Institute,
@@ -25,6 +36,7 @@ from models import (
     ProjectFunding,
     PHDStudent,
     ProjectOutput,
+    ProjectOutputType,
     NewCourseDetail,
     CourseReqDetail,
     Collaborators,
@@ -32,7 +44,33 @@ from models import (
     ResearchTeamMember
 )
 
-from forms import ProjectDetailForm, ProjectDetailAdminForm
+from choices import (
+    QUESTIONNAIRE_OPTION_MODELS,
+    INSTITUTE_CHOICE_MODELS,
+    OTHER_ACADEMICS,
+    institute_choices,
+    option_choices,
+    questionnaire_option,
+    use_choices
+)
+from forms import (
+    ProjectDetailForm,
+    ProjectDetailAdminForm,
+    ProjectOutputForm,
+    ModerationActionForm,
+    ProjectSearchForm,
+    ReviewQueueForm,
+    AnswersExportForm
+)
+import answers
+from exports import attachment_disposition
+from moderation import MODERATION_ACTIONS, moderate_projects
+from periods import close_reporting_period, carry_over_projects
+from pipeline import bundle_media
+from search import search_projects
+from snapshots import refresh_snapshots
+from uploads import ATTACHMENT_MAX_SIZE, attachment_key, attachment_content_type
+import logos  # noqa, connects the receivers which resize uploaded logos
 
 
 ORG_LEVEL_FIELDS = ["org_level_1", "org_level_2", "org_level_3"]
@@ -219,9 +257,17 @@ class PHDStudentInline(ReadOnlyMixin, ProjectTabularInline):
 
 class ProjectOutputInline(ReadOnlyMixin, ProjectStackedInline):
     model = ProjectOutput
+    form = ProjectOutputForm
     verbose_name = _('Project output')
     verbose_name_plural = _('8.1: Please add the completed publications and other outputs for this project.')
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super(ProjectOutputInline, self).formfield_for_foreignkey(
+            db_field, request, **kwargs)
+        if db_field.name == 'type':
+            use_choices(formfield, option_choices(ProjectOutputType))
+        return formfield
+
 
 class NewCourseDetailInline(ReadOnlyMixin, ProjectTabularInline):
     model = NewCourseDetail
@@ -266,8 +312,10 @@ class InstituteAdminProjectLeaderInline(ProjectLeaderInline):
             kwargs["queryset"] = Institute.objects.filter(
                 id=request.user.get_user_institute().id)
         if db_field.name in ORG_LEVEL_FIELDS:
+                # With what the labels read, rather than a query per option
                 kwargs["queryset"] = db_field.related_model.objects.filter(
-                    institute=request.user.get_user_institute())
+                    institute=request.user.get_user_institute()).select_related(
+                    *INSTITUTE_CHOICE_MODELS[db_field.related_model])
         return super(InstituteAdminProjectLeaderInline, self).formfield_for_foreignkey(
             db_field, request, **kwargs)
 
@@ -363,6 +411,88 @@ class UserInstituteFilter(admin.SimpleListFilter):
             return queryset.filter(id__in=filtered_user_ids)
         return queryset
 
+# ------------------------------------------------------------------------------
+# Changelists
+# ------------------------------------------------------------------------------
+
+KEYSET_BEFORE_VAR = 'before'
+KEYSET_AFTER_VAR = 'after'
+
+
+class KeysetChangeList(ChangeList):
+    """
+    A changelist which pages through large lists by primary key rather than
+    by page number, as counting the rows to number the pages is the slowest
+    query on a list of tens of thousands of rows.
+
+    Used when the list is in its default, newest first order and is longer
+    than the model admin's keyset_pagination_threshold, or when following
+    one of its links. Pages are fetched with WHERE id < ... LIMIT, and only
+    link to the newest, newer and older pages.
+    """
+    def __init__(self, request, *args, **kwargs):
+        try:
+            self.before = int(request.GET.get(KEYSET_BEFORE_VAR, 0)) or None
+            self.after = int(request.GET.get(KEYSET_AFTER_VAR, 0)) or None
+        except ValueError:
+            raise IncorrectLookupParameters
+        super(KeysetChangeList, self).__init__(request, *args, **kwargs)
+
+    def get_queryset(self, request):
+        # Keep the cursor out of the filters and the links built from params
+        for var in (KEYSET_BEFORE_VAR, KEYSET_AFTER_VAR):
+            self.params.pop(var, None)
+        return super(KeysetChangeList, self).get_queryset(request)
+
+    def use_keyset(self):
+        # Searches are in order of rank, see ProjectDetailAdmin.get_search_results()
+        if ORDER_VAR in self.params or self.show_all or self.query:
+            return False
+        if self.before or self.after:
+            return True
+        # Bounded, unlike a count of the whole list
+        threshold = self.model_admin.keyset_pagination_threshold
+        return self.queryset[threshold:threshold + 1].exists()
+
+    def get_results(self, request):
+        self.keyset = self.use_keyset()
+        if not self.keyset:
+            return super(KeysetChangeList, self).get_results(request)
+
+        per_page = self.list_per_page
+        if self.after:
+            result_list = list(self.queryset
+                               .filter(pk__gt=self.after)
+                               .order_by('pk')[:per_page + 1])
+            has_newer = len(result_list) > per_page
+            result_list = result_list[:per_page][::-1]
+            has_older = True
+        else:
+            queryset = self.queryset
+            if self.before:
+                queryset = queryset.filter(pk__lt=self.before)
+            result_list = list(queryset[:per_page + 1])
+            has_older = len(result_list) > per_page
+            result_list = result_list[:per_page]
+            has_newer = bool(self.before)
+
+        self.newest_url = self.get_query_string() if has_newer else None
+        self.newer_url = None
+        self.older_url = None
+        if result_list and has_newer:
+            self.newer_url = self.get_query_string({KEYSET_AFTER_VAR: result_list[0].pk})
+        if result_list and has_older:
+            self.older_url = self.get_query_string({KEYSET_BEFORE_VAR: result_list[-1].pk})
+
+        self.result_count = len(result_list)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.result_list = result_list
+        self.can_show_all = False
+        self.multi_page = has_newer or has_older
+        self.paginator = None
+
 # ------------------------------------------------------------------------------
 # Custom User Admin
 # ------------------------------------------------------------------------------
@@ -481,8 +611,9 @@ class ReportingPeriodAdmin(admin.ModelAdmin):
             obj.institute = request.user.institute_admin.institute
             obj.save()
         else:
-            if obj.is_active == False:
-                obj.close_date = date.today()
+            if obj.is_active == False and 'is_active' in form.changed_data:
+                close_reporting_period(obj)
+            else:
                 obj.save()
 
     def get_readonly_fields(self, request, obj=None):
@@ -495,6 +626,17 @@ class ProjectDetailAdmin(admin.ModelAdmin):
     save_as = True
     list_display = ('__unicode__', 'record_status', 'reporting_period', invert_rejected)
     list_display_links = ('__unicode__',)
+    # The other columns are fields of the project itself
+    list_select_related = ('reporting_period',)
+    # Filtered lists are counted once, not again unfiltered for the total
+    show_full_result_count = False
+    # Longer lists are paged by KeysetChangeList without counting them
+    keyset_pagination_threshold = 5000
+    review_per_page = 100
+    # Shows the search box, the search itself is get_search_results()
+    search_fields = ('name',)
+    actions = ['carry_over', 'reject', 'flag', 'unflag']
+    action_form = ModerationActionForm
     form = ProjectDetailForm
     formfield_overrides = {
         models.ManyToManyField: {'widget': CheckboxSelectMultiple},
@@ -580,7 +722,7 @@ class ProjectDetailAdmin(admin.ModelAdmin):
     )
 
     class Media:
-        js = ('javascript/app.js',)
+        js = bundle_media('questionnaire')
 
     def has_add_permission(self, request, obj=None):
         if request.user.is_proj_leader:
@@ -595,9 +737,201 @@ class ProjectDetailAdmin(admin.ModelAdmin):
                 return False
         return True
 
+    def is_closed(self, request, obj):
+        """
+        Return True if the project is final in a closed reporting period,
+        which a project leader can still view and save as new, but not change.
+        """
+        return request.user.is_proj_leader and obj.record_status == 2 and \
+            not obj.reporting_period.is_active
+
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        # Its score is frozen, see results.freeze_scores()
+        if request.method == 'POST' and '_saveasnew' not in request.POST:
+            obj = self.get_object(request, unquote(object_id))
+            if obj is not None and self.is_closed(request, obj):
+                raise PermissionDenied
+        return super(ProjectDetailAdmin, self).change_view(
+            request, object_id, form_url=form_url, extra_context=extra_context)
+
     def has_delete_permission(self, request, obj=None):
         return False
 
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_urls(self):
+        urls = [
+            url(r'^review/$', self.admin_site.admin_view(self.review_view),
+                name='herana_projectdetail_review'),
+            url(r'^attachment-upload/$', self.admin_site.admin_view(self.attachment_upload_view),
+                name='herana_projectdetail_attachment_upload'),
+            url(r'^search/$', self.admin_site.admin_view(self.search_view),
+                name='herana_projectdetail_search'),
+            url(r'^answers/$', self.admin_site.admin_view(self.answers_view),
+                name='herana_projectdetail_answers'),
+        ]
+        return urls + super(ProjectDetailAdmin, self).get_urls()
+
+    def attachment_upload_view(self, request):
+        """
+        Return a presigned POST with which the browser uploads a project
+        output's attachment straight to the file storage, see herana.uploads.
+        """
+        if request.method != 'POST' or not request.POST.get('filename'):
+            return JsonResponse({'error': 'A filename is required.'}, status=400)
+        if not user_has_perm(request, ProjectOutput._meta, 'add'):
+            raise PermissionDenied
+        key = attachment_key(request.POST['filename'])
+        upload = default_storage.presigned_post(key, ATTACHMENT_MAX_SIZE, attachment_content_type(key))
+        upload['key'] = key
+        return JsonResponse(upload)
+
+    def search_view(self, request):
+        """
+        Return the projects the user may see which match the search text q,
+        best match first, see herana.search.
+        """
+        form = ProjectSearchForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+
+        projects = search_projects(self.get_queryset(request), form.cleaned_data['q'])\
+            .select_related('reporting_period')\
+            .only('name', 'record_status', 'reporting_period', 'reporting_period__name')
+        return JsonResponse({'projects': [{
+            'id': project.id,
+            'name': project.name,
+            'record_status': project.get_record_status_display(),
+            'reporting_period': project.reporting_period.name,
+            'rank': getattr(project, 'search_rank', None),
+            'url': reverse('admin:herana_projectdetail_change', args=[project.id]),
+        } for project in projects[:form.cleaned_data['limit']]]})
+
+    def answers_view(self, request):
+        """
+        Stream the questionnaire answers of all the projects the user may
+        see, as a wide CSV table or with format=jsonl as JSON Lines, see
+        herana.answers.
+        """
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        form = AnswersExportForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+
+        projects = self.get_queryset(request)
+        if form.cleaned_data['format'] == 'jsonl':
+            response = StreamingHttpResponse(answers.jsonl_lines(projects),
+                                             content_type='application/x-ndjson')
+        else:
+            response = StreamingHttpResponse(answers.csv_lines(projects), content_type='text/csv')
+        response['Content-Disposition'] = attachment_disposition(
+            'Herana answers - %s.%s' % (date.today(), form.cleaned_data['format']))
+        return response
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        projects = search_projects(queryset, search_term)
+        if ORDER_VAR in request.GET:
+            # Sorted by a column, the changelist has already ordered the queryset
+            projects = projects.order_by(*queryset.query.order_by)
+        return projects, False
+
+    def get_actions(self, request):
+        actions = super(ProjectDetailAdmin, self).get_actions(request)
+        # Carrying over adds projects
+        if not self.has_add_permission(request):
+            actions.pop('carry_over', None)
+        if not self.has_moderate_permission(request):
+            for action in MODERATION_ACTIONS:
+                actions.pop(action, None)
+        return actions
+
+    def has_moderate_permission(self, request):
+        return user_has_perm(request, self.opts, 'reject')
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = dict(extra_context or {},
+                             has_moderate_permission=self.has_moderate_permission(request))
+        return super(ProjectDetailAdmin, self).changelist_view(request, extra_context=extra_context)
+
+    def moderate(self, request, queryset, action):
+        count = moderate_projects(request.user, queryset, action,
+                                  request.POST.get('rejected_detail', ''))
+        verb = MODERATION_ACTIONS[action][2]
+        self.message_user(request, "%s %d project%s." % (verb, count, pluralize(count)))
+
+    def reject(self, request, queryset):
+        self.moderate(request, queryset, 'reject')
+
+    reject.short_description = 'Reject selected projects'
+
+    def flag(self, request, queryset):
+        self.moderate(request, queryset, 'flag')
+
+    flag.short_description = 'Flag selected projects'
+
+    def unflag(self, request, queryset):
+        self.moderate(request, queryset, 'unflag')
+
+    unflag.short_description = 'Unflag selected projects'
+
+    def review_view(self, request):
+        """
+        A queue of the accepted submissions in active reporting periods,
+        flagged first, a page at a time, which are marked with the keyboard
+        for rejecting, flagging or unflagging and then moderated in one go.
+        """
+        if not self.has_moderate_permission(request):
+            raise PermissionDenied
+
+        projects = self.get_queryset(request).filter(
+            record_status=2, is_rejected=False, reporting_period__is_active=True)
+
+        if request.method == 'POST':
+            form = ReviewQueueForm(request.POST)
+            if not form.is_valid():
+                self.message_user(request, "The marked projects couldn't be moderated.",
+                                  level=messages.ERROR)
+            else:
+                for action in MODERATION_ACTIONS:
+                    ids = form.cleaned_data[action]
+                    if ids:
+                        self.moderate(request, projects.filter(id__in=ids), action)
+            return redirect(request.get_full_path())
+
+        paginator = Paginator(projects
+                              .select_related('reporting_period', 'org_level_1')
+                              .order_by('-is_flagged', '-id'),
+                              self.review_per_page)
+        try:
+            page = paginator.page(request.GET.get('p', 1))
+        except PageNotAnInteger:
+            page = paginator.page(1)
+        except EmptyPage:
+            page = paginator.page(paginator.num_pages)
+
+        context = dict(
+            self.admin_site.each_context(request),
+            title='Review submissions',
+            opts=self.opts,
+            page=page,
+            projects=page.object_list,
+        )
+        return TemplateResponse(request, 'admin/herana/projectdetail/review_queue.html', context)
+
+    def carry_over(self, request, queryset):
+        """
+        Copy the selected projects into the active reporting period.
+        """
+        copies = carry_over_projects(queryset.filter(is_deleted=False))
+        self.message_user(request, "%d of the %d selected projects were carried over "
+                          "into the active reporting period." % (len(copies), len(queryset)))
+
+    carry_over.short_description = 'Carry over selected projects into the active reporting period'
+
     def get_list_display(self, request):
         """
         Only show is_flagged field to admin users
@@ -647,20 +981,38 @@ class ProjectDetailAdmin(admin.ModelAdmin):
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name in ORG_LEVEL_FIELDS:
+            institute = request.user.get_user_institute()
             kwargs["queryset"] = db_field.related_model.objects.filter(
-                institute=request.user.get_user_institute())
+                institute=institute)
+            formfield = super(ProjectDetailAdmin, self).formfield_for_foreignkey(
+                db_field, request, **kwargs)
+            if institute:
+                use_choices(formfield, institute_choices(db_field.related_model, institute))
+            return formfield
         return super(ProjectDetailAdmin, self).formfield_for_foreignkey(
             db_field, request, **kwargs)
 
     def formfield_for_manytomany(self, db_field, request, **kwargs):
         if db_field.name == "strategic_objectives":
+            institute = request.user.get_user_institute()
             kwargs["queryset"] = StrategicObjective.objects.filter(
-                institute=request.user.get_user_institute())
-        return super(ProjectDetailAdmin, self).formfield_for_manytomany(
+                institute=institute)
+            formfield = super(ProjectDetailAdmin, self).formfield_for_manytomany(
+                db_field, request, **kwargs)
+            if institute:
+                admin_labels = request.user.is_superuser or request.user.is_institute_admin
+                use_choices(formfield, institute_choices(StrategicObjective, institute, admin_labels))
+            return formfield
+        formfield = super(ProjectDetailAdmin, self).formfield_for_manytomany(
             db_field, request, **kwargs)
+        if db_field.related_model in QUESTIONNAIRE_OPTION_MODELS:
+            use_choices(formfield, option_choices(db_field.related_model))
+        return formfield
 
     def get_fieldsets(self, request, obj=None):
-        fieldsets = deepcopy(super(ProjectDetailAdmin, self).get_fieldsets(request, obj=obj))
+        # Copy the fieldset options which are changed below
+        fieldsets = [(name, dict(options)) for name, options in
+                     super(ProjectDetailAdmin, self).get_fieldsets(request, obj=obj)]
         if not request.user.is_superuser:
             # Org levels may vary.
             # Only include levels which have been set up.
@@ -678,6 +1030,7 @@ class ProjectDetailAdmin(admin.ModelAdmin):
         return fieldsets
 
     def render_change_form(self, request, context, add=False, change=False, form_url='', obj=None):
+        context['is_closed'] = obj is not None and self.is_closed(request, obj)
         form = context['adminform'].form
         if form.fields.get('org_level_1', False):
             if add:
@@ -747,14 +1100,16 @@ class ProjectDetailAdmin(admin.ModelAdmin):
                         obj.reporting_period = reporting_period
 
         # Flag as suspect if other academics is the only chosen team member
-        # 7: Other academics
-        other_academics = ResearchTeamMember.objects.get(id=7)
+        other_academics = questionnaire_option(ResearchTeamMember, OTHER_ACADEMICS)
         if form.cleaned_data.get('team_members'):
             if other_academics in form.cleaned_data.get('team_members') and len(form.cleaned_data.get('team_members')) == 1:
                 obj.is_flagged = True
 
         super(ProjectDetailAdmin, self).save_model(request, obj, form, change)
 
+        if change and 'is_rejected' in form.changed_data:
+            refresh_snapshots([obj.reporting_period])
+
 
 admin.site.register(Institute, InstituteModelAdmin)
 admin.site.register(OrgLevel1, OrgLevelAdmin)
@@ -0,0 +1,159 @@
+"""
+Bulk export of the raw questionnaire answers, for research.
+
+Each project is exported with its own fields, the options chosen for its
+many-to-many questions and the rows of its inlines, see
+periods.PROJECT_INLINE_MODELS:
+
+- as JSON Lines, a nested object per project, options as lists of codes
+  and inline rows as lists of objects.
+- as a wide CSV table, a row per project, with a 0/1 column per option
+  and the inline rows numbered across columns, up to the most any of the
+  projects has.
+
+Questionnaire options are given by code. Strategic objectives, which are
+the institute's own, are given by id.
+
+Projects are read a chunk at a time, with their options and inline rows
+in one query per question and inline for the whole chunk.
+"""
+import csv
+import json
+from collections import defaultdict, OrderedDict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count
+
+from models import ProjectDetail
+from choices import questionnaire_options
+from exports import Echo
+from periods import PROJECT_INLINE_MODELS
+from results import chunks
+
+
+ANSWERS_CHUNK_SIZE = 500
+
+PROJECT_FIELDS = [field.attname for field in ProjectDetail._meta.concrete_fields]
+
+# The many-to-many questions, and whether they're questionnaire options
+# with codes, rather than e.g. the institute's strategic objectives
+M2M_FIELDS = OrderedDict(
+    (field.name, 'code' in [f.name for f in field.related_model._meta.fields])
+    for field in ProjectDetail._meta.many_to_many)
+
+INLINES = OrderedDict(
+    (model._meta.model_name, model) for model in PROJECT_INLINE_MODELS)
+
+
+def inline_fields(model):
+    return [field.attname for field in model._meta.concrete_fields
+            if not field.primary_key and field.name != 'project']
+
+
+def project_answers(projects):
+    """
+    Yield the answers of each project in a queryset as a dict of its
+    fields, a list per many-to-many question and a list of row dicts per
+    inline, in order of id.
+    """
+    codes = dict((name, _option_codes(name)) for name, coded in M2M_FIELDS.items() if coded)
+
+    for chunk in chunks(projects.select_related(None).prefetch_related(None), ANSWERS_CHUNK_SIZE):
+        ids = [project.pk for project in chunk]
+
+        chosen = {}
+        for name in M2M_FIELDS:
+            chosen[name] = defaultdict(list)
+            through = getattr(ProjectDetail, name).through
+            target = getattr(ProjectDetail, name).field.m2m_reverse_field_name()
+            rows = through.objects\
+                .filter(projectdetail_id__in=ids)\
+                .order_by('pk')\
+                .values_list('projectdetail_id', target + '_id')
+            for project_id, option_id in rows:
+                chosen[name][project_id].append(codes[name][option_id] if name in codes else option_id)
+
+        inline_rows = {}
+        for name, model in INLINES.items():
+            inline_rows[name] = defaultdict(list)
+            rows = model.objects\
+                .filter(project_id__in=ids)\
+                .order_by('pk')\
+                .values('project_id', *inline_fields(model))
+            for row in rows:
+                inline_rows[name][row.pop('project_id')].append(row)
+
+        for project in chunk:
+            answers = OrderedDict((field, getattr(project, field)) for field in PROJECT_FIELDS)
+            for name in M2M_FIELDS:
+                answers[name] = chosen[name][project.pk]
+            for name in INLINES:
+                answers[name] = inline_rows[name][project.pk]
+            yield answers
+
+
+def jsonl_lines(projects):
+    """
+    Yield the answers of the projects in a queryset as JSON Lines.
+    """
+    for answers in project_answers(projects):
+        yield json.dumps(answers, cls=DjangoJSONEncoder, separators=(',', ':')) + '\n'
+
+
+def csv_lines(projects):
+    """
+    Yield the answers of the projects in a queryset as the lines of
+    a wide CSV table.
+    """
+    inline_counts = dict((name, _most_rows(model, projects)) for name, model in INLINES.items())
+    options = dict((name, _option_codes(name).values()) for name, coded in M2M_FIELDS.items() if coded)
+
+    headings = list(PROJECT_FIELDS)
+    for name, coded in M2M_FIELDS.items():
+        if coded:
+            headings.extend('%s_%s' % (name, code) for code in sorted(options[name]))
+        else:
+            headings.append(name)
+    for name, model in INLINES.items():
+        for i in range(1, inline_counts[name] + 1):
+            headings.extend('%s_%d_%s' % (name, i, field) for field in inline_fields(model))
+
+    writer = csv.writer(Echo())
+    yield writer.writerow(headings)
+    for answers in project_answers(projects):
+        values = [answers[field] for field in PROJECT_FIELDS]
+        for name, coded in M2M_FIELDS.items():
+            if coded:
+                values.extend(int(code in answers[name]) for code in sorted(options[name]))
+            else:
+                values.append(';'.join(str(value) for value in answers[name]))
+        for name, model in INLINES.items():
+            fields = inline_fields(model)
+            rows = answers[name]
+            for i in range(inline_counts[name]):
+                row = rows[i] if i < len(rows) else {}
+                values.extend(row.get(field) for field in fields)
+        yield writer.writerow([_csv_value(value) for value in values])
+
+
+def _option_codes(name):
+    model = getattr(ProjectDetail, name).field.related_model
+    return dict((option.pk, option.code) for option in questionnaire_options(model))
+
+
+def _most_rows(model, projects):
+    counts = model.objects\
+        .filter(project__in=projects)\
+        .values('project')\
+        .annotate(count=Count('pk'))\
+        .order_by('-count')\
+        .values_list('count', flat=True)
+    return counts[0] if counts else 0
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
@@ -0,0 +1,115 @@
+"""
+Autocomplete of the org level units across institutes.
+
+Grappelli's autocomplete lookup filters with icontains on the fields of
+OrgLevel.autocomplete_search_fields() and orders by name. For the org
+levels it's replaced by OrgLevelAutocompleteLookup, see herana.urls, which
+ranks units whose name starts with the term first, then by trigram
+similarity on PostgreSQL, and caches each page of suggestions.
+
+On PostgreSQL the icontains and istartswith lookups on the unit and
+institute names are served by pg_trgm GIN indexes, see migration 0011.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Q, Case, When, Value, IntegerField
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.encoding import smart_text, force_bytes
+
+from models import Institute, OrgLevel1, OrgLevel2, OrgLevel3
+
+
+AUTOCOMPLETE_TIMEOUT = 5 * 60
+
+# Related objects used by the labels of each model
+AUTOCOMPLETE_MODELS = {
+    OrgLevel1: ('institute',),
+    OrgLevel2: ('institute', 'parent'),
+    OrgLevel3: ('institute', 'parent'),
+}
+
+SIMILARITY = "similarity(herana_orglevel.name, %s)"
+
+# Bumped on any change to the units or institutes, which makes all the
+# cached suggestions stale at once
+VERSION_KEY = 'herana:autocomplete:version'
+
+
+def search_units(units, term):
+    """
+    Return the units in a queryset with the given id or matching every
+    word of the term in their own or their institute's name, those whose
+    name starts with the term first.
+    """
+    words = term.split()
+    if not words:
+        return units.none()
+    matches = units
+    for word in words:
+        matches = matches.filter(Q(name__icontains=word) | Q(institute__name__icontains=word))
+    if term.strip().isdigit():
+        matches = matches | units.filter(id=int(term))
+    units = matches
+
+    units = units.annotate(prefix=Case(
+        When(name__istartswith=term.strip(), then=Value(0)),
+        default=Value(1),
+        output_field=IntegerField()))
+    if connections[units.db].vendor != 'postgresql':
+        return units.order_by('prefix', 'name', 'pk')
+    return units\
+        .extra(select={'similarity': SIMILARITY}, select_params=[term])\
+        .order_by('prefix', '-similarity', 'name', 'pk')
+
+
+def unit_suggestions(units, term, limit):
+    """
+    Return the grappelli lookup suggestions, [{value, label}], for the
+    units in a queryset matching the term, from the cache if they've been
+    looked up since the units last changed.
+    """
+    key = _suggestions_key(units, term, limit)
+    suggestions = cache.get(key)
+    if suggestions is None:
+        units = search_units(units, term)\
+            .select_related(*AUTOCOMPLETE_MODELS[units.model])[:limit]
+        suggestions = [{'value': unit.pk, 'label': smart_text(unit)} for unit in units]
+        cache.set(key, suggestions, AUTOCOMPLETE_TIMEOUT)
+    return suggestions
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, _initial_version(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _initial_version():
+    # Not reusing the versions of suggestions which may still be cached
+    # after the version itself was evicted
+    return int(time.time())
+
+
+def _suggestions_key(units, term, limit):
+    # The queryset's SQL covers the lookup's filters, e.g. the institute
+    sql, params = units.query.sql_with_params()
+    digest = hashlib.md5(force_bytes(u'%s|%s|%s|%d' % (sql, params, term.strip().lower(), limit)))
+    return 'herana:autocomplete:%s:%s' % (_version(), digest.hexdigest())
+
+
+@receiver([post_save, post_delete], sender=Institute)
+@receiver([post_save, post_delete], sender=OrgLevel1)
+@receiver([post_save, post_delete], sender=OrgLevel2)
+@receiver([post_save, post_delete], sender=OrgLevel3)
+def clear_suggestions(sender, **kwargs):
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # Not cached yet, or evicted
+        cache.set(VERSION_KEY, _initial_version(), None)
@@ -1,16 +1,137 @@
+import base64
+import datetime
+import hashlib
+import hmac
+import json
 import os
+import threading
+import time
+
 from storages.backends.s3boto import S3BotoStorage
 from django.conf import settings
 
 # Hack to work around https://github.com/jschneier/django-storages/issues/28
 os.environ['S3_USE_SIGV4'] = 'True'
 
+# Connections and bucket handles shared by every storage in the process.
+# boto keeps a pool of HTTP connections per host behind each connection,
+# so greenlets can share them; the lock is cooperative once gunicorn's
+# gevent worker has monkey patched threading.
+_connections = {}
+_buckets = {}
+_lock = threading.Lock()
+
+# Signed URLs by key, with the time they're handed out until
+_signed_urls = {}
+SIGNED_URL_CACHE_SIZE = 10000
+# A cached URL is replaced this many seconds before it expires, so that
+# a page isn't rendered with links which expire while it's being read.
+SIGNED_URL_MARGIN = 5 * 60
+
 
 class S3Storage(S3BotoStorage):
     @property
     def connection(self):
         if self._connection is None:
-            self._connection = self.connection_class(
-                self.access_key, self.secret_key,
-                calling_format=self.calling_format, host=settings.AWS_S3_HOST)
+            key = (self.access_key, self.secret_key, settings.AWS_S3_HOST,
+                   self.calling_format)
+            with _lock:
+                if key not in _connections:
+                    _connections[key] = self.connection_class(
+                        self.access_key, self.secret_key,
+                        calling_format=self.calling_format, host=settings.AWS_S3_HOST)
+            self._connection = _connections[key]
         return self._connection
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            key = (id(self.connection), self.bucket_name)
+            with _lock:
+                if key not in _buckets:
+                    _buckets[key] = self._get_or_create_bucket(self.bucket_name)
+            self._bucket = _buckets[key]
+        return self._bucket
+
+    def url(self, name):
+        """
+        Return the URL of a file, reusing the signed URL of an earlier call
+        until shortly before it expires.
+        """
+        if self.custom_domain or not self.querystring_auth:
+            return super(S3Storage, self).url(name)
+
+        key = (self.bucket_name, name, self.secure_urls)
+        now = time.time()
+        cached = _signed_urls.get(key)
+        if cached and cached[1] > now:
+            return cached[0]
+
+        url = super(S3Storage, self).url(name)
+        if len(_signed_urls) >= SIGNED_URL_CACHE_SIZE:
+            _signed_urls.clear()
+        _signed_urls[key] = (url, now + self.querystring_expire - SIGNED_URL_MARGIN)
+        return url
+
+    def _save_content(self, key, content, headers):
+        """
+        Store a file with any headers of its own, e.g. the Cache-Control and
+        Content-Disposition of the results snapshots, gzipping it first if
+        it asks to be, see herana.snapshots.
+        """
+        headers = dict(headers, **getattr(content, 'headers', {}))
+        if getattr(content, 'gzip', False) and 'Content-Encoding' not in headers:
+            content = self._compress_content(content)
+            headers['Content-Encoding'] = 'gzip'
+        super(S3Storage, self)._save_content(key, content, headers)
+
+    def presigned_post(self, name, max_size, content_type, expires_in=3600):
+        """
+        Return the URL and form fields with which a browser can upload a file
+        of up to max_size bytes straight to the bucket, stored as the given
+        content type, see herana.uploads.
+
+        boto 2's build_post_form_args() only signs the version 2 form, which
+        S3 rejects once signing is switched to version 4 above, so the POST
+        policy is signed with AWS4-HMAC-SHA256 here.
+        """
+        connection = self.connection
+        key = self._encode_name(self._normalize_name(self._clean_name(name)))
+        now = datetime.datetime.utcnow()
+        date = now.strftime('%Y%m%d')
+        region = connection._auth_handler.determine_region_name(connection.host)
+        credential = '%s/%s/%s/s3/aws4_request' % (connection.aws_access_key_id, date, region)
+
+        fields = [('key', key)]
+        if self.default_acl:
+            fields.append(('acl', self.default_acl))
+        fields += [
+            ('x-amz-algorithm', 'AWS4-HMAC-SHA256'),
+            ('x-amz-credential', credential),
+            ('x-amz-date', now.strftime('%Y%m%dT%H%M%SZ')),
+            ('Content-Type', content_type),
+        ]
+        if connection.provider.security_token:
+            fields.append(('x-amz-security-token', connection.provider.security_token))
+        conditions = [{'bucket': self.bucket_name}] + [{k: v} for k, v in fields] + [
+            ['content-length-range', 0, max_size],
+        ]
+        expiration = now + datetime.timedelta(seconds=expires_in)
+        policy = base64.b64encode(json.dumps({
+            'expiration': expiration.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'conditions': conditions,
+        }).encode('utf-8'))
+
+        signing_key = ('AWS4' + connection.aws_secret_access_key).encode('utf-8')
+        for part in (date, region, 's3', 'aws4_request'):
+            signing_key = hmac.new(signing_key, part.encode('utf-8'), hashlib.sha256).digest()
+        signature = hmac.new(signing_key, policy, hashlib.sha256).hexdigest()
+
+        fields.append(('policy', policy))
+        fields.append(('x-amz-signature', signature))
+        return {
+            'action': '%s://%s/' % ('https' if self.secure_urls else 'http',
+                                    connection.calling_format.build_host(
+                                        connection.server_name(), self.bucket_name)),
+            'fields': [{'name': k, 'value': v} for k, v in fields],
+        }
@@ -0,0 +1,141 @@
+"""
+Cached choices for the project forms.
+
+The questionnaire options (focus areas, advisory group representatives
+etc.) are seed data from migration 0002 which only changes with a deploy,
+so they're loaded once per process, and looked up by their code rather
+than queried wherever a particular option is needed.
+
+The org levels and strategic objectives offered on a project belong to the
+project leader's institute and are edited through the institute admin, so
+they're kept in the cache per institute and cleared whenever one of them,
+or the institute, changes.
+"""
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.encoding import smart_text
+
+from models import (
+    Institute,
+    OrgLevel1,
+    OrgLevel2,
+    OrgLevel3,
+    StrategicObjective,
+    FocusArea,
+    AdvisoryGroupRep,
+    ResearchTeamMember,
+    StudentType,
+    StudentParticipationNature,
+    ProjectOutputType,
+)
+
+
+QUESTIONNAIRE_OPTION_MODELS = (
+    FocusArea,
+    AdvisoryGroupRep,
+    ResearchTeamMember,
+    StudentType,
+    StudentParticipationNature,
+    ProjectOutputType,
+)
+
+# Related objects used by the labels of each model
+INSTITUTE_CHOICE_MODELS = {
+    OrgLevel1: ('institute',),
+    OrgLevel2: ('institute', 'parent'),
+    OrgLevel3: ('institute', 'parent'),
+    StrategicObjective: (),
+}
+
+# Codes of the options which ask for more detail, see migration 0002
+OTHER_FOCUS_AREA = 4
+OTHER_ACADEMICS = 7
+OTHER_STUDENT_NATURE = 6
+
+INSTITUTE_CHOICES_TIMEOUT = 60 * 60
+
+_options = {}
+_options_by_code = {}
+
+
+def questionnaire_options(model):
+    """
+    Return the options of a questionnaire option model.
+    """
+    if model not in _options:
+        options = list(model.objects.order_by('pk'))
+        _options_by_code[model] = dict((option.code, option) for option in options)
+        _options[model] = options
+    return _options[model]
+
+
+def questionnaire_option(model, code):
+    """
+    Return the option of a questionnaire option model with the given code.
+    """
+    questionnaire_options(model)
+    return _options_by_code[model][code]
+
+
+def option_choices(model):
+    return [(option.pk, smart_text(option)) for option in questionnaire_options(model)]
+
+
+def institute_choices(model, institute, admin_labels=False):
+    """
+    Return the (pk, label) choices of an institute's org levels or
+    strategic objectives. Strategic objectives are labelled with whether
+    they're correct for admin users, see StrategicObjective.__unicode__,
+    so admin_labels should be True for them.
+    """
+    key = _institute_key(model, institute.id, admin_labels)
+    choices = cache.get(key)
+    if choices is None:
+        objects = model.objects\
+            .filter(institute=institute)\
+            .select_related(*INSTITUTE_CHOICE_MODELS[model])
+        choices = [(obj.pk, smart_text(obj)) for obj in objects]
+        cache.set(key, choices, INSTITUTE_CHOICES_TIMEOUT)
+    return choices
+
+
+def use_choices(formfield, choices):
+    """
+    Render a model choice field with the given choices instead of querying
+    its queryset, which is still used to validate the submitted values.
+    """
+    if formfield.empty_label is not None:
+        choices = [('', formfield.empty_label)] + choices
+    formfield.choices = choices
+    return formfield
+
+
+def _institute_key(model, institute_id, admin_labels):
+    return 'herana:choices:%s:%s:%d' % (model._meta.model_name, institute_id, admin_labels)
+
+
+@receiver([post_save, post_delete], sender=FocusArea)
+@receiver([post_save, post_delete], sender=AdvisoryGroupRep)
+@receiver([post_save, post_delete], sender=ResearchTeamMember)
+@receiver([post_save, post_delete], sender=StudentType)
+@receiver([post_save, post_delete], sender=StudentParticipationNature)
+@receiver([post_save, post_delete], sender=ProjectOutputType)
+def clear_questionnaire_options(sender, **kwargs):
+    _options.pop(sender, None)
+    _options_by_code.pop(sender, None)
+
+
+@receiver([post_save, post_delete], sender=Institute)
+@receiver([post_save, post_delete], sender=OrgLevel1)
+@receiver([post_save, post_delete], sender=OrgLevel2)
+@receiver([post_save, post_delete], sender=OrgLevel3)
+@receiver([post_save, post_delete], sender=StrategicObjective)
+def clear_institute_choices(sender, instance, **kwargs):
+    # Labels include the institute and parent unit names,
+    # so every list of the institute is cleared
+    institute_id = instance.id if sender is Institute else instance.institute_id
+    cache.delete_many([
+        _institute_key(model, institute_id, admin_labels)
+        for model in INSTITUTE_CHOICE_MODELS
+        for admin_labels in (False, True)])
@@ -0,0 +1,150 @@
+"""
+Comparison of the results of institutes across their closed reporting
+periods, from the stored scores, see models.ProjectScore.
+
+Each institute and period is summarised by the number of projects, the
+mean and quantiles of their academic core (x) and articulation (y) scores,
+and how many projects fall in each quadrant of the results graph.
+
+On PostgreSQL all of it is computed in one grouped query, with
+percentile_cont() for the quantiles. Other databases read the scores in
+one ordered pass and summarise them in Python, with the same interpolation.
+"""
+from django.db import connections
+
+from models import Institute, ReportingPeriod, ProjectScore
+from results import final_projects
+
+
+QUANTILES = (0.25, 0.5, 0.75)
+
+# Where the graph is divided into quadrants, on both axes
+QUADRANT_SPLIT = 4.5
+
+# (name, x above the split, y above the split)
+QUADRANTS = (
+    ('high_core_high_articulation', True, True),
+    ('high_core_low_articulation', True, False),
+    ('low_core_high_articulation', False, True),
+    ('low_core_low_articulation', False, False),
+)
+
+AXES = ('x', 'y')
+
+
+def comparison_scores(institutes=None):
+    """
+    Return a queryset of the stored scores of the final, accepted
+    projects in closed reporting periods, of the given institutes or all.
+    """
+    projects = final_projects(reporting_period__is_active=False)
+    if institutes:
+        projects = projects.filter(institute__in=institutes)
+    return ProjectScore.objects.filter(project__in=projects)
+
+
+def compare_institutes(scores):
+    """
+    Return a summary per institute and reporting period of a queryset
+    of ProjectScores, ordered by institute and period name.
+    """
+    if connections[scores.db].vendor == 'postgresql':
+        rows = _grouped_summaries(scores)
+    else:
+        rows = _ordered_summaries(scores)
+
+    institutes = Institute.objects.in_bulk(set(r['institute'] for r in rows))
+    periods = ReportingPeriod.objects.in_bulk(set(r['reporting_period'] for r in rows))
+    for row in rows:
+        institute = institutes[row['institute']]
+        period = periods[row['reporting_period']]
+        row['institute'] = {'id': institute.id, 'name': institute.name}
+        row['reporting_period'] = {'id': period.id, 'name': period.name}
+    rows.sort(key=lambda r: (r['institute']['name'], r['institute']['id'],
+                             r['reporting_period']['name']))
+    return rows
+
+
+def _grouped_summaries(scores):
+    columns = ['institute_id', 'reporting_period_id', 'count(*)']
+    params = []
+    for axis in AXES:
+        columns.append('avg(%s)' % axis)
+        columns.append('percentile_cont(%%s::float8[]) WITHIN GROUP (ORDER BY %s)' % axis)
+        params.append(list(QUANTILES))
+    for name, high_x, high_y in QUADRANTS:
+        columns.append('sum(CASE WHEN x %s %%s AND y %s %%s THEN 1 ELSE 0 END)' % (
+            '>=' if high_x else '<', '>=' if high_y else '<'))
+        params.extend([QUADRANT_SPLIT, QUADRANT_SPLIT])
+
+    ids_sql, ids_params = scores.values('id').query.sql_with_params()
+    sql = 'SELECT %s FROM herana_projectscore WHERE id IN (%s) ' \
+          'GROUP BY institute_id, reporting_period_id' % (', '.join(columns), ids_sql)
+
+    cursor = connections[scores.db].cursor()
+    cursor.execute(sql, params + list(ids_params))
+    rows = []
+    for values in cursor.fetchall():
+        values = list(values)
+        row = {
+            'institute': values.pop(0),
+            'reporting_period': values.pop(0),
+            'count': values.pop(0),
+        }
+        for axis in AXES:
+            row[axis] = {
+                'mean': values.pop(0),
+                'quantiles': values.pop(0),
+            }
+        row['quadrants'] = dict((name, int(values.pop(0))) for name, _, _ in QUADRANTS)
+        rows.append(row)
+    return rows
+
+
+def _ordered_summaries(scores):
+    rows = []
+    group = None
+    values = None
+    ordered = scores\
+        .order_by('institute', 'reporting_period')\
+        .values_list('institute', 'reporting_period', 'x', 'y')
+    for institute, reporting_period, x, y in ordered.iterator():
+        if (institute, reporting_period) != group:
+            if group:
+                rows.append(_summary(group, values))
+            group = (institute, reporting_period)
+            values = {'x': [], 'y': []}
+        values['x'].append(x)
+        values['y'].append(y)
+    if group:
+        rows.append(_summary(group, values))
+    return rows
+
+
+def _summary(group, values):
+    count = len(values['x'])
+    row = {
+        'institute': group[0],
+        'reporting_period': group[1],
+        'count': count,
+    }
+    for axis in AXES:
+        ordered = sorted(values[axis])
+        row[axis] = {
+            'mean': sum(ordered) / count,
+            'quantiles': [_percentile(ordered, q) for q in QUANTILES],
+        }
+    row['quadrants'] = dict((name, 0) for name, _, _ in QUADRANTS)
+    for x, y in zip(values['x'], values['y']):
+        for name, high_x, high_y in QUADRANTS:
+            if (x >= QUADRANT_SPLIT) == high_x and (y >= QUADRANT_SPLIT) == high_y:
+                row['quadrants'][name] += 1
+    return row
+
+
+def _percentile(ordered, fraction):
+    # Linear interpolation between the closest ranks, as percentile_cont()
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
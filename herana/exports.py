@@ -0,0 +1,296 @@
+"""
+Downloadable exports of the project results.
+"""
+import csv
+import StringIO
+from collections import OrderedDict
+
+import xlsxwriter
+
+from django.utils.http import urlquote
+
+from comparison import QUANTILES
+from results import unit_rollup, status_duration_counts, period_averages
+
+
+def attachment_disposition(filename):
+    """
+    Return the Content-Disposition header of a download, with its file
+    name quoted as UTF-8 as institute names needn't be ASCII.
+    """
+    return str("attachment; filename*=UTF-8''%s" % urlquote(filename))
+
+
+def build_xlsx(institute, projects, scores=None):
+    """
+    Return a workbook of the results of an institute's projects, given as
+    ProjectDetail.as_dict(). With a queryset of the projects' stored scores
+    it's followed by summary sheets, computed in aggregate queries.
+
+    Written in xlsxwriter's constant memory mode, a row at a time.
+    """
+    output = StringIO.StringIO()
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+
+    ws = workbook.add_worksheet('Results')
+    columns = report_columns(institute)
+    for col, (key, parent_key, heading) in enumerate(columns):
+        ws.write(0, col, heading)
+    for row, proj in enumerate(projects, 1):
+        for col, (key, parent_key, heading) in enumerate(columns):
+            ws.write(row, col, project_value(proj, key, parent_key))
+
+    if scores is not None:
+        write_unit_sheet(workbook, institute, scores)
+        write_status_duration_sheet(workbook, scores)
+        write_period_sheet(workbook, scores)
+
+    workbook.close()
+    output.seek(0)
+    return output.read()
+
+
+def report_columns(institute):
+    """
+    Return the (key, parent_key, heading) of each column of the export,
+    flattening create_report_headings().
+    """
+    columns = []
+    for k, v in create_report_headings(institute).iteritems():
+        if not isinstance(v, OrderedDict):
+            columns.append((k, None, v))
+        else:
+            for child_k, child_v in v.iteritems():
+                columns.append((child_k, k, child_v))
+    return columns
+
+
+def project_value(proj, key, parent_key=None):
+    if parent_key:
+        return proj[parent_key][key]
+    if key == 'reporting_period':
+        return proj[key]['name']
+    elif key == 'duration':
+        return DURATION[proj[key]]
+    elif key == 'status':
+        return STATUS[proj[key]]
+    elif key == 'institute':
+        return proj['institute']['name']
+    return proj[key]
+
+
+# ------------------------------------------------------------------------------
+# CSV and Parquet
+# ------------------------------------------------------------------------------
+
+# Projects per Parquet row group, the most held in memory at once
+PARQUET_ROW_GROUP_SIZE = 10000
+
+
+class Echo(object):
+    """
+    A file-like object which returns what is written to it, to stream
+    the lines of a csv writer.
+    """
+    def write(self, value):
+        return value
+
+
+def csv_lines(institute, projects):
+    """
+    Yield the lines of a CSV export of the projects, given as
+    ProjectDetail.as_dict(), with the same columns as build_xlsx().
+    """
+    columns = report_columns(institute)
+    writer = csv.writer(Echo())
+    yield writer.writerow([_csv_value(heading) for key, parent_key, heading in columns])
+    for proj in projects:
+        yield writer.writerow([_csv_value(project_value(proj, key, parent_key))
+                               for key, parent_key, heading in columns])
+
+
+def _csv_value(value):
+    # The csv module writes bytes
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def write_parquet(institute, projects, output):
+    """
+    Write a Parquet export of the projects, given as ProjectDetail.as_dict(),
+    with the same columns as build_xlsx(), to a file, a row group at a time.
+    """
+    # Only imported for Parquet exports, it's slow to import
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = report_columns(institute)
+    schema = pa.schema([
+        pa.field(heading, pa.float64() if parent_key == 'score' else pa.string())
+        for key, parent_key, heading in columns])
+
+    def write_row_group(batch):
+        arrays = [
+            pa.array([project_value(proj, key, parent_key) for proj in batch], type=field.type)
+            for field, (key, parent_key, heading) in zip(schema, columns)]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+    writer = pq.ParquetWriter(output, schema)
+    batch = []
+    for proj in projects:
+        batch.append(proj)
+        if len(batch) == PARQUET_ROW_GROUP_SIZE:
+            write_row_group(batch)
+            batch = []
+    if batch:
+        write_row_group(batch)
+    writer.close()
+
+
+# ------------------------------------------------------------------------------
+# Summary sheets
+# ------------------------------------------------------------------------------
+
+def write_unit_sheet(workbook, institute, scores):
+    """
+    Project counts and average scores per unit at each of the
+    institute's org levels, including the projects of the units below.
+    """
+    ws = workbook.add_worksheet('By unit')
+    headings = SCORE_HEADINGS
+    ws.write_row(0, 0, ['Level', 'Unit', 'Projects'] + headings.values())
+    row = 1
+    for level, level_name in institute.get_org_levels():
+        for unit in unit_rollup(scores, level):
+            ws.write_row(row, 0, [level_name, unit['name'], unit['count']] +
+                         [unit['score'][key] for key in headings])
+            row += 1
+
+
+def write_status_duration_sheet(workbook, scores):
+    """
+    Project counts by duration and status.
+    """
+    ws = workbook.add_worksheet('Status and duration')
+    counts = status_duration_counts(scores)
+    statuses = sorted(STATUS)
+    ws.write_row(0, 0, ['Duration'] + [STATUS[s] for s in statuses] + ['Total'])
+    for row, duration in enumerate(sorted(DURATION), 1):
+        values = [counts.get((status, duration), 0) for status in statuses]
+        ws.write_row(row, 0, [DURATION[duration]] + values + [sum(values)])
+    totals = [sum(counts.get((status, d), 0) for d in DURATION) for status in statuses]
+    ws.write_row(len(DURATION) + 1, 0, ['Total'] + totals + [sum(totals)])
+
+
+def write_period_sheet(workbook, scores):
+    """
+    Project counts and average scores per reporting period,
+    and their change from the period before.
+    """
+    ws = workbook.add_worksheet('Period changes')
+    headings = SCORE_HEADINGS
+    ws.write_row(0, 0, ['Reporting period', 'Projects', 'Change'] +
+                 headings.values() + ['Change in %s' % h for h in headings.values()])
+    for row, period in enumerate(period_averages(scores), 1):
+        change = period['change']
+        ws.write_row(row, 0, [period['name'], period['count'], change['count'] if change else None] +
+                     [period['score'][key] for key in headings] +
+                     [change['score'][key] if change else None for key in headings])
+
+
+def build_comparison_xlsx(rows):
+    """
+    Return a workbook of the institute comparison, a row per
+    institute and reporting period, see comparison.compare_institutes().
+    """
+    output = StringIO.StringIO()
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+
+    ws = workbook.add_worksheet('Comparison')
+    headings = create_comparison_headings()
+    for col, heading in enumerate(headings.values()):
+        ws.write(0, col, heading)
+
+    for row, summary in enumerate(rows, 1):
+        for col, key in enumerate(headings):
+            ws.write(row, col, comparison_value(summary, key))
+
+    workbook.close()
+    output.seek(0)
+    return output.read()
+
+
+def comparison_value(summary, key):
+    if key in ('institute', 'reporting_period'):
+        return summary[key]['name']
+    if key == 'count':
+        return summary[key]
+    if key in QUADRANT_HEADINGS:
+        return summary['quadrants'][key]
+    # (axis, 'mean') or (axis, quantile index)
+    axis, stat = key
+    if stat == 'mean':
+        return summary[axis]['mean']
+    return summary[axis]['quantiles'][stat]
+
+
+def create_comparison_headings():
+    headings = [
+        ('institute', 'Institute'),
+        ('reporting_period', 'Reporting period'),
+        ('count', 'Projects'),
+    ]
+    for axis, name in (('x', 'Academic Core'), ('y', 'Articulation')):
+        headings.append(((axis, 'mean'), '%s mean' % name))
+        for i, quantile in enumerate(QUANTILES):
+            headings.append(((axis, i), '%s %d%%' % (name, quantile * 100)))
+    headings.extend(QUADRANT_HEADINGS.items())
+    return OrderedDict(headings)
+
+
+QUADRANT_HEADINGS = OrderedDict([
+    ('high_core_high_articulation', 'High core, high articulation'),
+    ('high_core_low_articulation', 'High core, low articulation'),
+    ('low_core_high_articulation', 'Low core, high articulation'),
+    ('low_core_low_articulation', 'Low core, low articulation'),
+])
+
+
+def create_report_headings(institute):
+    return OrderedDict([
+        ('institute', 'Institute'),
+        ('name', 'Project Name'),
+        ('org_level_1', '1 - %s' % (institute.org_level_1_name if institute.org_level_1_name else '')),
+        ('org_level_2', '2 - %s' % (institute.org_level_2_name if institute.org_level_2_name else '')),
+        ('org_level_3', '3 - %s' % (institute.org_level_3_name if institute.org_level_3_name else '')),
+        ('reporting_period', 'Period captured'),
+        ('duration', 'Duration'),
+        ('status', 'Status'),
+        ('score', SCORE_HEADINGS)
+    ])
+
+SCORE_HEADINGS = OrderedDict([
+    ('a_1', 'Alignment of objectives'),
+    ('a_2', 'Initiation/agenda-setting'),
+    ('a_3', 'External stakeholders'),
+    ('a_4', 'Funding'),
+    ('y', 'Articulation Total'),
+    ('c_1', 'Generates new knowledge or product'),
+    ('c_2', 'Dissemination'),
+    ('c_3_a', 'Teaching/curriculum development'),
+    ('c_3_b', 'Formal teaching/learning of students'),
+    ('c_4', 'Links to academic network'),
+    ('x', 'Academic Core Total')
+])
+
+DURATION = {
+    0: '0-1.99',
+    1: '2-2.99',
+    2: '3-3.99',
+    3: '4-4.99',
+    4: '5+'}
+
+STATUS = {
+    1: 'Complete',
+    2: 'Ongoing'}
@@ -1,6 +1,25 @@
 from django import forms
+from django.contrib.admin.helpers import ActionForm
+from django.core.files.storage import default_storage
 
-from models import ProjectDetail, Institute
+from models import (
+    ProjectDetail,
+    ProjectOutput,
+    Institute,
+    ReportingPeriod,
+    FocusArea,
+    ResearchTeamMember,
+    StudentParticipationNature,
+    PROJECT_STATUS
+)
+from choices import (
+    OTHER_FOCUS_AREA,
+    OTHER_ACADEMICS,
+    OTHER_STUDENT_NATURE,
+    questionnaire_option
+)
+from results import ORG_LEVELS
+from uploads import is_attachment_key
 
 class ProjectDetailForm(forms.ModelForm):
     class Meta:
@@ -38,10 +57,10 @@ class ProjectDetailForm(forms.ModelForm):
                     self.add_error('end_date', msg)
 
             if cleaned_data.get('focus_area'):
-                for choice in cleaned_data.get('focus_area'):
-                    if choice.code == 4 and self.cleaned_data.get('focus_area_text') == '':
-                        msg = "If other was chosen above, please describe."
-                        self.add_error('focus_area_text', msg)
+                other = questionnaire_option(FocusArea, OTHER_FOCUS_AREA)
+                if other in cleaned_data.get('focus_area') and self.cleaned_data.get('focus_area_text') == '':
+                    msg = "If other was chosen above, please describe."
+                    self.add_error('focus_area_text', msg)
 
             if not cleaned_data.get('strategic_objectives'):
                 msg = "Please select at least on strategic objective"
@@ -61,10 +80,10 @@ class ProjectDetailForm(forms.ModelForm):
                 self.add_error('adv_group_freq', msg)
 
             if cleaned_data.get('team_members'):
-                for choice in cleaned_data.get('team_members'):
-                    if choice.code == 7 and cleaned_data.get('team_members_text') == '':
-                        msg = "If other was selected above, please specify."
-                        self.add_error('team_members_text', msg)
+                other = questionnaire_option(ResearchTeamMember, OTHER_ACADEMICS)
+                if other in cleaned_data.get('team_members') and cleaned_data.get('team_members_text') == '':
+                    msg = "If other was selected above, please specify."
+                    self.add_error('team_members_text', msg)
 
             if cleaned_data.get('new_initiative') == 'Y' and cleaned_data.get('new_initiative_text') == '':
                 msg = "If yes was selected above, please describe."
@@ -95,10 +114,10 @@ class ProjectDetailForm(forms.ModelForm):
                 self.add_error('student_nature', msg)
 
             if cleaned_data.get('student_nature'):
-                for item in cleaned_data.get('student_nature'):
-                    if item.code == 6 and cleaned_data.get('student_nature_text') == '':
-                        msg = "Please describe the nature of student participation."
-                        self.add_error('student_nature_text', msg)
+                other = questionnaire_option(StudentParticipationNature, OTHER_STUDENT_NATURE)
+                if other in cleaned_data.get('student_nature') and cleaned_data.get('student_nature_text') == '':
+                    msg = "Please describe the nature of student participation."
+                    self.add_error('student_nature_text', msg)
 
 
 class ProjectDetailAdminForm(forms.ModelForm):
@@ -107,3 +126,133 @@ class ProjectDetailAdminForm(forms.ModelForm):
         exclude = ('proj_leader', 'created_at', 'record_status', 'reporting_period', 'is_deleted')
         admin_editable = ['is_rejected', 'rejected_detail', 'is_flagged']
 
+
+class ProjectOutputForm(forms.ModelForm):
+    """
+    Attachments are uploaded by the browser straight to the file storage,
+    and only their key is submitted, see herana.uploads. A file submitted
+    with the form is still accepted for browsers without FormData.
+    """
+    attachment_key = forms.CharField(required=False, widget=forms.HiddenInput)
+
+    class Meta:
+        model = ProjectOutput
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super(ProjectOutputForm, self).clean()
+        key = cleaned_data.get('attachment_key')
+        if key:
+            if not is_attachment_key(key) or not default_storage.exists(key):
+                self.add_error('attachment', "The uploaded file could not be found, please upload it again.")
+            else:
+                # Saved as the name of the already stored file
+                cleaned_data['attachment'] = key
+        return cleaned_data
+
+
+class ModerationActionForm(ActionForm):
+    """
+    The project changelist's action form, with the reason given
+    when rejecting the selected projects.
+    """
+    rejected_detail = forms.CharField(
+        required=False,
+        widget=forms.TextInput(attrs={'placeholder': 'Reason for rejecting'}))
+
+
+class IdListField(forms.Field):
+    """
+    A list of ids, given as several values with the same name.
+    """
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        field = forms.IntegerField(min_value=1)
+        return [field.clean(id) for id in value or []]
+
+
+class ReviewQueueForm(forms.Form):
+    """
+    The projects marked in the review queue, by moderation action.
+    """
+    reject = IdListField(required=False)
+    flag = IdListField(required=False)
+    unflag = IdListField(required=False)
+
+
+class ResultsFilterForm(forms.Form):
+    """
+    Filters for the results data endpoint, mirroring the controls
+    on the results page.
+    """
+    institute = forms.ModelChoiceField(queryset=Institute.objects.all())
+    reporting_period = forms.ModelChoiceField(queryset=ReportingPeriod.objects.all(), required=False)
+    org_level = forms.TypedChoiceField(choices=[(l, l) for l in ORG_LEVELS], coerce=int,
+                                       required=False, empty_value=1)
+    status = forms.TypedChoiceField(choices=PROJECT_STATUS, coerce=int,
+                                    required=False, empty_value=None)
+    duration = forms.TypedChoiceField(choices=[(d, d) for d in range(5)], coerce=int,
+                                      required=False, empty_value=None)
+
+    def clean(self):
+        cleaned_data = super(ResultsFilterForm, self).clean()
+        institute = cleaned_data.get('institute')
+        reporting_period = cleaned_data.get('reporting_period')
+        if institute and reporting_period and reporting_period.institute_id != institute.id:
+            self.add_error('reporting_period', "The reporting period does not belong to this institute.")
+        # Units switched off in the legend, may be repeated
+        cleaned_data['hidden_units'] = self.data.getlist('hide_unit')
+        return cleaned_data
+
+
+class ResultsChangesForm(forms.Form):
+    """
+    Parameters of the results change feed. since is the cursor returned
+    by the previous request, the first request is answered with one.
+    """
+    institute = forms.ModelChoiceField(queryset=Institute.objects.all())
+    org_level = forms.TypedChoiceField(choices=[(l, l) for l in ORG_LEVELS], coerce=int,
+                                       required=False, empty_value=1)
+    since = forms.FloatField(required=False, min_value=0)
+
+
+class ProjectSearchForm(forms.Form):
+    """
+    Parameters of the project search endpoint, see ProjectDetailAdmin.search_view().
+    """
+    q = forms.CharField(max_length=256)
+    limit = forms.IntegerField(required=False, min_value=1, max_value=100)
+
+    def clean_limit(self):
+        return self.cleaned_data['limit'] or 20
+
+
+class ResultsExportForm(forms.Form):
+    """
+    Parameters of the results export endpoint.
+    """
+    institute = forms.ModelChoiceField(queryset=Institute.objects.all())
+    format = forms.ChoiceField(choices=[('csv', 'CSV'), ('parquet', 'Parquet')], required=False)
+
+    def clean_format(self):
+        return self.cleaned_data['format'] or 'csv'
+
+
+class AnswersExportForm(forms.Form):
+    """
+    Parameters of the questionnaire answers export endpoint.
+    """
+    format = forms.ChoiceField(choices=[('csv', 'CSV'), ('jsonl', 'JSON Lines')], required=False)
+
+    def clean_format(self):
+        return self.cleaned_data['format'] or 'csv'
+
+
+class ResultsComparisonForm(forms.Form):
+    """
+    Parameters of the institute comparison endpoint. All institutes
+    are compared unless some are given, the institute may be repeated.
+    """
+    institute = forms.ModelMultipleChoiceField(queryset=Institute.objects.all(), required=False)
+    format = forms.ChoiceField(choices=[('json', 'JSON'), ('xlsx', 'XLSX')], required=False)
@@ -0,0 +1,136 @@
+"""
+Resized versions of the institute logos.
+
+Logos are uploaded at whatever resolution the institute has them, but
+are only shown in the 90px high admin header. When a logo is uploaded
+it's resized to each of LOGO_HEIGHTS, in its own format and as WebP, and
+stored next to the original under names derived from the original's, so
+that templates can link to a size without a query or a lookup in the
+bucket, see the institute_logo template tag.
+
+Institute.logo_resized records which logo the derivatives were written
+for. Until they are, e.g. if resizing failed, the original is shown.
+Logos uploaded before this are resized by the build_logo_derivatives
+management command, which runs in the release phase of each deploy,
+see bin/release.
+"""
+import logging
+import os
+import StringIO
+
+from PIL import Image
+
+from django.core.files.base import ContentFile
+from django.db.models.signals import pre_save, post_save
+from django.dispatch import receiver
+
+from models import Institute
+
+
+log = logging.getLogger(__name__)
+
+# The admin header, at 1x and 2x
+LOGO_HEIGHTS = (90, 180)
+
+Image.init()
+# Pillow is only able to write WebP if it was built with libwebp
+WEBP_LOGOS = 'WEBP' in Image.SAVE
+
+# Pillow format and content type by extension
+LOGO_FORMATS = {
+    'png': ('PNG', 'image/png'),
+    'jpg': ('JPEG', 'image/jpeg'),
+    'webp': ('WEBP', 'image/webp'),
+}
+
+
+def logo_extension(name):
+    """
+    Return the extension of the derivatives of a logo in its own format:
+    photos stay JPEG and everything else, e.g. GIFs, becomes PNG.
+    """
+    if os.path.splitext(name)[1].lower() in ('.jpg', '.jpeg'):
+        return 'jpg'
+    return 'png'
+
+
+def derivative_name(name, height, extension):
+    return '%s.h%d.%s' % (os.path.splitext(name)[0], height, extension)
+
+
+def derivative_names(name):
+    """
+    Return the (name, height, extension) of each derivative of a logo.
+    """
+    extensions = [logo_extension(name)]
+    if WEBP_LOGOS:
+        extensions.append('webp')
+    return [(derivative_name(name, height, extension), height, extension)
+            for height in LOGO_HEIGHTS
+            for extension in extensions]
+
+
+def has_derivatives(institute):
+    return bool(institute.logo) and institute.logo_resized == institute.logo.name
+
+
+def logo_url(institute, height, extension=None):
+    name = institute.logo.name
+    return institute.logo.storage.url(
+        derivative_name(name, height, extension or logo_extension(name)))
+
+
+def write_derivatives(institute):
+    """
+    Resize an institute's logo and store the derivatives,
+    replacing any written before.
+    """
+    storage = institute.logo.storage
+    institute.logo.open('rb')
+    try:
+        original = Image.open(StringIO.StringIO(institute.logo.read()))
+        original.load()
+    finally:
+        institute.logo.close()
+
+    for name, height, extension in derivative_names(institute.logo.name):
+        image_format, content_type = LOGO_FORMATS[extension]
+        image = original.copy()
+        if image_format == 'JPEG':
+            image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        # Never enlarged, smaller logos are stored at their own size
+        image.thumbnail((image.size[0], height), Image.ANTIALIAS)
+
+        output = StringIO.StringIO()
+        options = {'quality': 85} if image_format in ('JPEG', 'WEBP') else {'optimize': True}
+        image.save(output, image_format, **options)
+        content = ContentFile(output.getvalue())
+        content.content_type = content_type
+
+        # Otherwise the storage would pick another name
+        if storage.exists(name):
+            storage.delete(name)
+        storage.save(name, content)
+
+    institute.logo_resized = institute.logo.name
+    Institute.objects.filter(pk=institute.pk).update(logo_resized=institute.logo_resized)
+
+
+@receiver(pre_save, sender=Institute)
+def mark_logo_upload(sender, instance, **kwargs):
+    # The uploaded file is only saved to the storage, and named, after this
+    instance._logo_uploaded = bool(instance.logo) and not instance.logo._committed
+
+
+@receiver(post_save, sender=Institute)
+def create_logo_derivatives(sender, instance, **kwargs):
+    if getattr(instance, '_logo_uploaded', False):
+        instance._logo_uploaded = False
+        try:
+            write_derivatives(instance)
+        except Exception:
+            # The original is shown instead, and the derivatives can be
+            # written again with build_logo_derivatives
+            log.exception("Resizing the logo of institute %s failed", instance.pk)
@@ -0,0 +1,82 @@
+import gzip
+import json
+import os
+import random
+import StringIO
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from herana.models import Institute, ProjectDetail
+from herana.results import (
+    SCORE_KEYS, filter_projects, unit_legend, encode_columnar)
+
+
+class Command(BaseCommand):
+    help = ("Compare the size of the JSON and columnar results payloads, and the time "
+            "the results page takes to decode them in node.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--institute', type=int,
+                            help="Benchmark the final projects of this institute.")
+        parser.add_argument('--synthetic', type=int, default=5000,
+                            help="Number of generated points if no institute is given.")
+        parser.add_argument('--units', type=int, default=40,
+                            help="Number of generated units if no institute is given.")
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        if options['institute']:
+            try:
+                institute = Institute.objects.get(id=options['institute'])
+            except Institute.DoesNotExist:
+                raise CommandError("Institute %s does not exist" % options['institute'])
+            projects = ProjectDetail.objects.filter(
+                institute=institute, record_status=2, is_rejected=False, is_deleted=False)
+            units = unit_legend(projects, 1)
+            points = filter_projects(projects)
+        else:
+            units, points = self.generate(options['synthetic'], options['units'])
+
+        as_json = json.dumps({'units': units, 'projects': points})
+        as_columnar = encode_columnar(units, points)
+
+        self.stdout.write("%d points, %d units" % (len(points), len(units)))
+        self.stdout.write("%-10s %12s %12s" % ('format', 'bytes', 'gzip bytes'))
+        for name, payload in [('json', as_json), ('columnar', as_columnar)]:
+            self.stdout.write("%-10s %12d %12d" % (name, len(payload), len(self.gzip(payload))))
+
+        script = os.path.abspath(os.path.join(settings.BASE_DIR, 'benchmarks', 'results_payload.js'))
+        with tempfile.NamedTemporaryFile(suffix='.json') as json_file, \
+                tempfile.NamedTemporaryFile(suffix='.bin') as columnar_file:
+            json_file.write(as_json)
+            json_file.flush()
+            columnar_file.write(as_columnar)
+            columnar_file.flush()
+            try:
+                output = subprocess.check_output(
+                    ['node', script, json_file.name, columnar_file.name, str(options['repeat'])])
+            except OSError:
+                raise CommandError("node is needed to run the benchmark")
+        self.stdout.write(output)
+
+    def generate(self, count, unit_count):
+        units = ['Department of Unit %d' % i for i in range(unit_count)]
+        points = []
+        for i in range(count):
+            points.append({
+                'id': i + 1,
+                'unit': random.choice(units),
+                'status': random.choice([1, 2]),
+                'duration': random.randint(0, 4),
+                'score': dict((key, random.randint(0, 72) * 0.125) for key in SCORE_KEYS),
+            })
+        return units, points
+
+    def gzip(self, data):
+        output = StringIO.StringIO()
+        with gzip.GzipFile(fileobj=output, mode='wb') as f:
+            f.write(data)
+        return output.getvalue()
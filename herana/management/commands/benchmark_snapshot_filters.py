@@ -0,0 +1,58 @@
+import json
+import os
+import random
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from herana.results import ORG_LEVELS, SCORE_KEYS
+from herana.snapshots import snapshot_data
+
+
+class Command(BaseCommand):
+    help = ("Time the results page's filtering of a generated snapshot in node, "
+            "by its index and by scanning the projects.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--projects', type=int, default=50000)
+        parser.add_argument('--units', type=int, default=40,
+                            help="Number of units at the first org level.")
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        data = snapshot_data(*self.generate(options['projects'], options['units']))
+        script = os.path.abspath(os.path.join(settings.BASE_DIR, 'benchmarks', 'snapshot_filters.js'))
+
+        with tempfile.NamedTemporaryFile(suffix='.json') as f:
+            json.dump(data, f, separators=(',', ':'))
+            f.flush()
+            self.stdout.write("%d projects, %d bytes" % (len(data['projects']), f.tell()))
+            try:
+                output = subprocess.check_output(
+                    ['node', script, f.name, str(options['repeat'])])
+            except OSError:
+                raise CommandError("node is needed to run the benchmark")
+        self.stdout.write(output)
+
+    def generate(self, count, unit_count):
+        # Each unit has a few children at the next level
+        units = {}
+        for level in ORG_LEVELS:
+            units[level] = ['Level %d unit %d' % (level, i) for i in range(unit_count * 3 ** (level - 1))]
+
+        points = []
+        for i in range(count):
+            point = {
+                'id': i + 1,
+                'status': random.choice([1, 2]),
+                'duration': random.randint(0, 4),
+                'score': dict((key, random.randint(0, 72) * 0.125) for key in SCORE_KEYS),
+            }
+            unit = random.randrange(len(units[1]))
+            for level in ORG_LEVELS:
+                point['org_level_%d' % level] = units[level][unit]
+                unit = unit * 3 + random.randrange(3)
+            points.append(point)
+        return units, points
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from herana.logos import write_derivatives
+from herana.models import Institute
+
+
+class Command(BaseCommand):
+    help = "Write the resized versions of the institute logos, e.g. of logos uploaded before they were resized."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--institute', type=int,
+                            help="Only resize the logo of this institute.")
+        parser.add_argument('--missing', action='store_true',
+                            help="Only resize logos which haven't been resized yet.")
+
+    def handle(self, *args, **options):
+        institutes = Institute.objects.exclude(logo='').exclude(logo__isnull=True)
+        if options['institute']:
+            institutes = institutes.filter(id=options['institute'])
+        if options['missing']:
+            institutes = institutes.exclude(logo_resized=F('logo'))
+
+        for institute in institutes:
+            write_derivatives(institute)
+            self.stdout.write("%s: %s" % (institute.name, institute.logo.name))
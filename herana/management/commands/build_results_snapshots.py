@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from herana.models import Institute, ReportingPeriod
+from herana.snapshots import write_snapshot, write_export_snapshot, has_snapshot, has_export_snapshot
+
+
+class Command(BaseCommand):
+    help = "Write the results snapshots of all closed reporting periods and the institute exports."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--institute', type=int,
+                            help="Only write snapshots for this institute.")
+        parser.add_argument('--missing', action='store_true',
+                            help="Only write the snapshots which haven't been written in the current format.")
+
+    def handle(self, *args, **options):
+        periods = ReportingPeriod.objects.filter(is_active=False)
+        institutes = Institute.objects.all()
+        if options['institute']:
+            periods = periods.filter(institute=options['institute'])
+            institutes = institutes.filter(id=options['institute'])
+        if options['missing']:
+            periods = [period for period in periods if not has_snapshot(period)]
+            institutes = [institute for institute in institutes if not has_export_snapshot(institute)]
+
+        for period in periods:
+            name = write_snapshot(period)
+            self.stdout.write("%s - %s: %s" % (period.institute_id, period.name, name))
+
+        for institute in institutes:
+            self.stdout.write("%s: %s" % (institute.name, write_export_snapshot(institute)))
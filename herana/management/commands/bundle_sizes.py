@@ -0,0 +1,44 @@
+import gzip
+import os
+import StringIO
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management.base import BaseCommand
+from django.utils.encoding import smart_str
+
+from pipeline.packager import Packager
+from pipeline.compressors import Compressor
+
+
+class Command(BaseCommand):
+    help = "Report the size of each pipeline bundle and of its sources, after collectstatic."
+
+    def handle(self, *args, **options):
+        packager = Packager()
+        compressor = Compressor()
+        for kind in ('css', 'js'):
+            minify = getattr(compressor, '%s_compressor' % kind)(verbose=False)
+            for name, package in sorted(packager.packages[kind].items()):
+                output = package.output_filename
+                self.stdout.write("%s (%s)" % (output, kind))
+                self.write_row('raw', 'minified', 'gzip', 'source')
+
+                for path in packager.compile(package.paths):
+                    raw = smart_str(compressor.read_text(path))
+                    minified = smart_str(getattr(minify, 'compress_%s' % kind)(raw))
+                    self.write_row(len(raw), len(minified), len(_gzip(minified)), path)
+
+                path = staticfiles_storage.path(output)
+                self.write_row('', os.path.getsize(path), os.path.getsize(path + '.gz'), 'total')
+                self.write_row('', '', os.path.getsize(path + '.br'), 'total, brotli')
+                self.stdout.write('')
+
+    def write_row(self, raw, minified, compressed, label):
+        self.stdout.write("%10s %10s %10s  %s" % (raw, minified, compressed, label))
+
+
+def _gzip(content):
+    output = StringIO.StringIO()
+    with gzip.GzipFile(fileobj=output, mode='wb', compresslevel=9, mtime=0) as f:
+        f.write(content)
+    return output.getvalue()
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('herana', '0005_auto_20160126_1335'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='projectdetail',
+            name='strategic_objectives',
+            field=models.ManyToManyField(to='herana.StrategicObjective', verbose_name='3.1: What are the 4 main strategic objectives of the project?'),
+        ),
+        migrations.AlterIndexTogether(
+            name='projectdetail',
+            index_together=set([('institute', 'reporting_period', 'record_status')]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('herana', '0006_projectdetail_results_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportingperiod',
+            name='results_snapshot',
+            field=models.CharField(max_length=255, null=True, editable=False, blank=True),
+        ),
+    ]
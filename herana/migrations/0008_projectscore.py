@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('herana', '0007_reportingperiod_results_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectScore',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('status', models.PositiveIntegerField(null=True, choices=[(1, 'Complete'), (2, 'Ongoing')])),
+                ('duration', models.PositiveSmallIntegerField()),
+                ('x', models.FloatField()),
+                ('y', models.FloatField()),
+                ('a_1', models.FloatField()),
+                ('a_2', models.FloatField()),
+                ('a_3', models.FloatField()),
+                ('a_4', models.FloatField()),
+                ('c_1', models.FloatField()),
+                ('c_2', models.FloatField()),
+                ('c_3_a', models.FloatField()),
+                ('c_3_b', models.FloatField()),
+                ('c_4', models.FloatField()),
+                ('frozen_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='institute',
+            name='results_export',
+            field=models.CharField(max_length=255, null=True, editable=False, blank=True),
+        ),
+        migrations.AddField(
+            model_name='projectscore',
+            name='institute',
+            field=models.ForeignKey(to='herana.Institute'),
+        ),
+        migrations.AddField(
+            model_name='projectscore',
+            name='org_level_1',
+            field=models.ForeignKey(to='herana.OrgLevel1', null=True),
+        ),
+        migrations.AddField(
+            model_name='projectscore',
+            name='org_level_2',
+            field=models.ForeignKey(to='herana.OrgLevel2', null=True),
+        ),
+        migrations.AddField(
+            model_name='projectscore',
+            name='org_level_3',
+            field=models.ForeignKey(to='herana.OrgLevel3', null=True),
+        ),
+        migrations.AddField(
+            model_name='projectscore',
+            name='project',
+            field=models.OneToOneField(related_name='frozen_score', to='herana.ProjectDetail'),
+        ),
+        migrations.AddField(
+            model_name='projectscore',
+            name='reporting_period',
+            field=models.ForeignKey(related_name='scores', to='herana.ReportingPeriod'),
+        ),
+    ]
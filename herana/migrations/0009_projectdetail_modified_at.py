@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('herana', '0008_projectscore'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectdetail',
+            name='modified_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, auto_now=True),
+            preserve_default=False,
+        ),
+        migrations.AlterIndexTogether(
+            name='projectdetail',
+            index_together=set([('institute', 'modified_at'), ('institute', 'reporting_period', 'record_status')]),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+# The search_vector column isn't a model field, see herana/search.py.
+# Only PostgreSQL has it, the other databases search with icontains.
+
+SEARCH_FIELDS = (
+    ('A', ('name',)),
+    ('B', ('description', 'outcomes', 'beneficiaries')),
+    ('C', ('research_text', 'curriculum_changes_text', 'team_members_text',
+           'new_initiative_text', 'new_initiative_party_text',
+           'focus_area_text', 'student_nature_text')),
+)
+
+VECTOR = " ||\n        ".join(
+    "setweight(to_tsvector('pg_catalog.english', concat_ws(' ', %s)), '%s')"
+    % (', '.join('NEW.%s' % field for field in fields), weight)
+    for weight, fields in SEARCH_FIELDS)
+
+COLUMNS = ', '.join(field for weight, fields in SEARCH_FIELDS for field in fields)
+
+CREATE_SQL = [
+    "ALTER TABLE herana_projectdetail ADD COLUMN search_vector tsvector",
+    """
+    CREATE FUNCTION herana_projectdetail_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+        %s;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """ % VECTOR,
+    """
+    CREATE TRIGGER herana_projectdetail_search_vector
+    BEFORE INSERT OR UPDATE OF %s ON herana_projectdetail
+    FOR EACH ROW EXECUTE PROCEDURE herana_projectdetail_search_vector()
+    """ % COLUMNS,
+    # Fires the trigger for the existing projects
+    "UPDATE herana_projectdetail SET name = name",
+    "CREATE INDEX herana_projectdetail_search_vector ON herana_projectdetail USING gin(search_vector)",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER herana_projectdetail_search_vector ON herana_projectdetail",
+    "DROP FUNCTION herana_projectdetail_search_vector()",
+    "ALTER TABLE herana_projectdetail DROP COLUMN search_vector",
+]
+
+
+def execute(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            for sql in statements:
+                schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('herana', '0009_projectdetail_modified_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(execute(CREATE_SQL), execute(DROP_SQL)),
+    ]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+# Trigram indexes for the org level autocomplete, see herana/autocomplete.py.
+# They're on UPPER(name::text), which is what icontains and istartswith
+# compare on PostgreSQL. Other databases don't have them.
+
+CREATE_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX herana_orglevel_name_trgm ON herana_orglevel "
+    "USING gin (UPPER(name::text) gin_trgm_ops)",
+    "CREATE INDEX herana_institute_name_trgm ON herana_institute "
+    "USING gin (UPPER(name::text) gin_trgm_ops)",
+]
+
+DROP_SQL = [
+    "DROP INDEX herana_orglevel_name_trgm",
+    "DROP INDEX herana_institute_name_trgm",
+]
+
+
+def execute(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            for sql in statements:
+                schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('herana', '0010_projectdetail_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(execute(CREATE_SQL), execute(DROP_SQL)),
+    ]
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import defaultdict
+
+from django.db import models, migrations
+
+
+def set_paths(apps, schema_editor):
+    OrgLevel = apps.get_model('herana', 'OrgLevel')
+    OrgLevel1 = apps.get_model('herana', 'OrgLevel1')
+    OrgLevel2 = apps.get_model('herana', 'OrgLevel2')
+    OrgLevel3 = apps.get_model('herana', 'OrgLevel3')
+
+    OrgLevel.objects.filter(pk__in=OrgLevel1.objects.values('pk')).update(level=1)
+
+    # One update per parent rather than per unit
+    units = defaultdict(list)
+    for pk, level_1 in OrgLevel2.objects.values_list('pk', 'parent'):
+        units[(level_1, None)].append(pk)
+    OrgLevel.objects.filter(pk__in=OrgLevel2.objects.values('pk')).update(level=2)
+
+    for pk, level_1, level_2 in OrgLevel3.objects.values_list('pk', 'parent__parent', 'parent'):
+        units[(level_1, level_2)].append(pk)
+    OrgLevel.objects.filter(pk__in=OrgLevel3.objects.values('pk')).update(level=3)
+
+    for (level_1, level_2), pks in units.items():
+        OrgLevel.objects.filter(pk__in=pks).update(level_1=level_1, level_2=level_2)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('herana', '0011_orglevel_name_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orglevel',
+            name='level',
+            field=models.PositiveSmallIntegerField(null=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='orglevel',
+            name='level_1',
+            field=models.ForeignKey(related_name='+', editable=False, to='herana.OrgLevel1', null=True),
+        ),
+        migrations.AddField(
+            model_name='orglevel',
+            name='level_2',
+            field=models.ForeignKey(related_name='+', editable=False, to='herana.OrgLevel2', null=True),
+        ),
+        migrations.RunPython(set_paths, migrations.RunPython.noop),
+    ]
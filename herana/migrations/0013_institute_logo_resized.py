@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('herana', '0012_orglevel_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='institute',
+            name='logo_resized',
+            field=models.CharField(max_length=255, null=True, editable=False, blank=True),
+        ),
+    ]
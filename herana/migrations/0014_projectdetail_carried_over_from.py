@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('herana', '0013_institute_logo_resized'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectdetail',
+            name='carried_over_from',
+            field=models.ForeignKey(related_name='carried_over_to', on_delete=django.db.models.deletion.SET_NULL, blank=True, editable=False, to='herana.ProjectDetail', null=True),
+        ),
+    ]
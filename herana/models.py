@@ -11,6 +11,7 @@ from django.core.exceptions import ObjectDoesNotExist
 from django.conf import settings
 
 from django.utils import timezone
+from django.utils.functional import cached_property
 
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 
@@ -40,9 +41,13 @@ def attachment_filename(instance, filename):
 class Institute(models.Model):
     name = models.CharField(max_length=256)
     logo = models.ImageField(upload_to=image_filename, blank=True, null=True)
+    # Name of the logo its resized versions were written for, see logos.write_derivatives()
+    logo_resized = models.CharField(max_length=255, null=True, blank=True, editable=False)
     org_level_1_name = models.CharField(max_length=128)
     org_level_2_name = models.CharField(max_length=128, null=True, blank=True)
     org_level_3_name = models.CharField(max_length=128, null=True, blank=True)
+    # Name of the public results export, see snapshots.write_export_snapshot()
+    results_export = models.CharField(max_length=255, null=True, blank=True, editable=False)
 
     def as_dict(self, user=None, add_reporting_periods=False):
         inst_dict = {
@@ -54,7 +59,7 @@ class Institute(models.Model):
         }
 
         if add_reporting_periods:
-            if user:
+            if user and user.is_authenticated():
                 if user.is_superuser:
                     # Return active and closed periods for all institutes
                     reporting_periods = self.reporting_period.all().order_by('start_date')
@@ -98,9 +103,11 @@ class Institute(models.Model):
     def get_active_reporting_period(self):
         return self.reporting_period.filter(is_active=True).first()
 
-    @property
+    @cached_property
     def has_active_reporting_period(self):
-        return True if self.reporting_period.filter(is_active=True) else False
+        # Checked several times per admin page, on the institute
+        # of request.user which only lives for the request
+        return self.reporting_period.filter(is_active=True).exists()
 
 
 class StrategicObjective(models.Model):
@@ -119,6 +126,12 @@ class StrategicObjective(models.Model):
 class OrgLevel(models.Model):
     name = models.CharField(max_length=256)
     institute = models.ForeignKey('Institute')
+    # The unit's materialized path: its level and its ancestors at the
+    # levels above, set on save. Used to roll results up to a higher
+    # level in one query, see results.unit_rollup().
+    level = models.PositiveSmallIntegerField(null=True, editable=False)
+    level_1 = models.ForeignKey('OrgLevel1', null=True, editable=False, related_name='+')
+    level_2 = models.ForeignKey('OrgLevel2', null=True, editable=False, related_name='+')
 
     class Meta:
         verbose_name = _('Org Level')
@@ -142,6 +155,10 @@ class OrgLevel1(OrgLevel):
     def __unicode__(self):
         return '%s - %s' % (self.institute.name, self.name)
 
+    def save(self, *args, **kwargs):
+        self.level = 1
+        super(OrgLevel1, self).save(*args, **kwargs)
+
     class Meta:
         verbose_name = _('Org Level 1')
         verbose_name_plural = _('Org Level 1')
@@ -153,6 +170,16 @@ class OrgLevel2(OrgLevel):
     def __unicode__(self):
         return '%s - %s - %s' % (self.institute.name, self.parent.name, self.name)
 
+    def save(self, *args, **kwargs):
+        self.level = 2
+        self.level_1_id = self.parent_id
+        super(OrgLevel2, self).save(*args, **kwargs)
+        # Moves the units below along with this one
+        OrgLevel.objects\
+            .filter(level_2=self)\
+            .exclude(level_1=self.parent_id)\
+            .update(level_1=self.parent_id)
+
     class Meta:
         verbose_name = _('Org Level 2')
         verbose_name_plural = _('Org Level 2')
@@ -164,6 +191,12 @@ class OrgLevel3(OrgLevel):
     def __unicode__(self):
         return '%s - %s - %s' % (self.institute.name, self.parent.name, self.name)
 
+    def save(self, *args, **kwargs):
+        self.level = 3
+        self.level_1_id = self.parent.parent_id
+        self.level_2_id = self.parent_id
+        super(OrgLevel3, self).save(*args, **kwargs)
+
     class Meta:
         verbose_name = _('Org Level 3')
         verbose_name_plural = _('Org Level 3')
@@ -176,6 +209,8 @@ class ReportingPeriod(models.Model):
     open_date = models.DateField(auto_now_add=True)
     close_date = models.DateField(null=True, blank=True)
     is_active = models.BooleanField(default=True, verbose_name=_('Open'))
+    # Name of the results snapshot written when the period is closed
+    results_snapshot = models.CharField(max_length=255, null=True, blank=True, editable=False)
 
     def __unicode__(self):
         return self.name
@@ -445,6 +480,12 @@ class ProjectDetail(models.Model):
     is_flagged = models.BooleanField(default=False, verbose_name=CAPTURE_LABELS['is_flagged'])
     is_deleted = models.BooleanField(default=False)
     created_at = models.DateField(auto_now_add=True)
+    # Read by the results change feed, see results.project_changes()
+    modified_at = models.DateTimeField(auto_now=True)
+    # The project this is a copy of, see periods.carry_over_projects()
+    carried_over_from = models.ForeignKey('self', null=True, blank=True, editable=False,
+                                          related_name='carried_over_to',
+                                          on_delete=models.SET_NULL)
 
     def __unicode__(self):
         return '%s' % (self.name)
@@ -470,6 +511,11 @@ class ProjectDetail(models.Model):
             ('view_projectdetail', 'Can only view project details'),
             ('reject_projectdetail', 'Can reject the project which has been submitted')
         )
+        # Used by the results queries, which always filter on these
+        index_together = [
+            ['institute', 'reporting_period', 'record_status'],
+            ['institute', 'modified_at'],
+        ]
 
 
     def calc_score(self):
@@ -543,8 +589,11 @@ class ProjectDetail(models.Model):
 
         a_3 = y - a_2 - a_1
 
+        # Related rows are read through the reverse managers so that
+        # querysets with prefetch_related() (see results.SCORE_PREFETCH)
+        # don't issue a query per project.
         i_score = 0.0
-        funding = ProjectFunding.objects.filter(project=self.id)
+        funding = self.projectfunding_set.all()
         for f in funding:
             i_score += 0.25
             if i_score == 1.0:
@@ -575,13 +624,13 @@ class ProjectDetail(models.Model):
             x += 0.25
 
         if self.phd_research == 'Y':
-            if PHDStudent.objects.filter(project=self.id):
+            if self.phdstudent_set.all():
                 x += 0.5
 
         c_1 = x
 
         i_score = 0.0
-        for output in ProjectOutput.objects.filter(project=self.id):
+        for output in self.projectoutput_set.all():
             if output.url or output.doi or output.attachment:
                 i_score += 0.25
                 if i_score == 2.0:
@@ -590,7 +639,7 @@ class ProjectDetail(models.Model):
 
         c_2 = x - c_1
 
-        if self.new_courses == 'Y' and NewCourseDetail.objects.filter(project=self.id):
+        if self.new_courses == 'Y' and self.newcoursedetail_set.all():
             x += 2.0
 
         elif self.curriculum_changes == 'Y' and self.curriculum_changes_text:
@@ -609,13 +658,13 @@ class ProjectDetail(models.Model):
         x += i_score
 
         if self.course_requirement == 'Y':
-            if CourseReqDetail.objects.filter(project=self.id):
+            if self.coursereqdetail_set.all():
                 x += 1
 
         c_3_b = x - c_1 - c_2 - c_3_a
 
         if self.external_collaboration == 'Y':
-            if Collaborators.objects.filter(project=self.id):
+            if self.collaborators_set.all():
                 x += 1.0
 
         c_4 = x - c_1 - c_2 - c_3_a -c_3_b
@@ -649,6 +698,77 @@ class ProjectDetail(models.Model):
         else:
             return 4
 
+
+class ProjectScore(models.Model):
+    """
+    The score of a project in a closed reporting period, computed once
+    when the period was closed. Results for closed periods are read from
+    here, so later changes to the project don't change them.
+    """
+    SCORE_FIELDS = ('x', 'y', 'a_1', 'a_2', 'a_3', 'a_4', 'c_1', 'c_2', 'c_3_a', 'c_3_b', 'c_4')
+
+    project = models.OneToOneField('ProjectDetail', related_name='frozen_score')
+    reporting_period = models.ForeignKey('ReportingPeriod', related_name='scores')
+    institute = models.ForeignKey('Institute')
+    org_level_1 = models.ForeignKey('OrgLevel1', null=True)
+    org_level_2 = models.ForeignKey('OrgLevel2', null=True)
+    org_level_3 = models.ForeignKey('OrgLevel3', null=True)
+    status = models.PositiveIntegerField(choices=PROJECT_STATUS, null=True)
+    duration = models.PositiveSmallIntegerField()
+    x = models.FloatField()
+    y = models.FloatField()
+    a_1 = models.FloatField()
+    a_2 = models.FloatField()
+    a_3 = models.FloatField()
+    a_4 = models.FloatField()
+    c_1 = models.FloatField()
+    c_2 = models.FloatField()
+    c_3_a = models.FloatField()
+    c_3_b = models.FloatField()
+    c_4 = models.FloatField()
+    frozen_at = models.DateTimeField(auto_now_add=True)
+
+    def __unicode__(self):
+        return u'%s' % self.project_id
+
+    @classmethod
+    def from_project(cls, project):
+        """
+        Return an unsaved score for the project as it is now.
+        """
+        score = cls(
+            project=project,
+            reporting_period_id=project.reporting_period_id,
+            institute_id=project.institute_id,
+            org_level_1_id=project.org_level_1_id,
+            org_level_2_id=project.org_level_2_id,
+            org_level_3_id=project.org_level_3_id,
+            status=project.project_status,
+            duration=project.calc_duration())
+        for key, value in project.calc_score().items():
+            setattr(score, key, value)
+        return score
+
+    def calc_score(self):
+        return dict((key, getattr(self, key)) for key in self.SCORE_FIELDS)
+
+    def as_dict(self):
+        """
+        Same as ProjectDetail.as_dict(), from the frozen values.
+        """
+        return {
+            'id': self.project_id,
+            'name': self.project.name,
+            'institute': self.institute.as_dict(),
+            'score': self.calc_score(),
+            'duration': self.duration,
+            'status': self.status,
+            'org_level_1': self.org_level_1.name if self.org_level_1 else None,
+            'org_level_2': self.org_level_2.name if self.org_level_2 else None,
+            'org_level_3': self.org_level_3.name if self.org_level_3 else None,
+            'reporting_period': self.reporting_period.as_dict()
+        }
+
 # ------------------------------------------------------------------------------
 # Custom User
 # ------------------------------------------------------------------------------
@@ -696,25 +816,21 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
 
+    @cached_property
+    def group_names(self):
+        """
+        Names of the user's groups, read once as the role checks below
+        are made many times for request.user on every admin page.
+        """
+        return set(self.groups.values_list('name', flat=True))
+
     @property
     def is_institute_admin(self):
-        try:
-            g = Group.objects.get(name='InstituteAdmins')
-        except ObjectDoesNotExist:
-            return False
-        if g in self.groups.all():
-            return True
-        return False
+        return 'InstituteAdmins' in self.group_names
 
     @property
     def is_proj_leader(self):
-        try:
-            g = Group.objects.get(name='ProjectLeaders')
-        except ObjectDoesNotExist:
-            return False
-        if g in self.groups.all():
-            return True
-        return False
+        return 'ProjectLeaders' in self.group_names
 
     def get_full_name(self):
         """
@@ -758,6 +874,16 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
 # Model signals
 # ------------------------------------------------------------------------------
 
+def add_user_to_group(user, group):
+    user.groups.add(group)
+    user.__dict__.pop('group_names', None)
+
+
+def remove_user_from_group(user, group):
+    user.groups.remove(group)
+    user.__dict__.pop('group_names', None)
+
+
 @receiver(post_save, sender=InstituteAdmin)
 def assign_institute_admin_to_group(sender, **kwargs):
     if kwargs['created']:
@@ -787,13 +913,13 @@ def assign_institute_admin_to_group(sender, **kwargs):
             for perm in perms:
                 g.permissions.add(perm)
             g.save()
-        kwargs['instance'].user.groups.add(g)
+        add_user_to_group(kwargs['instance'].user, g)
 
 
 @receiver(post_delete, sender=InstituteAdmin)
 def remove_institute_admin_from_group(sender, **kwargs):
     g = Group.objects.get(name='InstituteAdmins')
-    kwargs['instance'].user.groups.remove(g)
+    remove_user_from_group(kwargs['instance'].user, g)
 
 
 @receiver(post_save, sender=ProjectLeader)
@@ -822,13 +948,13 @@ def assign_project_leader_to_group(sender, **kwargs):
             for perm in perms:
                 g.permissions.add(perm)
             g.save()
-        kwargs['instance'].user.groups.add(g)
+        add_user_to_group(kwargs['instance'].user, g)
 
 
 @receiver(post_delete, sender=ProjectLeader)
 def remove_user_from_project_leaders(sender, **kwargs):
     g = Group.objects.get(name='ProjectLeaders')
-    kwargs['instance'].user.groups.remove(g)
+    remove_user_from_group(kwargs['instance'].user, g)
 
 
 @receiver(pre_save, sender=settings.AUTH_USER_MODEL)
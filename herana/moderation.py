@@ -0,0 +1,67 @@
+"""
+Moderation of submitted projects by institute admins, in bulk.
+"""
+from django.contrib.admin.models import LogEntry, CHANGE
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+
+from models import ProjectDetail, ReportingPeriod
+from results import bump_changes
+from snapshots import refresh_snapshots
+
+
+# The field each moderation action sets, its value and how it's logged
+MODERATION_ACTIONS = {
+    'reject': ('is_rejected', True, 'Rejected'),
+    'flag': ('is_flagged', True, 'Flagged'),
+    'unflag': ('is_flagged', False, 'Unflagged'),
+}
+
+
+def moderate_projects(user, projects, action, rejected_detail=''):
+    """
+    Apply a moderation action to a queryset of projects with a single
+    UPDATE and log it in the admin history of each project it changed.
+
+    Rejecting projects in closed reporting periods changes their published
+    results, so the snapshots of those periods are rewritten afterwards,
+    once per period. Frozen scores are kept as rejection is applied when
+    they're read. Return the number of projects changed.
+    """
+    field, value, verb = MODERATION_ACTIONS[action]
+    # UPDATE doesn't set auto_now fields, the results change feed reads it
+    values = {field: value, 'modified_at': timezone.now()}
+    change_message = verb
+    if action == 'reject' and rejected_detail:
+        values['rejected_detail'] = rejected_detail
+        change_message = '%s: %s' % (verb, rejected_detail)
+
+    with transaction.atomic():
+        # Projects which already have the value aren't changed or logged
+        changed = list(projects
+                       .exclude(**{field: value})
+                       .select_for_update()
+                       .values_list('id', 'name', 'reporting_period'))
+        if not changed:
+            return 0
+        ids = [id for id, name, reporting_period in changed]
+        ProjectDetail.objects.filter(id__in=ids).update(**values)
+
+        content_type = ContentType.objects.get_for_model(ProjectDetail)
+        LogEntry.objects.bulk_create([
+            LogEntry(user_id=user.pk,
+                     content_type_id=content_type.pk,
+                     object_id=unicode(id),
+                     object_repr=name[:200],
+                     action_flag=CHANGE,
+                     change_message=change_message)
+            for id, name, reporting_period in changed], batch_size=500)
+
+    periods = ReportingPeriod.objects\
+        .filter(id__in=set(rp for id, name, rp in changed))\
+        .select_related('institute')
+    bump_changes(rp.institute_id for rp in periods)
+    if action == 'reject':
+        refresh_snapshots(periods)
+    return len(changed)
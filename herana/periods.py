@@ -0,0 +1,149 @@
+"""
+Workflows acting on whole reporting periods.
+"""
+from datetime import date
+
+from django.db import connection, transaction
+
+from models import (
+    ReportingPeriod,
+    ProjectDetail,
+    ProjectFunding,
+    PHDStudent,
+    ProjectOutput,
+    NewCourseDetail,
+    CourseReqDetail,
+    Collaborators,
+    ResearchTeamMember,
+)
+from choices import OTHER_ACADEMICS, questionnaire_option
+from results import freeze_scores, bump_changes
+from snapshots import write_snapshot, write_export_snapshot
+
+
+# The inline rows of a project, see the ProjectDetailAdmin inlines
+PROJECT_INLINE_MODELS = (
+    ProjectFunding,
+    PHDStudent,
+    ProjectOutput,
+    NewCourseDetail,
+    CourseReqDetail,
+    Collaborators,
+)
+
+
+def close_reporting_period(reporting_period):
+    """
+    Close a reporting period: compute the final scores of its projects once,
+    then publish its results and the institute's export as static snapshots.
+    Results for the period are read from these from now on.
+    """
+    with transaction.atomic():
+        reporting_period.is_active = False
+        reporting_period.close_date = date.today()
+        reporting_period.save()
+        freeze_scores(reporting_period)
+
+    write_snapshot(reporting_period)
+    write_export_snapshot(reporting_period.institute)
+
+
+def carry_over_projects(projects):
+    """
+    Copy projects into the active reporting period of their institute, with
+    their inline rows and many-to-many choices, like "Save as new" does for
+    one project. The copies aren't rejected, as moderation applies to one
+    period's submission, and are only flagged if other academics are their
+    only team members, as they would be when saved in the admin.
+
+    Projects already in the active period, already carried over into it, or
+    whose institute has no active period, are skipped. Return the list of
+    copies.
+    """
+    projects = list(projects)
+    active_periods = dict(ReportingPeriod.objects
+                          .filter(institute__in=set(p.institute_id for p in projects), is_active=True)
+                          .values_list('institute', 'id'))
+    carried_over = set(ProjectDetail.objects
+                       .filter(carried_over_from__in=[p.id for p in projects],
+                               reporting_period__in=active_periods.values(),
+                               is_deleted=False)
+                       .values_list('carried_over_from', flat=True))
+    projects = [p for p in projects
+                if p.institute_id in active_periods and
+                p.reporting_period_id != active_periods[p.institute_id] and
+                p.id not in carried_over]
+    if not projects:
+        return []
+
+    with transaction.atomic():
+        copies = [_copy(p,
+                        reporting_period_id=active_periods[p.institute_id],
+                        is_rejected=False,
+                        rejected_detail=None,
+                        is_flagged=False,
+                        is_deleted=False,
+                        created_at=None,
+                        carried_over_from_id=p.id)
+                  for p in projects]
+        _insert_with_ids(ProjectDetail, copies)
+        new_ids = dict((p.id, c.id) for p, c in zip(projects, copies))
+
+        for model in PROJECT_INLINE_MODELS:
+            rows = model.objects.filter(project__in=new_ids.keys())
+            model.objects.bulk_create(
+                [_copy(row, project_id=new_ids[row.project_id]) for row in rows],
+                batch_size=500)
+
+        for field in ProjectDetail._meta.many_to_many:
+            through = field.rel.through
+            source = field.m2m_field_name() + '_id'
+            target = field.m2m_reverse_field_name() + '_id'
+            links = through.objects\
+                .filter(**{'%s__in' % source: new_ids.keys()})\
+                .values_list(source, target)
+            through.objects.bulk_create(
+                [through(**{source: new_ids[project_id], target: target_id})
+                 for project_id, target_id in links],
+                batch_size=500)
+
+        other_academics = questionnaire_option(ResearchTeamMember, OTHER_ACADEMICS)
+        ProjectDetail.objects\
+            .filter(id__in=new_ids.values(), team_members=other_academics)\
+            .exclude(team_members__in=ResearchTeamMember.objects.exclude(pk=other_academics.pk))\
+            .update(is_flagged=True)
+
+    bump_changes(c.institute_id for c in copies)
+    return copies
+
+
+def _copy(obj, **values):
+    """
+    Return an unsaved copy of a model instance with some values changed.
+    """
+    fields = dict((f.attname, getattr(obj, f.attname))
+                  for f in obj._meta.concrete_fields if not f.primary_key)
+    fields.update(values)
+    return obj.__class__(**fields)
+
+
+def _insert_with_ids(model, objects):
+    """
+    Insert new objects and set their ids.
+
+    bulk_create() doesn't set the ids of the objects it inserts, so on
+    PostgreSQL they're taken from the table's id sequence first and inserted
+    explicitly. Other databases insert the objects one by one.
+    """
+    if connection.vendor != 'postgresql':
+        for obj in objects:
+            obj.save(force_insert=True)
+        return
+
+    cursor = connection.cursor()
+    cursor.execute(
+        "SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+        [model._meta.db_table, model._meta.pk.column, len(objects)])
+    for obj, (id,) in zip(objects, cursor.fetchall()):
+        obj.id = id
+    model.objects.bulk_create(objects, batch_size=500)
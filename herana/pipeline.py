@@ -1,33 +1,217 @@
 from __future__ import absolute_import
 
 import codecs
+import hashlib
+import os
+import re
+from wsgiref.headers import Headers
 
+import brotli
+import rcssmin
+import rjsmin
 import scss
 
 from django.conf import settings
 
-from whitenoise.django import GzipManifestStaticFilesStorage
+from whitenoise.django import DjangoWhiteNoise, GzipManifestStaticFilesStorage
+from whitenoise.gzip import extension_regex
+from pipeline.conf import settings as pipeline_settings
 from pipeline.storage import PipelineMixin
 from pipeline.compilers import SubProcessCompiler
+from pipeline.compressors import CompressorBase
 
 
 class GzipManifestPipelineStorage(PipelineMixin, GzipManifestStaticFilesStorage):
-    pass
+    """
+    Writes a brotli compressed version next to the text files whitenoise
+    gzips, for HeranaWhiteNoise to serve to clients which accept it.
+    """
+    BROTLI_EXTENSIONS = ('css', 'js', 'json', 'map', 'svg', 'html', 'txt')
+
+    def post_process(self, *args, **kwargs):
+        files = super(GzipManifestPipelineStorage, self).post_process(*args, **kwargs)
+        dry_run = kwargs.get('dry_run', False)
+        brotli_re = extension_regex(self.BROTLI_EXTENSIONS)
+        for name, hashed_name, processed in files:
+            if not isinstance(processed, Exception) and not dry_run and brotli_re.search(name):
+                paths = [self.path(name)]
+                if hashed_name is not None:
+                    paths.append(self.path(hashed_name))
+                compress_brotli(paths)
+            yield name, hashed_name, processed
+
+
+def compress_brotli(paths):
+    """
+    Write the .br files of the given paths, compressing each distinct
+    content once as a file and its hashed copy are usually the same.
+    """
+    compressed = {}
+    for path in paths:
+        with open(path, 'rb') as f:
+            content = f.read()
+        if content not in compressed:
+            compressed[content] = brotli.compress(content, mode=brotli.MODE_TEXT)
+        with open(path + '.br', 'wb') as f:
+            f.write(compressed[content])
+
+
+class RJSMinCompressor(CompressorBase):
+    """
+    Minifies the JS bundles with rjsmin, which is pure Python.
+    License comments (/*! ... */) are kept.
+    """
+    def compress_js(self, js):
+        return rjsmin.jsmin(js, keep_bang_comments=True)
+
+
+class RCSSMinCompressor(CompressorBase):
+    """
+    Minifies the CSS bundles with rcssmin, which is pure Python.
+    """
+    def compress_css(self, css):
+        return rcssmin.cssmin(css, keep_bang_comments=True)
 
 
 class PyScssCompiler(SubProcessCompiler):
+    """
+    Compiles SCSS with pyScss, which is slow, so the output is cached in
+    PYSCSS_CACHE_DIR under a hash of the entry file and everything it
+    imports. A build where the styles didn't change copies the cached CSS
+    instead of compiling.
+
+    Like django-pipeline's other compilers, a file is only compiled when
+    it's newer than its output or compiling is forced, as it is when the
+    bundles are packaged by collectstatic, so the sources are only hashed
+    then.
+    """
     output_extension = 'css'
 
+    IMPORT_RE = re.compile(r'@import\s+([^;]+);')
+
     def match_file(self, filename):
         return filename.endswith('.scss')
 
     def compile_file(self, infile, outfile, outdated=False, force=False):
-        if not outdated and not force:
+        if not outdated and not force and os.path.exists(outfile):
             return
 
-        result = scss.compiler.compile_file(
-            infile,
-            search_path=settings.PYSCSS_LOAD_PATHS)
+        digest = self.source_hash(infile)
+        cache_dir = settings.PYSCSS_CACHE_DIR
+        cached = os.path.join(cache_dir, digest + '.css')
+        if os.path.exists(cached):
+            with codecs.open(cached, 'r', encoding='utf-8') as f:
+                result = f.read()
+        else:
+            result = scss.compiler.compile_file(
+                infile,
+                search_path=settings.PYSCSS_LOAD_PATHS)
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            tmp_path = '%s.%d.tmp' % (cached, os.getpid())
+            with codecs.open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(result)
+            os.rename(tmp_path, cached)
 
         with codecs.open(outfile, 'w', encoding='utf-8') as f:
             f.write(result)
+
+    def source_hash(self, infile):
+        """
+        Return a hash of the pyScss version, the load paths and the files
+        in infile's import graph. Paths are relative to BASE_DIR as builds
+        may run in a different directory each time.
+        """
+        sha = hashlib.sha1(scss.__version__)
+        for path in settings.PYSCSS_LOAD_PATHS:
+            sha.update(self.relative_path(path) + '\0')
+        for path in self.import_graph(infile):
+            sha.update(self.relative_path(path) + '\0')
+            with open(path, 'rb') as f:
+                sha.update(f.read() + '\0')
+        return sha.hexdigest()
+
+    def relative_path(self, path):
+        return os.path.relpath(path, settings.BASE_DIR).encode('utf-8')
+
+    def import_graph(self, infile):
+        """
+        Return the paths of infile and the SCSS files it imports, directly
+        or not, in the order they're first imported.
+        """
+        paths = []
+        pending = [os.path.abspath(infile)]
+        while pending:
+            path = pending.pop(0)
+            if path in paths:
+                continue
+            paths.append(path)
+            with codecs.open(path, 'r', encoding='utf-8') as f:
+                source = f.read()
+            for match in self.IMPORT_RE.finditer(source):
+                for name in match.group(1).split(','):
+                    imported = self.resolve_import(name.strip().strip('\'"'), path)
+                    if imported:
+                        pending.append(imported)
+        return paths
+
+    def resolve_import(self, name, importer):
+        """
+        Return the path of an imported SCSS file, looked for next to the
+        importing file and then in PYSCSS_LOAD_PATHS, or None for plain
+        CSS imports.
+        """
+        if name.startswith(('url(', 'http:', 'https:', '//')) or name.endswith('.css'):
+            return None
+        directory, base = os.path.split(name)
+        candidates = [name, os.path.join(directory, '_' + base)]
+        if not base.endswith('.scss'):
+            candidates = [c + '.scss' for c in candidates] + candidates
+
+        for root in [os.path.dirname(importer)] + list(settings.PYSCSS_LOAD_PATHS):
+            for candidate in candidates:
+                path = os.path.abspath(os.path.join(root, candidate))
+                if os.path.isfile(path):
+                    return path
+        return None
+
+
+def bundle_media(name):
+    """
+    Return the static paths of a JS bundle for a Media definition: the
+    bundle when pipeline is enabled, otherwise its sources, like the
+    javascript template tag.
+    """
+    package = pipeline_settings.PIPELINE_JS[name]
+    if pipeline_settings.PIPELINE_ENABLED:
+        return (package['output_filename'],)
+    return tuple(package['source_filenames'])
+
+
+class HeranaWhiteNoise(DjangoWhiteNoise):
+    """
+    Serves static files, preferring brotli compressed versions where the
+    client accepts them.
+    """
+    BROTLI_SUFFIX = '.br'
+    ACCEPT_BROTLI_RE = re.compile(r'\bbr\b')
+
+    def find_gzipped_alternatives(self, files):
+        super(HeranaWhiteNoise, self).find_gzipped_alternatives(files)
+        for url, static_file in files.items():
+            try:
+                brotli_file = files[url + self.BROTLI_SUFFIX]
+            except KeyError:
+                continue
+            static_file.brotli_path = brotli_file.path
+            static_file.headers['Vary'] = 'Accept-Encoding'
+            brotli_headers = Headers(static_file.headers.items())
+            brotli_headers['Content-Encoding'] = 'br'
+            brotli_headers['Content-Length'] = brotli_file.headers['Content-Length']
+            static_file.brotli_headers = brotli_headers
+
+    def get_path_and_headers(self, static_file, environ):
+        if getattr(static_file, 'brotli_path', None):
+            if self.ACCEPT_BROTLI_RE.search(environ.get('HTTP_ACCEPT_ENCODING', '')):
+                return static_file.brotli_path, static_file.brotli_headers
+        return super(HeranaWhiteNoise, self).get_path_and_headers(static_file, environ)
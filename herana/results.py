@@ -0,0 +1,482 @@
+"""
+Queries used to build the project interconnectedness results.
+"""
+import json
+import struct
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Avg, Count
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from models import Institute, ProjectDetail, ProjectScore
+
+
+ORG_LEVELS = (1, 2, 3)
+
+# Everything ProjectDetail.calc_score() reads, so that scoring a queryset
+# doesn't issue a query per project.
+SCORE_PREFETCH = (
+    'strategic_objectives', 'adv_group_rep', 'team_members', 'student_nature',
+    'projectfunding_set', 'phdstudent_set', 'projectoutput_set',
+    'newcoursedetail_set', 'coursereqdetail_set', 'collaborators_set',
+)
+
+
+def can_view_active_results(user, institute):
+    """
+    Return True if the user may see results for the institute's
+    active reporting period.
+    """
+    if not user.is_authenticated():
+        return False
+    return user.is_superuser or user.get_user_institute() == institute
+
+
+def final_projects(**filters):
+    """
+    Return a queryset of the final, accepted projects which results are shown for.
+    """
+    return ProjectDetail.objects.filter(
+        record_status=2,
+        is_rejected=False,
+        is_deleted=False,
+        **filters)
+
+
+def visible_projects(user, institute):
+    """
+    Return a queryset of the final, accepted projects of an institute
+    which the user may see results for.
+    """
+    projects = final_projects(institute=institute)
+    if not can_view_active_results(user, institute):
+        projects = projects.filter(reporting_period__is_active=False)
+    return projects
+
+
+def project_institutes(projects):
+    """
+    Return the institutes which the projects in a queryset belong to.
+    """
+    return Institute.objects.filter(id__in=projects.values('institute'))
+
+
+def unit_legend(projects, org_level):
+    """
+    Return the sorted, unique names of the units at an org level
+    which have projects in the queryset.
+
+    Like the chart points, projects in closed reporting periods are
+    placed by the units of their frozen scores.
+    """
+    unit = 'org_level_%d__name' % org_level
+    filters = {'%s__isnull' % unit: False}
+    frozen = ProjectScore.objects\
+        .filter(project__in=projects, **filters)\
+        .values_list(unit, flat=True)\
+        .distinct()
+    live = projects\
+        .filter(frozen_score__isnull=True, **filters)\
+        .values_list(unit, flat=True)\
+        .distinct()
+    return sorted(set(frozen.order_by()) | set(live.order_by()))
+
+
+def filter_projects(projects, reporting_period=None, org_level=1, status=None,
+                    duration=None, hidden_units=()):
+    """
+    Apply the results page filters to a queryset of projects and return
+    a list of chart points, largest duration first so that the smaller
+    circles are drawn on top.
+
+    Projects in closed reporting periods are read from their frozen scores.
+    The others are scored now, and as their duration is derived from the
+    project dates it's filtered in Python rather than in the query.
+    """
+    level = 'org_level_%d' % org_level
+    filters = {'%s__isnull' % level: False}
+    if reporting_period:
+        filters['reporting_period'] = reporting_period
+    excludes = {'%s__name__in' % level: hidden_units} if hidden_units else {}
+
+    scores = ProjectScore.objects\
+        .filter(project__in=projects, **filters)\
+        .exclude(**excludes)
+    if status:
+        scores = scores.filter(status=status)
+    if duration is not None:
+        scores = scores.filter(duration=duration)
+    points = [score_point(score, org_level) for score in scores.select_related(level)]
+
+    projects = projects\
+        .filter(frozen_score__isnull=True, **filters)\
+        .exclude(**excludes)
+    if status:
+        projects = projects.filter(project_status=status)
+    projects = projects\
+        .select_related(level)\
+        .prefetch_related(*SCORE_PREFETCH)
+
+    for project in projects:
+        point = project_point(project, org_level)
+        if duration is None or point['duration'] == duration:
+            points.append(point)
+
+    points.sort(key=lambda p: p['duration'], reverse=True)
+    return points
+
+
+def project_point(project, org_level):
+    return {
+        'id': project.id,
+        'score': project.calc_score(),
+        'duration': project.calc_duration(),
+        'status': project.project_status,
+        'unit': getattr(project, 'org_level_%d' % org_level).name,
+    }
+
+
+def score_point(score, org_level):
+    return {
+        'id': score.project_id,
+        'score': score.calc_score(),
+        'duration': score.duration,
+        'status': score.status,
+        'unit': getattr(score, 'org_level_%d' % org_level).name,
+    }
+
+
+def project_dicts(projects):
+    """
+    Return ProjectDetail.as_dict() for each project in a queryset,
+    from the frozen scores for projects in closed reporting periods.
+    """
+    scores = ProjectScore.objects\
+        .filter(project__in=projects)\
+        .select_related('project', 'institute', 'reporting_period',
+                        'org_level_1', 'org_level_2', 'org_level_3')
+    projects = projects.filter(frozen_score__isnull=True)
+    return [s.as_dict() for s in scores] + [p.as_dict() for p in projects]
+
+
+def chunks(queryset, chunk_size=500):
+    """
+    Yield the objects of a queryset as lists of up to chunk_size, paging
+    by primary key, which evaluates its select_related and
+    prefetch_related once per list.
+
+    Django 1.8's iterator() reads the whole result into psycopg2 on
+    PostgreSQL, so large exports page with WHERE id > ... LIMIT instead.
+    """
+    queryset = queryset.order_by('pk')
+    last = None
+    while True:
+        page = queryset if last is None else queryset.filter(pk__gt=last)
+        objects = list(page[:chunk_size])
+        if objects:
+            yield objects
+        if len(objects) < chunk_size:
+            return
+        last = objects[-1].pk
+
+
+def in_chunks(queryset, chunk_size=500):
+    """
+    Yield the objects of a queryset, reading them a chunk at a time,
+    see chunks().
+    """
+    for objects in chunks(queryset, chunk_size):
+        for obj in objects:
+            yield obj
+
+
+def iter_project_dicts(projects, chunk_size=500):
+    """
+    Yield the same as project_dicts(), a chunk of projects at a time, so
+    that the projects of a whole institute aren't held in memory at once.
+    """
+    scores = ProjectScore.objects\
+        .filter(project__in=projects)\
+        .select_related('project', 'institute', 'reporting_period',
+                        'org_level_1', 'org_level_2', 'org_level_3')
+    for score in in_chunks(scores, chunk_size):
+        yield score.as_dict()
+
+    projects = projects\
+        .filter(frozen_score__isnull=True)\
+        .select_related('institute', 'reporting_period',
+                        'org_level_1', 'org_level_2', 'org_level_3')\
+        .prefetch_related(*SCORE_PREFETCH)
+    for project in in_chunks(projects, chunk_size):
+        yield project.as_dict()
+
+
+def freeze_scores(reporting_period):
+    """
+    Compute the scores of the final projects in a reporting period once
+    and store them, replacing any stored before.
+
+    Rejected projects are scored too, rejection is applied when reading
+    the scores so that it can still be changed after the period is closed.
+    """
+    projects = ProjectDetail.objects\
+        .filter(reporting_period=reporting_period, record_status=2, is_deleted=False)\
+        .prefetch_related(*SCORE_PREFETCH)
+    with transaction.atomic():
+        ProjectScore.objects.filter(reporting_period=reporting_period).delete()
+        ProjectScore.objects.bulk_create(
+            [ProjectScore.from_project(p) for p in projects], batch_size=500)
+
+
+# ------------------------------------------------------------------------------
+# Roll-ups
+# ------------------------------------------------------------------------------
+
+def rollup_unit(org_level, field=None):
+    """
+    Return an expression for the unit which a project or score rolls up
+    to at an org level, or a field of it: its own unit there, or else
+    the ancestor there of its unit at a lower level, see OrgLevel.level_1.
+    """
+    suffix = '__' + field if field else ''
+    paths = ['org_level_%d%s' % (org_level, suffix)] + [
+        'org_level_%d__level_%d%s' % (lower, org_level, suffix)
+        for lower in ORG_LEVELS if lower > org_level]
+    if len(paths) == 1:
+        return F(paths[0])
+    return Coalesce(*paths)
+
+
+def unit_rollup(scores, org_level):
+    """
+    Return the number of projects and their average scores per unit at
+    an org level, for a queryset of ProjectScores, including the projects
+    of the units below it. Computed in a single grouped query.
+    """
+    averages = dict((key, Avg(key)) for key in ProjectScore.SCORE_FIELDS)
+    rows = scores\
+        .annotate(unit=rollup_unit(org_level), unit_name=rollup_unit(org_level, 'name'))\
+        .values('unit', 'unit_name')\
+        .annotate(count=Count('id'), **averages)\
+        .order_by('unit_name')
+    # Projects without a unit at or below the level are grouped under None
+    return [{
+        'id': row['unit'],
+        'name': row['unit_name'],
+        'count': row['count'],
+        'score': dict((key, row[key]) for key in ProjectScore.SCORE_FIELDS),
+    } for row in rows if row['unit'] is not None]
+
+
+def status_duration_counts(scores):
+    """
+    Return the number of projects by (status, duration) in a queryset
+    of ProjectScores.
+    """
+    rows = scores\
+        .values('status', 'duration')\
+        .annotate(count=Count('id'))\
+        .order_by()
+    return dict(((row['status'], row['duration']), row['count']) for row in rows)
+
+
+def period_averages(scores):
+    """
+    Return the number of projects and their average scores per reporting
+    period in a queryset of ProjectScores, oldest first, with the change
+    in each from the period before.
+    """
+    averages = dict((key, Avg(key)) for key in ProjectScore.SCORE_FIELDS)
+    rows = scores\
+        .values('reporting_period', 'reporting_period__name')\
+        .annotate(count=Count('id'), **averages)\
+        .order_by('reporting_period__open_date', 'reporting_period')
+
+    periods = []
+    previous = None
+    for row in rows:
+        period = {
+            'id': row['reporting_period'],
+            'name': row['reporting_period__name'],
+            'count': row['count'],
+            'score': dict((key, row[key]) for key in ProjectScore.SCORE_FIELDS),
+            'change': None,
+        }
+        if previous:
+            period['change'] = {
+                'count': period['count'] - previous['count'],
+                'score': dict((key, period['score'][key] - previous['score'][key])
+                              for key in ProjectScore.SCORE_FIELDS),
+            }
+        periods.append(period)
+        previous = period
+    return periods
+
+
+# ------------------------------------------------------------------------------
+# Change feed
+# ------------------------------------------------------------------------------
+
+# Changes are read from a little before the cursor, as a transaction which
+# commits after a read can have set an earlier modified_at. The results
+# page merges projects by id, so reading a change twice is harmless.
+CHANGES_OVERLAP = timedelta(seconds=5)
+
+# A counter per institute, bumped whenever one of its projects changes, so
+# that waiting for changes polls the cache rather than the database
+CHANGES_VERSION_KEY = 'herana:changes:%d'
+
+
+def changes_version(institute):
+    return cache.get(CHANGES_VERSION_KEY % institute.id, 0)
+
+
+def bump_changes(institute_ids):
+    """
+    Mark the projects of the given institutes as changed, for changes
+    made without saving them, e.g. with update() or bulk_create().
+    """
+    for institute_id in set(institute_ids):
+        key = CHANGES_VERSION_KEY % institute_id
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Not cached yet, or evicted
+            cache.set(key, 1, None)
+
+
+@receiver(post_save, sender=ProjectDetail)
+def project_saved(sender, instance, **kwargs):
+    bump_changes([instance.institute_id])
+
+
+def changed_projects(institute, since):
+    """
+    Return a queryset of the projects in an institute's active reporting
+    period which were changed after since.
+    """
+    return ProjectDetail.objects.filter(
+        institute=institute,
+        reporting_period__is_active=True,
+        modified_at__gt=since)
+
+
+def project_changes(institute, since, org_level=1):
+    """
+    Return the chart points of the projects in an institute's active
+    reporting period which were finalised or rescored after since, and
+    the ids of the changed projects which aren't shown, e.g. rejected ones.
+    """
+    level = 'org_level_%d' % org_level
+    projects = changed_projects(institute, since - CHANGES_OVERLAP)\
+        .select_related(level)\
+        .prefetch_related(*SCORE_PREFETCH)
+
+    points = []
+    removed = []
+    for project in projects:
+        shown = project.record_status == 2 and not project.is_rejected and not project.is_deleted
+        if shown and getattr(project, level) is not None:
+            points.append(project_point(project, org_level))
+        else:
+            removed.append(project.id)
+    return points, removed
+
+
+# ------------------------------------------------------------------------------
+# Columnar encoding
+# ------------------------------------------------------------------------------
+
+"""
+A compact binary alternative to the JSON chart points, decoded by
+Graph.decodeColumnar in graph.js:
+
+    uint32      length of the header, little-endian
+    header      UTF-8 JSON: {"count": n, "units": [...], "columns": [[name, type], ...]}
+    columns     n little-endian values per column, in header order,
+                each column starting on a 4 byte boundary
+
+Unit names are dictionary encoded: the unit column holds indexes
+into the header's unit list.
+"""
+
+SCORE_KEYS = ProjectScore.SCORE_FIELDS
+
+COLUMN_TYPES = {
+    'uint8': 'B',
+    'uint16': 'H',
+    'uint32': 'I',
+    'float32': 'f',
+}
+
+COLUMNS = (
+    ('id', 'uint32'),
+    ('unit', 'uint16'),
+    ('status', 'uint8'),
+    ('duration', 'uint8'),
+) + tuple((key, 'float32') for key in SCORE_KEYS)
+
+
+def _padding(length):
+    return '\0' * (-length % 4)
+
+
+def _column_values(name, points, unit_index):
+    if name == 'unit':
+        return [unit_index[p['unit']] for p in points]
+    if name in SCORE_KEYS:
+        return [p['score'][name] for p in points]
+    return [p[name] or 0 for p in points]
+
+
+def encode_columnar(units, points):
+    """
+    Return the chart points as a columnar byte string.
+    """
+    unit_index = dict((unit, i) for i, unit in enumerate(units))
+    header = json.dumps({
+        'count': len(points),
+        'units': units,
+        'columns': COLUMNS,
+    }, separators=(',', ':')).encode('utf-8')
+
+    chunks = [struct.pack('<I', len(header)), header, _padding(4 + len(header))]
+    for name, col_type in COLUMNS:
+        values = _column_values(name, points, unit_index)
+        data = struct.pack('<%d%s' % (len(values), COLUMN_TYPES[col_type]), *values)
+        chunks.extend([data, _padding(len(data))])
+    return ''.join(chunks)
+
+
+def decode_columnar(data):
+    """
+    Return the (units, points) encoded by encode_columnar().
+    """
+    header_length = struct.unpack_from('<I', data)[0]
+    header = json.loads(data[4:4 + header_length].decode('utf-8'))
+    count = header['count']
+    offset = 4 + header_length
+    offset += -offset % 4
+
+    columns = {}
+    for name, col_type in header['columns']:
+        fmt = '<%d%s' % (count, COLUMN_TYPES[col_type])
+        columns[name] = struct.unpack_from(fmt, data, offset)
+        offset += struct.calcsize(fmt)
+        offset += -offset % 4
+
+    units = header['units']
+    points = []
+    for i in range(count):
+        points.append({
+            'id': columns['id'][i],
+            'unit': units[columns['unit'][i]],
+            'status': columns['status'][i],
+            'duration': columns['duration'][i],
+            'score': dict((key, columns[key][i]) for key in SCORE_KEYS),
+        })
+    return units, points
@@ -0,0 +1,72 @@
+"""
+Full text search of the projects.
+
+On PostgreSQL herana_projectdetail has a search_vector tsvector column,
+which isn't a model field. It's kept up to date by a trigger on insert and
+on updates of the text fields, so bulk updates and copies are covered too,
+and is indexed with GIN, see migration 0010. Matches are ranked with
+ts_rank, the project name weighing most.
+
+Other databases, i.e. SQLite in development, fall back to unranked
+icontains lookups on the same fields.
+"""
+import re
+
+from django.db import connections
+from django.db.models import Q
+
+
+SEARCH_CONFIG = 'english'
+
+# The fields in the search vector by weight, as in migration 0010
+SEARCH_FIELDS = (
+    ('A', ('name',)),
+    ('B', ('description', 'outcomes', 'beneficiaries')),
+    ('C', ('research_text', 'curriculum_changes_text', 'team_members_text',
+           'new_initiative_text', 'new_initiative_party_text',
+           'focus_area_text', 'student_nature_text')),
+)
+
+SEARCH_RANK = "ts_rank(herana_projectdetail.search_vector, to_tsquery(%s, %s))"
+SEARCH_MATCH = "herana_projectdetail.search_vector @@ to_tsquery(%s, %s)"
+
+# Letters and digits, which are what to_tsquery() makes lexemes of
+TERM_RE = re.compile(r'[^\W_]+', re.UNICODE)
+
+
+def search_terms(text):
+    return TERM_RE.findall(text)
+
+
+def search_query(terms):
+    """
+    Return a to_tsquery() string matching all the terms, the last one
+    as a prefix as it may still be being typed. Terms only hold word
+    characters, so they can't add tsquery operators.
+    """
+    return ' & '.join(terms[:-1] + [terms[-1] + ':*'])
+
+
+def search_projects(projects, text):
+    """
+    Return the projects in a queryset which match the search text, best
+    match first, with their rank as search_rank on PostgreSQL.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return projects.none()
+
+    if connections[projects.db].vendor != 'postgresql':
+        fields = [field for weight, names in SEARCH_FIELDS for field in names]
+        for term in terms:
+            q = Q()
+            for field in fields:
+                q |= Q(**{'%s__icontains' % field: term})
+            projects = projects.filter(q)
+        return projects.order_by('-pk')
+
+    params = [SEARCH_CONFIG, search_query(terms)]
+    return projects\
+        .extra(select={'search_rank': SEARCH_RANK}, select_params=params,
+               where=[SEARCH_MATCH], params=params)\
+        .order_by('-search_rank', '-pk')
@@ -0,0 +1,232 @@
+"""
+Static snapshots of the results for closed reporting periods.
+
+The results of a closed reporting period don't change, so they're written
+once to the file storage, under names with a hash of their content which
+browsers and caches may keep for good:
+
+- the chart data of each closed period, as JSON, which the results page
+  filters in the browser instead of asking ResultsDataView, by
+  intersecting the posting lists in its index.
+- the public XLSX export of each institute, i.e. the results of all its
+  closed periods, downloaded under a name with the institute's.
+
+They're written when a period is closed or the projects it shows change,
+and those missing in the current format on each release, see bin/release.
+Requests only read them.
+"""
+import hashlib
+import json
+from datetime import date
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from exports import build_xlsx, attachment_disposition
+from models import ProjectScore
+from results import ORG_LEVELS, final_projects, unit_legend, project_dicts, freeze_scores
+
+
+# Changes whenever the snapshot format does, so that snapshots written
+# before are rewritten, see snapshot_url()
+SNAPSHOT_VERSION = 2
+
+# Snapshot names include a hash of their content
+SNAPSHOT_HEADERS = {
+    'Cache-Control': 'public, max-age=31536000, immutable',
+}
+
+# The fields the results page filters snapshot projects on
+INDEX_FIELDS = ('status', 'duration') + tuple('org_level_%d' % level for level in ORG_LEVELS)
+
+
+def snapshot_projects(reporting_period):
+    return final_projects(reporting_period=reporting_period)
+
+
+def build_snapshot(reporting_period):
+    """
+    Return the results of a closed reporting period as a dict of unit legends
+    by org level, projects with the units they belong to at each level,
+    largest duration first as they're drawn, and their index.
+    """
+    if not reporting_period.scores.exists():
+        # Closed before scores were frozen on close
+        freeze_scores(reporting_period)
+
+    projects = snapshot_projects(reporting_period)
+    points = []
+    scores = reporting_period.scores\
+        .filter(project__in=projects)\
+        .select_related('org_level_1', 'org_level_2', 'org_level_3')\
+        .order_by('project')
+    for score in scores:
+        point = {
+            'id': score.project_id,
+            'score': score.calc_score(),
+            'duration': score.duration,
+            'status': score.status,
+        }
+        for level in ORG_LEVELS:
+            unit = getattr(score, 'org_level_%d' % level)
+            point['org_level_%d' % level] = unit.name if unit else None
+        points.append(point)
+
+    units = dict((level, unit_legend(projects, level)) for level in ORG_LEVELS)
+    return snapshot_data(units, points)
+
+
+def snapshot_data(units, points):
+    points.sort(key=lambda p: p['duration'], reverse=True)
+    return {
+        'units': units,
+        'projects': points,
+        'index': index_projects(points),
+    }
+
+
+def index_projects(projects):
+    """
+    Return the positions in the list of projects with each value of the
+    INDEX_FIELDS, as {field: {value: positions}}, so that filtering is an
+    intersection of these posting lists rather than a scan of the projects.
+
+    Positions are ascending, i.e. in drawing order, and delta encoded:
+    each is given as the difference from the one before it.
+    """
+    index = dict((field, {}) for field in INDEX_FIELDS)
+    for position, project in enumerate(projects):
+        for field in INDEX_FIELDS:
+            value = project[field]
+            if value is not None:
+                index[field].setdefault(value, []).append(position)
+
+    for postings in index.values():
+        for value, positions in postings.items():
+            postings[value] = [b - a for a, b in zip([0] + positions, positions)]
+    return index
+
+
+def snapshot_prefix(reporting_period):
+    return 'results/%d/%d.v%d' % (reporting_period.institute_id, reporting_period.id, SNAPSHOT_VERSION)
+
+
+def export_prefix(institute):
+    return 'results/exports/%d' % institute.id
+
+
+def snapshot_url(reporting_period):
+    """
+    Return the URL of a closed reporting period's snapshot, or None if it
+    hasn't been written in the current format, in which case the results
+    page asks ResultsDataView for the period instead.
+
+    Snapshots are only read here. They're written when a period is closed
+    and on each release, see build_results_snapshots.
+    """
+    if reporting_period.is_active or not has_snapshot(reporting_period):
+        return None
+    return default_storage.url(reporting_period.results_snapshot)
+
+
+def has_snapshot(reporting_period):
+    name = reporting_period.results_snapshot
+    return bool(name) and name.startswith(snapshot_prefix(reporting_period) + '.')
+
+
+def write_snapshot(reporting_period):
+    """
+    Write the snapshot files for a reporting period, remove the ones they
+    replace and return the new name.
+    """
+    content = json.dumps(build_snapshot(reporting_period), separators=(',', ':'))
+    name = _write_hashed(snapshot_prefix(reporting_period), '.json', content, gzip=True)
+
+    old_name = reporting_period.results_snapshot
+    if old_name != name:
+        reporting_period.results_snapshot = name
+        reporting_period.save(update_fields=['results_snapshot'])
+        if old_name:
+            delete_snapshot(old_name)
+    return name
+
+
+def export_snapshot_url(institute):
+    """
+    Return the URL of an institute's public results export, or None if it
+    hasn't been written, see snapshot_url().
+    """
+    if not has_export_snapshot(institute):
+        return None
+    return default_storage.url(institute.results_export)
+
+
+def has_export_snapshot(institute):
+    name = institute.results_export
+    return bool(name) and name.startswith(export_prefix(institute) + '.')
+
+
+def build_export(institute):
+    """
+    Return the XLSX export of the results in an institute's closed
+    reporting periods, with its summary sheets.
+    """
+    projects = final_projects(institute=institute, reporting_period__is_active=False)
+    scores = ProjectScore.objects.filter(project__in=projects)
+    return build_xlsx(institute, project_dicts(projects), scores)
+
+
+def write_export_snapshot(institute):
+    """
+    Write the export of an institute's results, see build_export(), remove
+    the one it replaces and return the new name.
+    """
+    # XLSX files are already compressed
+    name = _write_hashed(export_prefix(institute), '.xlsx', build_export(institute), headers={
+        'Content-Disposition': attachment_disposition(export_filename(institute, date.today())),
+    })
+
+    old_name = institute.results_export
+    if old_name != name:
+        institute.results_export = name
+        institute.save(update_fields=['results_export'])
+        if old_name:
+            delete_snapshot(old_name)
+    return name
+
+
+def export_filename(institute, day, extension='xlsx'):
+    return 'Herana results - %s - %s.%s' % (institute.name, day, extension)
+
+
+def refresh_snapshots(reporting_periods):
+    """
+    Rewrite the snapshots of the closed reporting periods among the given
+    ones, and the exports of their institutes, once each after a change to
+    which of their projects are shown, e.g. projects being rejected.
+    """
+    closed = [rp for rp in reporting_periods if not rp.is_active]
+    for reporting_period in closed:
+        write_snapshot(reporting_period)
+    institutes = dict((rp.institute_id, rp.institute) for rp in closed)
+    for institute in institutes.values():
+        write_export_snapshot(institute)
+
+
+def delete_snapshot(name):
+    if default_storage.exists(name):
+        default_storage.delete(name)
+
+
+def _write_hashed(prefix, extension, content, gzip=False, headers=None):
+    name = '%s.%s%s' % (prefix, hashlib.md5(content).hexdigest()[:12], extension)
+    if not default_storage.exists(name):
+        snapshot = ContentFile(content)
+        # Honoured by S3Storage
+        snapshot.headers = dict(SNAPSHOT_HEADERS, **(headers or {}))
+        snapshot.gzip = gzip
+        saved_name = default_storage.save(name, snapshot)
+        if saved_name != name:
+            # Written by another process meanwhile
+            default_storage.delete(saved_name)
+    return name
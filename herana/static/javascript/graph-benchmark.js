@@ -0,0 +1,119 @@
+(function() {
+  // Draws generated results with each of the graph's renderers,
+  // see ResultsBenchmarkView.
+  var threshold = graph.canvasThreshold,
+      units = [];
+
+  for (var u = 1; u <= 20; u++) {
+    units.push('Unit ' + u);
+  }
+  graph.updateUnits(units);
+  graph.drawUnitLegend();
+  $('.canvas-threshold').text(threshold);
+
+  var generate = function(count) {
+    // Points shaped like the results data, largest duration first
+    var projects = [];
+    for (var i = 0; i < count; i++) {
+      var score = {};
+      _.each(['a_1', 'a_2', 'a_3', 'a_4', 'c_1', 'c_2', 'c_3_a', 'c_3_b', 'c_4'], function(key) {
+        score[key] = Math.round(Math.random() * 3);
+      });
+      score.x = Math.random() * 9;
+      score.y = Math.random() * 9;
+      projects.push({
+        id: i + 1,
+        unit: units[Math.floor(Math.random() * units.length)],
+        status: Math.random() < 0.5 ? 1 : 2,
+        duration: Math.floor(Math.random() * 5),
+        score: score
+      });
+    }
+    return _.sortBy(projects, 'duration').reverse();
+  };
+
+  var clear = function() {
+    graph.filtered_projects = [];
+    graph.drawCanvasPoints([]);
+    graph.svg.selectAll('circle.point').remove();
+  };
+
+  var hitTests = function() {
+    if (!graph.quadtree) {
+      return null;
+    }
+    var start = performance.now();
+    for (var i = 0; i < 1000; i++) {
+      graph.canvasPointAt(graph.xScale(Math.random() * 9), graph.yScale(Math.random() * 9));
+    }
+    return performance.now() - start;
+  };
+
+  var time = function(renderer, projects, done) {
+    clear();
+    graph.canvasThreshold = renderer == 'canvas' ? -1 : Infinity;
+
+    var start = performance.now();
+    graph.filtered_projects = projects;
+    graph.drawResults();
+    var drawn = performance.now();
+
+    // The frame after the next one has been painted
+    requestAnimationFrame(function() {
+      requestAnimationFrame(function() {
+        done({
+          draw: drawn - start,
+          frame: performance.now() - start,
+          hits: hitTests()
+        });
+      });
+    });
+  };
+
+  var format = function(ms) {
+    return ms === null ? '' : ms.toFixed(1);
+  };
+
+  var run = function(counts) {
+    var tbody = $('.benchmark-results tbody'),
+        runs = [];
+
+    tbody.find('tr').remove();
+    _.each(counts, function(count) {
+      runs.push([count, 'svg'], [count, 'canvas']);
+    });
+
+    var next = function() {
+      var item = runs.shift();
+      if (!item) {
+        clear();
+        graph.canvasThreshold = threshold;
+        $('.run-benchmark').prop('disabled', false);
+        return;
+      }
+      time(item[1], generate(item[0]), function(result) {
+        tbody.append($('<tr>').append(
+          $('<td>').text(item[0]),
+          $('<td>').text(item[1]),
+          $('<td>').text(format(result.draw)),
+          $('<td>').text(format(result.frame)),
+          $('<td>').text(format(result.hits))));
+        // Let the browser settle between runs
+        setTimeout(next, 100);
+      });
+    };
+
+    $('.run-benchmark').prop('disabled', true);
+    next();
+  };
+
+  $('.run-benchmark').on('click', function(e) {
+    e.preventDefault();
+    var counts = _.filter(_.map($('.benchmark-counts').val().split(','), function(count) {
+      return parseInt(count, 10);
+    }), function(count) {
+      return count > 0;
+    });
+    run(counts);
+  });
+})();
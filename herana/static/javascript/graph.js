@@ -4,9 +4,10 @@ var Graph = function() {
   self.init = function() {
     self.data = DATA;
 
-    self.all_projects = self.data.projects;
-    self.institute_projects = [];
     self.filtered_projects = [];
+    self.request = null;
+    self.snapshots = {};
+    self.watch = null;
 
     self.institutes = self.data.institutes;
 
@@ -25,6 +26,19 @@ var Graph = function() {
     self.svg.append("g").attr("class", "graph");
     self.svg.append("g").attr("class", "legend");
 
+    // Results with more points than this are drawn on a canvas
+    // over the SVG, see drawResults
+    self.canvasThreshold = 1000;
+    self.canvas = d3.select("#graph")
+      .append("canvas")
+      .attr("class", "points");
+    self.sizeCanvas();
+    self.quadtree = null;
+    self.hovered = null;
+    self.svg
+      .on("mousemove", self.canvasMouseMove)
+      .on("mouseleave", self.canvasMouseLeave);
+
     self.updateInstitutes();
     self.units = [];
 
@@ -64,18 +78,11 @@ var Graph = function() {
     $('select[class=select-status]').val("");
   };
 
-  self.getLevelUnits = function () {
-    // Return a set of unique unit names,
-    // which exist for the current chosen level,
-    // for the current instutute.
-    var org_level = 'org_level_' + self.filters.org_level;
-    return _.uniq(
-      _.map(
-        _.filter(
-          self.institute_projects, function(project) {
-            return project[org_level];
-          }),
-        function(p) { return p[org_level]; }));
+  self.getHiddenUnits = function () {
+    // Return the units which have been switched off in the legend.
+    return _.filter(self.units, function(u) {
+      return !self.filters.units[u];
+    });
   };
 
   self.updateInstitutes = function() {
@@ -113,9 +120,9 @@ var Graph = function() {
     });
   };
 
-  self.updateUnits = function () {
+  self.updateUnits = function (units) {
     $('#unit-legend-meta').css('display', 'block');
-    self.units = self.getLevelUnits();
+    self.units = units;
     self.filters.units = {};
     _.each(self.units, function(u) {
       self.filters.units[u] = true;
@@ -138,95 +145,418 @@ var Graph = function() {
 
     self.filters.reporting_period = self.filters.institute.reporting_periods[0].id
 
-    self.institute_projects = _.filter(self.all_projects, function(project) {
-        return project.institute.id == self.filters.institute.id;
-    });
-
     self.updateReportingPeriods();
     self.updateOrgLevels();
-    self.updateUnits();
 
-    self.drawUnitLegend();
-    self.filterAndDrawProjects();
+    self.fetchAndDrawProjects(true);
 
     self.updateDownloadForm();
   };
 
   self.reportingPeriodChanged = function() {
     self.filters.reporting_period = $(this).val() || null;
-    self.filterAndDrawProjects();
+    self.fetchAndDrawProjects();
   }
 
   self.orgLevelChanged = function() {
     self.filters.org_level = $(this).val() || null;
-    self.updateUnits();
-    self.drawUnitLegend();
-    self.filterAndDrawProjects();
+    self.fetchAndDrawProjects(true);
   };
 
   self.statusChanged = function() {
     self.filters.status = $(this).val() || null;
-    self.filterAndDrawProjects();
+    self.fetchAndDrawProjects();
   };
 
   self.durationChanged = function() {
     self.filters.duration = $(this).val() || null;
-    self.filterAndDrawProjects();
+    self.fetchAndDrawProjects();
   };
 
   self.unitChanged = function(d) {
     self.filters.units[d] = !self.filters.units[d];
-    self.filterAndDrawProjects();
+    self.fetchAndDrawProjects();
   };
 
   self.showAllUnits = function(d) {
-    self.updateUnits()
-    self.drawUnitLegend();
-    self.filterAndDrawProjects();
+    self.fetchAndDrawProjects(true);
   }
 
-  self.filterAndDrawProjects = function() {
-    var filters = self.filters;
+  self.getReportingPeriod = function() {
+    return _.find(self.filters.institute.reporting_periods, function(reporting_period) {
+      return reporting_period.id == self.filters.reporting_period;
+    });
+  };
+
+  self.fetchAndDrawProjects = function(resetUnits) {
+    // Filtering is done by the server, which returns the points
+    // to draw and the units for the legend. Closed reporting periods
+    // are loaded once from their static snapshot and filtered here.
+    if (resetUnits) {
+      self.filters.units = {};
+    }
 
-    // All unfiltered projects for currrent institute
-    var projects = self.institute_projects;
+    var params = {
+      institute: self.filters.institute.id,
+      reporting_period: self.filters.reporting_period || '',
+      org_level: self.filters.org_level || '',
+      status: self.filters.status || '',
+      duration: self.filters.duration || '',
+      hide_unit: resetUnits ? [] : self.getHiddenUnits()
+    };
 
-    // reporting period
-    if (self.filters.reporting_period) {
-      projects = _.filter(projects, function(project) {
-        return project.reporting_period.id == self.filters.reporting_period;
-      });
+    // Only draw the response to the latest change
+    if (self.request) {
+      self.request.abort();
     }
+    self.stopWatching();
+
+    // Only the active period changes. It's only listed for users who may
+    // see its results, which are also shown when no period is selected.
+    var reporting_period = self.getReportingPeriod(),
+        active = reporting_period ? reporting_period.is_active :
+          _.some(self.filters.institute.reporting_periods, function(rp) {
+            return rp.is_active;
+          });
+
+    var draw = function(data) {
+      if (resetUnits) {
+        self.updateUnits(data.units);
+        self.drawUnitLegend();
+      }
+      // Sorted by the server, largest duration first
+      self.filtered_projects = data.projects;
+      self.drawResults();
+      if (active) {
+        self.watchChanges();
+      }
+    };
 
-    // org level
-    if (self.filters.org_level) {
-      projects = _.filter(projects, function(project) {
-        return project['org_level_' + self.filters.org_level];
+    if (reporting_period && reporting_period.snapshot) {
+      var url = reporting_period.snapshot;
+      if (self.snapshots[url]) {
+        self.request = null;
+        draw(self.filterSnapshot(self.snapshots[url]));
+      } else {
+        self.request = $.getJSON(url).done(function(snapshot) {
+          self.snapshots[url] = snapshot;
+          draw(self.filterSnapshot(snapshot));
+        });
+      }
+    } else if (window.ArrayBuffer && window.DataView) {
+      // Use the compact columnar encoding where the browser can decode it
+      params.format = 'columnar';
+      self.request = new XMLHttpRequest();
+      self.request.open('GET', '/results/data/?' + $.param(params, true));
+      self.request.responseType = 'arraybuffer';
+      self.request.onload = function() {
+        if (this.status == 200) {
+          draw(self.decodeColumnar(this.response));
+        }
+      };
+      self.request.send();
+    } else {
+      self.request = $.ajax({
+        url: '/results/data/',
+        data: params,
+        dataType: 'json',
+        traditional: true
+      }).done(draw);
+    }
+  };
+
+  self.watchChanges = function() {
+    // Merge the projects finalised, rescored or removed in the active
+    // reporting period into the chart as they change, by long-polling
+    // ResultsChangesView. The first request only returns a cursor.
+    var watch = self.watch = {},
+        params = {
+          institute: self.filters.institute.id,
+          org_level: self.filters.org_level || ''
+        };
+
+    var poll = function(since) {
+      params.since = since === undefined ? '' : since;
+      watch.request = $.getJSON('/results/changes/', params)
+        .done(function(changes) {
+          if (self.watch !== watch) {
+            return;
+          }
+          if (since !== undefined) {
+            self.mergeChanges(changes);
+          }
+          poll(changes.cursor);
+        })
+        .fail(function(xhr) {
+          // Retry after errors, but not when the user may not see
+          // the active period's results or the watch was stopped
+          if (self.watch === watch && xhr.status != 403 && xhr.status != 400) {
+            setTimeout(function() {
+              if (self.watch === watch) {
+                poll(since);
+              }
+            }, 10000);
+          }
+        });
+    };
+    poll();
+  };
+
+  self.stopWatching = function() {
+    var watch = self.watch;
+    self.watch = null;
+    if (watch && watch.request) {
+      watch.request.abort();
+    }
+  };
+
+  self.mergeChanges = function(changes) {
+    // Replace the changed projects in the chart, the same project
+    // may be sent more than once.
+    var filters = self.filters,
+        changed = {},
+        newUnits = false;
+
+    _.each(changes.removed, function(id) {
+      changed[id] = true;
+    });
+    _.each(changes.projects, function(project) {
+      changed[project.id] = true;
+    });
+    if (_.isEmpty(changed)) {
+      return;
+    }
+
+    var projects = _.reject(self.filtered_projects, function(project) {
+      return changed[project.id];
+    });
+    _.each(changes.projects, function(project) {
+      if (!_.contains(self.units, project.unit)) {
+        // Added last, so the other units keep their colours
+        self.units.push(project.unit);
+        filters.units[project.unit] = true;
+        newUnits = true;
+      }
+      if (filters.units[project.unit] !== false &&
+          (!filters.status || project.status == filters.status) &&
+          (!filters.duration || project.duration == filters.duration)) {
+        projects.push(project);
+      }
+    });
+
+    if (newUnits) {
+      self.drawUnitLegend();
+      d3.selectAll('#unit-legend .cell').style('opacity', function(unit) {
+        return filters.units[unit] === false ? 0.5 : 1;
       });
     }
+    self.filtered_projects = _.sortBy(projects, 'duration').reverse();
+    self.drawResults();
+  };
+
+  self.filterSnapshot = function(snapshot) {
+    // Apply the filters to a reporting period snapshot by intersecting
+    // the posting lists of its index, see snapshots.index_projects,
+    // returning the same shape as the server's response.
+    var level = 'org_level_' + self.filters.org_level,
+        index = self.snapshotIndex(snapshot),
+        units = index[level],
+        filters = self.filters,
+        lists = [];
+
+    var hidden = _.filter(_.keys(units), function(unit) {
+      return filters.units[unit] === false;
+    });
+    var positions = self.allPositions(snapshot, level);
+    if (hidden.length) {
+      positions = self.difference(positions, self.union(_.map(hidden, function(unit) {
+        return units[unit];
+      })));
+    }
 
-    // status
-    if (self.filters.status) {
-      projects = _.filter(projects, function(project) {
-        return project.status == self.filters.status;
+    if (filters.status) {
+      lists.push(index.status[filters.status] || new Int32Array(0));
+    }
+    if (filters.duration) {
+      lists.push(index.duration[filters.duration] || new Int32Array(0));
+    }
+    // Smallest first, so that the intermediate results stay small
+    lists.sort(function(a, b) { return a.length - b.length; });
+    _.each(lists, function(list) {
+      positions = self.intersect(list, positions);
+    });
+
+    // Positions are in drawing order, largest duration first
+    var points = self.snapshotPoints(snapshot, level),
+        projects = new Array(positions.length);
+    for (var i = 0; i < positions.length; i++) {
+      projects[i] = points[positions[i]];
+    }
+
+    return {
+      units: snapshot.units[self.filters.org_level] || [],
+      projects: projects
+    };
+  };
+
+  self.snapshotIndex = function(snapshot) {
+    // Decode the delta encoded posting lists once per snapshot
+    if (!snapshot.decoded_index) {
+      snapshot.decoded_index = {};
+      _.each(snapshot.index, function(postings, field) {
+        var decoded = snapshot.decoded_index[field] = {};
+        _.each(postings, function(deltas, value) {
+          var positions = new Int32Array(deltas.length),
+              position = 0;
+          for (var i = 0; i < deltas.length; i++) {
+            position += deltas[i];
+            positions[i] = position;
+          }
+          decoded[value] = positions;
+        });
       });
     }
+    return snapshot.decoded_index;
+  };
+
+  self.allPositions = function(snapshot, level) {
+    // The projects which belong to a unit at the org level
+    snapshot.all_positions = snapshot.all_positions || {};
+    if (!snapshot.all_positions[level]) {
+      snapshot.all_positions[level] = self.union(_.values(self.snapshotIndex(snapshot)[level]));
+    }
+    return snapshot.all_positions[level];
+  };
 
-    // duration
-    if (self.filters.duration) {
-      projects = _.filter(projects, function(project) {
-        return project.duration == self.filters.duration;
+  self.snapshotPoints = function(snapshot, level) {
+    // The chart points of the snapshot's projects at the org level
+    snapshot.points = snapshot.points || {};
+    if (!snapshot.points[level]) {
+      snapshot.points[level] = _.map(snapshot.projects, function(project) {
+        return _.extend({unit: project[level]}, project);
       });
     }
+    return snapshot.points[level];
+  };
+
+  self.intersect = function(a, b) {
+    // The positions in both of two ascending lists
+    var result = new Int32Array(Math.min(a.length, b.length)),
+        i = 0, j = 0, n = 0;
+    while (i < a.length && j < b.length) {
+      if (a[i] < b[j]) {
+        i++;
+      } else if (a[i] > b[j]) {
+        j++;
+      } else {
+        result[n++] = a[i];
+        i++;
+        j++;
+      }
+    }
+    return result.subarray(0, n);
+  };
+
+  self.difference = function(a, b) {
+    // The positions in ascending list a which aren't in b
+    var result = new Int32Array(a.length),
+        i = 0, j = 0, n = 0;
+    while (i < a.length) {
+      if (j < b.length && b[j] < a[i]) {
+        j++;
+      } else if (j < b.length && b[j] == a[i]) {
+        i++;
+        j++;
+      } else {
+        result[n++] = a[i++];
+      }
+    }
+    return result.subarray(0, n);
+  };
+
+  self.union = function(lists) {
+    // The positions in any of the lists, which don't overlap
+    // as each project belongs to one unit at an org level
+    var length = 0, n = 0;
+    _.each(lists, function(list) {
+      length += list.length;
+    });
+    var result = new Int32Array(length);
+    _.each(lists, function(list) {
+      result.set(list, n);
+      n += list.length;
+    });
+    return result.sort();
+  };
 
-    // units
-    projects = _.filter(projects, function(p) {
-      var org = p['org_level_' + self.filters.org_level];
-      return org && self.filters.units[org];
+  self.decodeColumns = function(buffer) {
+    // Read the header and a typed array view of each column of the binary
+    // chart points written by results.encode_columnar, without copying them.
+    var view = new DataView(buffer),
+        header_length = view.getUint32(0, true),
+        header_bytes = new Uint8Array(buffer, 4, header_length),
+        header_text = '',
+        types = {
+          uint8: Uint8Array,
+          uint16: Uint16Array,
+          uint32: Uint32Array,
+          float32: Float32Array
+        },
+        columns = {};
+
+    // The header is ASCII only JSON, read it in chunks to keep
+    // the argument list of fromCharCode short.
+    for (var i = 0; i < header_bytes.length; i += 4096) {
+      header_text += String.fromCharCode.apply(null, header_bytes.subarray(i, i + 4096));
+    }
+    var header = JSON.parse(header_text),
+        count = header.count,
+        offset = 4 + header_length;
+
+    _.each(header.columns, function(column) {
+      var Type = types[column[1]];
+      offset += (4 - offset % 4) % 4;
+      columns[column[0]] = new Type(buffer, offset, count);
+      offset += count * Type.BYTES_PER_ELEMENT;
     });
 
-    self.filtered_projects = _.sortBy(projects, 'duration').reverse();
-    self.drawResults();
+    return {header: header, columns: columns};
+  };
+
+  self.decodeColumnar = function(buffer) {
+    // Decode the binary chart points into the same {units: [...], projects: [...]}
+    // shape as the JSON response. Building the point objects takes most of
+    // the time, see benchmarks/results_payload.js, but is still several
+    // times faster than JSON.parse of the same points.
+    var decoded = self.decodeColumns(buffer),
+        header = decoded.header,
+        columns = decoded.columns,
+        count = header.count;
+
+    var projects = new Array(count);
+    for (var j = 0; j < count; j++) {
+      projects[j] = {
+        id: columns.id[j],
+        unit: header.units[columns.unit[j]],
+        status: columns.status[j],
+        duration: columns.duration[j],
+        score: {
+          x: columns.x[j],
+          y: columns.y[j],
+          a_1: columns.a_1[j],
+          a_2: columns.a_2[j],
+          a_3: columns.a_3[j],
+          a_4: columns.a_4[j],
+          c_1: columns.c_1[j],
+          c_2: columns.c_2[j],
+          c_3_a: columns.c_3_a[j],
+          c_3_b: columns.c_3_b[j],
+          c_4: columns.c_4[j]
+        }
+      };
+    }
+
+    return {units: header.units, projects: projects};
   };
 
   self.createScales = function() {
@@ -516,14 +846,35 @@ var Graph = function() {
   };
 
   self.drawResults = function () {
+    // Thousands of SVG circles are slow to add and transition,
+    // so dense results are drawn on the canvas instead.
+    if (self.filtered_projects.length > self.canvasThreshold) {
+      self.drawSvgPoints([]);
+      self.drawCanvasPoints(self.filtered_projects);
+    } else {
+      self.drawCanvasPoints([]);
+      self.drawSvgPoints(self.filtered_projects);
+    }
+  };
+
+  self.pointRadius = function(d) {
+    var r = self.rScale(d.duration);
+    // ensure outer edge of stroke is at where the edge of a filled circle would be
+    // status: 1 = complete, 2 = ongoing
+    if (d.status == '2') r -= self.stroke / 2;
+    return r;
+  };
+
+  self.drawSvgPoints = function (projects) {
     var svg = self.svg.select(".graph"),
-        point = svg.selectAll("circle").data(self.filtered_projects, function(d) { return d.id; }).order();
+        point = svg.selectAll("circle.point").data(projects, function(d) { return d.id; }).order();
 
     point.exit()
       .transition().attr("r", 0).remove();
 
     point.enter()
       .append("circle")
+      .attr("class", "point")
       .attr("cx", function(d) {
           return self.xScale(d.score['x']);
        })
@@ -532,28 +883,135 @@ var Graph = function() {
        })
        .attr("r", 0)
        .transition()
-       .attr("r", function(d) {
-          var r = self.rScale(d.duration);
-          // ensure outer edge of stroke is at where the edge of a filled circle would be
-          // status: 1 = complete, 2 = ongoing
-          if (d.status == '2') r -= self.stroke / 2;
-          return r;
-       })
+       .attr("r", self.pointRadius)
        .attr("fill", function(d) {
           // no fill for ongoing
           // status: 1 = complete, 2 = ongoing
-          return d.status == '2' ? 'none' : self.colorScale(d['org_level_' + self.filters.org_level]);
+          return d.status == '2' ? 'none' : self.colorScale(d.unit);
        })
        .attr("stroke", function(d) {
           // stroke only for ongoing
           // status: 1 = complete, 2 = ongoing
-          return d.status == '2' ? self.colorScale(d['org_level_' + self.filters.org_level]) : 'none';
+          return d.status == '2' ? self.colorScale(d.unit) : 'none';
        })
        .attr("stroke-width", self.stroke);
        point.on("mouseover", self.showTooltip);
        point.on("mouseout", self.removeTooltip);
   };
 
+  self.sizeCanvas = function() {
+    // Drawn at the screen's resolution, the canvas covers the
+    // rotated graph but not the duration legend below it.
+    self.canvasRatio = window.devicePixelRatio || 1;
+    self.canvas
+      .attr("width", self.w * self.canvasRatio)
+      .attr("height", self.h * self.canvasRatio)
+      .style("width", self.w + "px")
+      .style("height", self.h + "px");
+  };
+
+  self.drawCanvasPoints = function (projects) {
+    var ctx = self.canvas.node().getContext("2d"),
+        ratio = self.canvasRatio,
+        points = new Array(projects.length);
+
+    ctx.setTransform(1, 0, 0, 1, 0, 0);
+    ctx.clearRect(0, 0, self.w * ratio, self.h * ratio);
+    self.canvasMouseLeave();
+    self.quadtree = null;
+    if (!projects.length) {
+      return;
+    }
+
+    // The same rotation as the .graph group
+    ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+    ctx.translate(self.w / 2, self.h / 2);
+    ctx.rotate(-Math.PI / 4);
+    ctx.translate(-self.w / 2, -self.h / 2);
+    ctx.lineWidth = self.stroke;
+
+    // In order, so that the smaller circles are drawn on top
+    for (var i = 0; i < projects.length; i++) {
+      var d = projects[i],
+          x = self.xScale(d.score['x']),
+          y = self.yScale(d.score['y']),
+          color = self.colorScale(d.unit);
+
+      ctx.beginPath();
+      ctx.arc(x, y, self.pointRadius(d), 0, 2 * Math.PI);
+      // status: 1 = complete, 2 = ongoing
+      if (d.status == '2') {
+        ctx.strokeStyle = color;
+        ctx.stroke();
+      } else {
+        ctx.fillStyle = color;
+        ctx.fill();
+      }
+      points[i] = {x: x, y: y, r: self.rScale(d.duration), i: i, d: d};
+    }
+
+    self.quadtree = d3.geom.quadtree()
+      .x(function(p) { return p.x; })
+      .y(function(p) { return p.y; })(points);
+  };
+
+  self.canvasPointAt = function(x, y) {
+    // Return the top most canvas point under the graph coordinates x, y,
+    // only visiting the quadtree nodes within the largest radius of them.
+    var max_r = self.rScale.range()[1],
+        hit = null;
+
+    self.quadtree.visit(function(node, x1, y1, x2, y2) {
+      var p = node.point;
+      if (p && (!hit || p.i > hit.i)) {
+        var dx = p.x - x,
+            dy = p.y - y;
+        if (dx * dx + dy * dy <= p.r * p.r) {
+          hit = p;
+        }
+      }
+      return x1 > x + max_r || x2 < x - max_r || y1 > y + max_r || y2 < y - max_r;
+    });
+    return hit;
+  };
+
+  self.canvasMouseMove = function() {
+    if (!self.quadtree) {
+      return;
+    }
+    // In the rotated coordinates of the graph
+    var graph = self.svg.select(".graph"),
+        mouse = d3.mouse(graph.node()),
+        hit = self.canvasPointAt(mouse[0], mouse[1]);
+
+    if (hit === self.hovered) {
+      return;
+    }
+    self.canvasMouseLeave();
+    if (hit) {
+      self.hovered = hit;
+      // The tooltip is positioned by an invisible circle over the point
+      var anchor = graph.append("circle")
+        .attr({
+          "class": "hover",
+          cx: hit.x,
+          cy: hit.y,
+          r: hit.r,
+          fill: "none"
+        })
+        .style("pointer-events", "none");
+      self.showTooltip.call(anchor.node(), hit.d);
+    }
+  };
+
+  self.canvasMouseLeave = function() {
+    if (self.hovered) {
+      self.hovered = null;
+      self.removeTooltip();
+      self.svg.selectAll("circle.hover").remove();
+    }
+  };
+
   self.showTooltip = function (d) {
     buildTooltip = function(d) {
       return "\
@@ -0,0 +1,84 @@
+/*
+ * Keyboard controls for the project review queue, see
+ * ProjectDetailAdmin.review_view. Projects are marked for an action and
+ * submitted together, one hidden input per project named after its action.
+ */
+(function($) {
+  var ACTIONS = {
+    r: 'reject',
+    f: 'flag',
+    u: 'unflag'
+  };
+
+  $(document).ready(function() {
+    var $form = $('#review-form'),
+        $rows = $('#review-queue tbody tr[data-id]'),
+        marks = {},
+        current = 0;
+
+    if (!$rows.length) {
+      return;
+    }
+
+    function select(index) {
+      current = Math.max(0, Math.min($rows.length - 1, index));
+      $rows.removeClass('grp-selected');
+      var $row = $rows.eq(current).addClass('grp-selected'),
+          top = $row.offset().top,
+          $window = $(window);
+      if (top < $window.scrollTop() || top > $window.scrollTop() + $window.height() - 100) {
+        $window.scrollTop(top - $window.height() / 2);
+      }
+    }
+
+    function mark(action) {
+      var $row = $rows.eq(current);
+      if (action) {
+        marks[$row.data('id')] = action;
+      } else {
+        delete marks[$row.data('id')];
+      }
+      $row.find('.review-mark').text(action || '');
+      select(current + 1);
+    }
+
+    $(document).on('keydown', function(e) {
+      if (e.ctrlKey || e.metaKey || e.altKey || $(e.target).is(':input')) {
+        return;
+      }
+      var key = String.fromCharCode(e.which).toLowerCase();
+      if (key === 'j') {
+        select(current + 1);
+      } else if (key === 'k') {
+        select(current - 1);
+      } else if (ACTIONS[key]) {
+        mark(ACTIONS[key]);
+      } else if (key === 'c') {
+        mark(null);
+      } else if (key === 'o') {
+        window.open($rows.eq(current).find('a').attr('href'));
+      } else if (key === 's') {
+        $form.submit();
+      } else {
+        return;
+      }
+      e.preventDefault();
+    });
+
+    $rows.on('click', function() {
+      select($rows.index(this));
+    });
+
+    $form.on('submit', function() {
+      $form.find('input.review-action').remove();
+      $.each(marks, function(id, action) {
+        $('<input type="hidden" class="review-action">')
+          .attr('name', action)
+          .val(id)
+          .appendTo($form);
+      });
+    });
+
+    select(0);
+  });
+})(grp.jQuery);
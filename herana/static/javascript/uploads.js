@@ -0,0 +1,84 @@
+/*
+ * Upload project output attachments straight to the file storage with a
+ * presigned POST from ATTACHMENT_UPLOAD_URL, and submit only the key of
+ * the uploaded file with the form, see herana/uploads.py. Without FormData
+ * the file is submitted with the form as before.
+ */
+(function($) {
+  var pending = 0;
+
+  function csrfToken() {
+    return $('input[name=csrfmiddlewaretoken]').val();
+  }
+
+  function setStatus($input, text) {
+    var $status = $input.siblings('.upload-status');
+    if (!$status.length) {
+      $status = $('<span class="upload-status"></span>').insertAfter($input);
+    }
+    $status.text(text);
+  }
+
+  function upload(input) {
+    var $input = $(input),
+        file = input.files[0],
+        $key = $('#' + input.id + '_key'),
+        $submit = $input.closest('form').find(':submit');
+
+    pending += 1;
+    $submit.prop('disabled', true);
+    setStatus($input, 'Uploading ' + file.name + '...');
+
+    function done(text) {
+      pending -= 1;
+      if (!pending) {
+        $submit.prop('disabled', false);
+      }
+      setStatus($input, text);
+    }
+
+    $.post(ATTACHMENT_UPLOAD_URL, {
+      filename: file.name,
+      csrfmiddlewaretoken: csrfToken()
+    }).done(function(presigned) {
+      var data = new FormData(),
+          xhr = new XMLHttpRequest();
+
+      $.each(presigned.fields, function(i, field) {
+        data.append(field.name, field.value);
+      });
+      // The file must be the last field
+      data.append('file', file);
+
+      xhr.upload.onprogress = function(e) {
+        if (e.lengthComputable) {
+          setStatus($input, 'Uploading ' + file.name + ' ' + Math.round(100 * e.loaded / e.total) + '%');
+        }
+      };
+      xhr.onload = function() {
+        if (xhr.status >= 200 && xhr.status < 300) {
+          $key.val(presigned.key);
+          // Don't submit the file again with the form
+          $input.val('');
+          done('Uploaded ' + file.name);
+        } else {
+          done('Uploading ' + file.name + ' failed, please try again.');
+        }
+      };
+      xhr.onerror = function() {
+        done('Uploading ' + file.name + ' failed, please try again.');
+      };
+      xhr.open('POST', presigned.action);
+      xhr.send(data);
+    }).fail(function() {
+      done('Uploading ' + file.name + ' failed, please try again.');
+    });
+  }
+
+  $(document).on('change', 'input[type=file][name$="-attachment"]', function() {
+    if (!window.FormData || !window.ATTACHMENT_UPLOAD_URL || !this.files || !this.files.length) {
+      return;
+    }
+    upload(this);
+  });
+})(django.jQuery);
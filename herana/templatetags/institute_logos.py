@@ -0,0 +1,29 @@
+from django import template
+
+from herana.logos import LOGO_HEIGHTS, WEBP_LOGOS, has_derivatives, logo_url
+
+register = template.Library()
+
+
+@register.inclusion_tag('herana/institute_logo.html')
+def institute_logo(institute, height=LOGO_HEIGHTS[0]):
+    """
+    Render an institute's logo resized for the given CSS height in pixels,
+    with the double size for high density screens and WebP where supported,
+    or the original until it's been resized.
+    """
+    double = height * 2
+    if height not in LOGO_HEIGHTS or double not in LOGO_HEIGHTS:
+        raise template.TemplateSyntaxError(
+            "Institute logos are resized for heights %s and their doubles"
+            % ', '.join(str(h) for h in LOGO_HEIGHTS))
+
+    if not has_derivatives(institute):
+        return {'institute': institute, 'src': institute.get_logo_path()}
+    return {
+        'institute': institute,
+        'src': logo_url(institute, height),
+        'src_2x': logo_url(institute, double),
+        'webp': WEBP_LOGOS and logo_url(institute, height, 'webp'),
+        'webp_2x': WEBP_LOGOS and logo_url(institute, double, 'webp'),
+    }
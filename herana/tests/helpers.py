@@ -0,0 +1,102 @@
+"""
+Test data shared by the test modules.
+"""
+import shutil
+import tempfile
+from datetime import date
+
+from django.test import override_settings
+
+from herana.models import (
+    CustomUser,
+    Institute,
+    InstituteAdmin,
+    OrgLevel1,
+    OrgLevel2,
+    ProjectDetail,
+    ProjectLeader,
+    ReportingPeriod,
+)
+
+
+PASSWORD = 'password'
+
+
+def use_temporary_storage(test):
+    """
+    Store the files a test writes, e.g. uploads and results snapshots,
+    in a temporary directory which is removed after it.
+    """
+    media_root = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, media_root)
+    storage_settings = override_settings(
+        DEFAULT_FILE_STORAGE='herana.uploads.LocalUploadStorage', MEDIA_ROOT=media_root)
+    storage_settings.enable()
+    test.addCleanup(storage_settings.disable)
+
+
+def create_institute(name='Test University'):
+    """
+    Return a new institute with two faculties, a department in each, a
+    project leader, an institute admin and a closed and an active period.
+    """
+    institute = Institute.objects.create(
+        name=name, org_level_1_name='Faculty', org_level_2_name='Department')
+    faculties = [OrgLevel1.objects.create(institute=institute, name='Faculty %d' % n)
+                 for n in range(2)]
+    for n, faculty in enumerate(faculties):
+        OrgLevel2.objects.create(institute=institute, parent=faculty, name='Department %d' % n)
+
+    slug = name.lower().replace(' ', '-')
+    user = CustomUser.objects.create_user('leader@%s.test' % slug, PASSWORD)
+    ProjectLeader.objects.create(user=user, institute=institute, org_level_1=faculties[0])
+    user = CustomUser.objects.create_user('admin@%s.test' % slug, PASSWORD)
+    InstituteAdmin.objects.create(user=user, institute=institute)
+
+    ReportingPeriod.objects.create(institute=institute, name='2015', description='2015', is_active=False)
+    ReportingPeriod.objects.create(institute=institute, name='2016', description='2016')
+    return institute
+
+
+def leader(institute):
+    return institute.projectleader_set.get().user
+
+
+def admin(institute):
+    return institute.institute_admin.get().user
+
+
+def closed_period(institute):
+    return institute.reporting_period.get(is_active=False)
+
+
+def active_period(institute):
+    return institute.reporting_period.get(is_active=True)
+
+
+def create_project(institute, reporting_period=None, **values):
+    """
+    Return a new final project of the institute's project leader, in its
+    active period unless another is given.
+    """
+    project_leader = institute.projectleader_set.get()
+    fields = {
+        'name': 'Project',
+        'proj_leader': project_leader,
+        'institute': institute,
+        'org_level_1': project_leader.org_level_1,
+        'project_status': 1,
+        'start_date': date(2014, 1, 1),
+        'record_status': 2,
+        'reporting_period': reporting_period or active_period(institute),
+        'initiation': 1,
+        'authors': 2,
+        'research': 1,
+        'public_domain': 'Y',
+        'phd_research': 'Y',
+        'new_courses': 'Y',
+        'external_collaboration': 'Y',
+        'amendments_permitted': 'Y',
+    }
+    fields.update(values)
+    return ProjectDetail.objects.create(**fields)
@@ -0,0 +1,71 @@
+import json
+
+from django.contrib.admin.models import LogEntry, CHANGE
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from herana.models import ProjectDetail, ReportingPeriod
+from herana.moderation import moderate_projects
+from herana.periods import close_reporting_period
+
+from helpers import use_temporary_storage, admin, active_period, create_institute, create_project
+
+
+class ModerateProjectsTest(TestCase):
+    def setUp(self):
+        use_temporary_storage(self)
+        self.institute = create_institute()
+        self.user = admin(self.institute)
+        reporting_period = self.institute.reporting_period.get(is_active=False)
+        # Closed with its projects, so that it has a snapshot
+        reporting_period.is_active = True
+        reporting_period.save()
+        self.closed = [create_project(self.institute, reporting_period=reporting_period, name='Closed %d' % n)
+                       for n in range(3)]
+        close_reporting_period(reporting_period)
+        self.active = [create_project(self.institute, name='Active %d' % n) for n in range(2)]
+
+    def snapshot_ids(self):
+        reporting_period = ReportingPeriod.objects.get(is_active=False, institute=self.institute)
+        with default_storage.open(reporting_period.results_snapshot) as f:
+            return set(p['id'] for p in json.loads(f.read())['projects'])
+
+    def projects(self, projects):
+        return ProjectDetail.objects.filter(pk__in=[p.pk for p in projects])
+
+    def test_single_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            changed = moderate_projects(self.user, self.projects(self.active), 'flag')
+        self.assertEqual(changed, 2)
+        updates = [q['sql'] for q in queries.captured_queries
+                   if 'UPDATE "herana_projectdetail"' in q['sql']]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.projects(self.active).filter(is_flagged=True).count(), 2)
+
+    def test_log_entries(self):
+        moderate_projects(self.user, self.projects(self.active), 'reject', 'Not engagement')
+        entries = LogEntry.objects.filter(user=self.user).order_by('object_id')
+        self.assertEqual([(e.object_id, e.action_flag, e.change_message) for e in entries],
+                         [(unicode(p.pk), CHANGE, 'Rejected: Not engagement') for p in self.active])
+        for project in self.projects(self.active):
+            self.assertTrue(project.is_rejected)
+            self.assertEqual(project.rejected_detail, 'Not engagement')
+
+    def test_unchanged_projects(self):
+        moderate_projects(self.user, self.projects(self.active[:1]), 'flag')
+        self.assertEqual(moderate_projects(self.user, self.projects(self.active), 'flag'), 1)
+        self.assertEqual(LogEntry.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(moderate_projects(self.user, self.projects(self.active), 'flag'), 0)
+
+    def test_reject_refreshes_snapshot(self):
+        self.assertEqual(self.snapshot_ids(), set(p.pk for p in self.closed))
+        moderate_projects(self.user, self.projects(self.closed[:1]), 'reject')
+        self.assertEqual(self.snapshot_ids(), set(p.pk for p in self.closed[1:]))
+
+    def test_flag_keeps_snapshot(self):
+        name = ReportingPeriod.objects.get(is_active=False, institute=self.institute).results_snapshot
+        moderate_projects(self.user, self.projects(self.closed), 'flag')
+        self.assertEqual(ReportingPeriod.objects.get(is_active=False, institute=self.institute).results_snapshot,
+                         name)
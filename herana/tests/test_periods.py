@@ -0,0 +1,82 @@
+from django.test import TestCase
+
+from herana.choices import OTHER_ACADEMICS, questionnaire_option
+from herana.models import (
+    Collaborators,
+    PHDStudent,
+    ProjectDetail,
+    ProjectFunding,
+    ResearchTeamMember,
+    StrategicObjective,
+)
+from herana.periods import carry_over_projects
+
+from helpers import active_period, closed_period, create_institute, create_project
+
+
+class CarryOverProjectsTest(TestCase):
+    def setUp(self):
+        self.institute = create_institute()
+        self.other_academics = questionnaire_option(ResearchTeamMember, OTHER_ACADEMICS)
+        self.objective = StrategicObjective.objects.create(
+            institute=self.institute, statement='Engage', is_true=True)
+
+        self.project = create_project(self.institute, reporting_period=closed_period(self.institute),
+                                      is_rejected=True, rejected_detail='Incomplete')
+        self.project.strategic_objectives.add(self.objective)
+        self.project.team_members.add(*ResearchTeamMember.objects.exclude(pk=self.other_academics.pk)[:2])
+        ProjectFunding.objects.create(project=self.project, funder='NRF', amount=1000, years=2, renewable='Y')
+        ProjectFunding.objects.create(project=self.project, funder='DST', amount=500, years=1, renewable='N')
+        PHDStudent.objects.create(project=self.project, name='Student')
+        Collaborators.objects.create(project=self.project, name='Collaborator', university='Elsewhere')
+
+    def test_copies(self):
+        copies = carry_over_projects(ProjectDetail.objects.filter(pk=self.project.pk))
+        self.assertEqual(len(copies), 1)
+        copy = ProjectDetail.objects.get(pk=copies[0].pk)
+
+        self.assertNotEqual(copy.pk, self.project.pk)
+        self.assertEqual(copy.reporting_period, active_period(self.institute))
+        self.assertEqual(copy.carried_over_from, self.project)
+        self.assertEqual(copy.name, self.project.name)
+        self.assertFalse(copy.is_rejected)
+        self.assertIsNone(copy.rejected_detail)
+        self.assertFalse(copy.is_flagged)
+
+        self.assertEqual(list(copy.strategic_objectives.all()), [self.objective])
+        self.assertEqual(set(copy.team_members.all()), set(self.project.team_members.all()))
+        self.assertEqual(sorted(copy.projectfunding_set.values_list('funder', 'amount', 'years')),
+                         sorted(self.project.projectfunding_set.values_list('funder', 'amount', 'years')))
+        self.assertEqual(copy.phdstudent_set.count(), 1)
+        self.assertEqual(copy.collaborators_set.get().university, 'Elsewhere')
+
+        # The original is left as it was
+        self.assertEqual(self.project.projectfunding_set.count(), 2)
+        self.assertEqual(ProjectDetail.objects.get(pk=self.project.pk).reporting_period,
+                         closed_period(self.institute))
+
+    def test_skips_duplicates(self):
+        carry_over_projects(ProjectDetail.objects.filter(pk=self.project.pk))
+        self.assertEqual(carry_over_projects(ProjectDetail.objects.filter(pk=self.project.pk)), [])
+        self.assertEqual(ProjectDetail.objects.filter(carried_over_from=self.project).count(), 1)
+
+    def test_carries_over_deleted_copies_again(self):
+        copy, = carry_over_projects(ProjectDetail.objects.filter(pk=self.project.pk))
+        ProjectDetail.objects.filter(pk=copy.pk).update(is_deleted=True)
+        self.assertEqual(len(carry_over_projects(ProjectDetail.objects.filter(pk=self.project.pk))), 1)
+
+    def test_skips_active_period(self):
+        project = create_project(self.institute)
+        self.assertEqual(carry_over_projects(ProjectDetail.objects.filter(pk=project.pk)), [])
+
+    def test_flags_other_academics(self):
+        self.project.team_members = [self.other_academics]
+        with_others = create_project(self.institute, reporting_period=closed_period(self.institute))
+        with_others.team_members = ResearchTeamMember.objects.all()[:3]
+        with_others.team_members.add(self.other_academics)
+
+        copies = carry_over_projects(ProjectDetail.objects.filter(pk__in=[self.project.pk, with_others.pk]))
+        flagged = dict(ProjectDetail.objects
+                       .filter(pk__in=[c.pk for c in copies])
+                       .values_list('carried_over_from', 'is_flagged'))
+        self.assertEqual(flagged, {self.project.pk: True, with_others.pk: False})
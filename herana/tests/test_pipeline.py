@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase, override_settings
+
+from herana.pipeline import PyScssCompiler
+
+
+class PyScssCompilerTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        scss_settings = override_settings(
+            PYSCSS_CACHE_DIR=os.path.join(self.directory, 'cache'), PYSCSS_LOAD_PATHS=[])
+        scss_settings.enable()
+        self.addCleanup(scss_settings.disable)
+
+        self.infile = os.path.join(self.directory, 'style.scss')
+        self.outfile = os.path.join(self.directory, 'style.css')
+        with open(os.path.join(self.directory, '_colours.scss'), 'w') as f:
+            f.write('$text: #123456;\n')
+        with open(self.infile, 'w') as f:
+            f.write('@import "colours";\np { color: $text; }\n')
+
+        self.compiler = PyScssCompiler(verbose=False, storage=None)
+        self.hashed = []
+        source_hash = self.compiler.source_hash
+        self.compiler.source_hash = lambda infile: self.hashed.append(infile) or source_hash(infile)
+
+    def output(self):
+        with open(self.outfile) as f:
+            return f.read()
+
+    def test_compiles_outdated(self):
+        self.compiler.compile_file(self.infile, self.outfile, outdated=True)
+        self.assertIn('#123456', self.output())
+        self.assertEqual(self.hashed, [self.infile])
+
+    def test_skips_up_to_date(self):
+        self.compiler.compile_file(self.infile, self.outfile, outdated=True)
+        self.compiler.compile_file(self.infile, self.outfile, outdated=False)
+        self.assertEqual(self.hashed, [self.infile])
+
+    def test_compiles_missing_output(self):
+        self.compiler.compile_file(self.infile, self.outfile, outdated=False)
+        self.assertIn('#123456', self.output())
+
+    def test_forced(self):
+        self.compiler.compile_file(self.infile, self.outfile, outdated=True)
+        with open(os.path.join(self.directory, '_colours.scss'), 'w') as f:
+            f.write('$text: #abcdef;\n')
+        self.compiler.compile_file(self.infile, self.outfile, outdated=False, force=True)
+        self.assertIn('#abcdef', self.output())
+        self.assertEqual(len(self.hashed), 2)
+
+    def test_reuses_cached_css(self):
+        self.compiler.compile_file(self.infile, self.outfile, outdated=True)
+        os.remove(self.outfile)
+        cached = os.listdir(os.path.join(self.directory, 'cache'))
+        self.compiler.compile_file(self.infile, self.outfile, outdated=True)
+        self.assertEqual(os.listdir(os.path.join(self.directory, 'cache')), cached)
+        self.assertIn('#123456', self.output())
@@ -0,0 +1,257 @@
+import csv
+import json
+import StringIO
+from datetime import date, timedelta
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from herana.models import OrgLevel1, OrgLevel2
+from herana.results import (
+    SCORE_KEYS,
+    decode_columnar,
+    encode_columnar,
+    filter_projects,
+    freeze_scores,
+    project_dicts,
+    visible_projects,
+)
+
+from helpers import (
+    PASSWORD,
+    active_period,
+    closed_period,
+    create_institute,
+    create_project,
+    leader,
+)
+
+
+def browser_filter(projects, reporting_period=None, org_level=1, status=None,
+                   duration=None, hidden_units=()):
+    """
+    The filtering the results page did in the browser on every project's
+    as_dict(), before filter_projects() replaced it.
+    """
+    level = 'org_level_%d' % org_level
+    if reporting_period:
+        projects = [p for p in projects if p['reporting_period']['id'] == reporting_period.id]
+    projects = [p for p in projects if p[level]]
+    if status:
+        projects = [p for p in projects if p['status'] == status]
+    if duration is not None:
+        projects = [p for p in projects if p['duration'] == duration]
+    projects = [p for p in projects if p[level] not in hidden_units]
+    return sorted(projects, key=lambda p: p['duration'], reverse=True)
+
+
+def create_projects(institute):
+    """
+    Create a dozen final projects across the institute's periods, units,
+    statuses and durations, and freeze the scores of its closed period.
+    """
+    faculties = list(OrgLevel1.objects.filter(institute=institute).order_by('pk'))
+    departments = list(OrgLevel2.objects.filter(institute=institute).order_by('pk'))
+    start = date(2010, 1, 1)
+    for n in range(12):
+        create_project(
+            institute,
+            reporting_period=closed_period(institute) if n % 2 else active_period(institute),
+            name='Project %d' % n,
+            org_level_1=faculties[n % 2],
+            org_level_2=departments[n % 2] if n % 3 else None,
+            project_status=1 + n // 2 % 2,
+            start_date=start,
+            end_date=start + timedelta(days=365 * (1 + n % 6) + 30))
+    # Not shown
+    create_project(institute, name='Draft', record_status=1)
+    create_project(institute, name='Rejected', is_rejected=True)
+    freeze_scores(closed_period(institute))
+
+
+class FilterProjectsTest(TestCase):
+    def setUp(self):
+        self.institute = create_institute()
+        create_projects(self.institute)
+        # Changes after closing don't change the closed period's results
+        frozen = self.institute.projectdetail_set.get(name='Project 1')
+        frozen.project_status = 2
+        frozen.org_level_2 = None
+        frozen.save()
+
+        self.projects = visible_projects(leader(self.institute), self.institute)
+        self.dicts = project_dicts(self.projects)
+
+    def assertFiltersLikeBrowser(self, **filters):
+        points = filter_projects(self.projects, **filters)
+        expected = browser_filter(self.dicts, **filters)
+        level = 'org_level_%d' % filters.get('org_level', 1)
+
+        self.assertEqual(
+            sorted((p['id'], p['duration'], p['status'], p['unit'], p['score']) for p in points),
+            sorted((p['id'], p['duration'], p['status'], p[level], p['score']) for p in expected))
+        durations = [p['duration'] for p in points]
+        self.assertEqual(durations, sorted(durations, reverse=True))
+        return points
+
+    def test_unfiltered(self):
+        points = self.assertFiltersLikeBrowser()
+        self.assertEqual(len(points), 12)
+
+    def test_frozen_projects(self):
+        points = self.assertFiltersLikeBrowser(org_level=2)
+        frozen = self.institute.projectdetail_set.get(name='Project 1')
+        point = [p for p in points if p['id'] == frozen.id][0]
+        self.assertEqual(point['status'], 1)
+        self.assertEqual(point['unit'], 'Department 1')
+
+    def test_reporting_period(self):
+        for reporting_period in (closed_period(self.institute), active_period(self.institute)):
+            self.assertEqual(len(self.assertFiltersLikeBrowser(reporting_period=reporting_period)), 6)
+
+    def test_org_level(self):
+        for org_level in (1, 2, 3):
+            self.assertFiltersLikeBrowser(org_level=org_level)
+
+    def test_status(self):
+        for status in (1, 2):
+            self.assertFiltersLikeBrowser(status=status)
+
+    def test_duration(self):
+        for duration in range(5):
+            points = self.assertFiltersLikeBrowser(duration=duration)
+            self.assertTrue(points)
+            self.assertEqual(set(p['duration'] for p in points), set([duration]))
+
+    def test_combined(self):
+        self.assertFiltersLikeBrowser(
+            reporting_period=closed_period(self.institute), org_level=2, status=2,
+            hidden_units=['Department 0'])
+        self.assertFiltersLikeBrowser(
+            reporting_period=active_period(self.institute), status=1, duration=0)
+
+    def test_hidden_units(self):
+        points = self.assertFiltersLikeBrowser(hidden_units=['Faculty 0'])
+        self.assertEqual(set(p['unit'] for p in points), set(['Faculty 1']))
+
+
+class ColumnarTest(TestCase):
+    def point(self, id, unit, status, duration, score):
+        return {
+            'id': id,
+            'unit': unit,
+            'status': status,
+            'duration': duration,
+            'score': dict((key, score) for key in SCORE_KEYS),
+        }
+
+    def test_round_trip(self):
+        units = [u'Faculty of Science', u'Facult\xe9 des Lettres', u'Law']
+        points = [
+            self.point(70000, u'Law', 1, 4, 8.5),
+            self.point(2, u'Facult\xe9 des Lettres', 2, 0, 0.25),
+            self.point(3, u'Faculty of Science', None, 2, 4.75),
+        ]
+
+        decoded_units, decoded = decode_columnar(encode_columnar(units, points))
+        self.assertEqual(decoded_units, units)
+        self.assertEqual([p['id'] for p in decoded], [70000, 2, 3])
+        self.assertEqual([p['unit'] for p in decoded], [u'Law', u'Facult\xe9 des Lettres', u'Faculty of Science'])
+        # A missing status is sent as 0, which isn't a status
+        self.assertEqual([p['status'] for p in decoded], [1, 2, 0])
+        self.assertEqual([p['duration'] for p in decoded], [4, 0, 2])
+        for point, original in zip(decoded, points):
+            for key in SCORE_KEYS:
+                self.assertAlmostEqual(point['score'][key], original['score'][key], places=5)
+
+    def test_many_units(self):
+        # Unit indexes don't fit in a byte
+        units = ['Unit %d' % n for n in range(300)]
+        points = [self.point(n, 'Unit %d' % (299 - n), 1, 1, 1.0) for n in range(300)]
+
+        decoded_units, decoded = decode_columnar(encode_columnar(units, points))
+        self.assertEqual([p['unit'] for p in decoded], [p['unit'] for p in points])
+
+    def test_empty(self):
+        self.assertEqual(decode_columnar(encode_columnar([], [])), ([], []))
+
+
+class ResultsPermissionTest(TestCase):
+    """
+    Projects in an active reporting period are only shown to the
+    institute's own users and the global admin.
+    """
+    def setUp(self):
+        self.institute = create_institute()
+        self.other_institute = create_institute('Other University')
+        create_projects(self.institute)
+        self.active_ids = set(self.institute.projectdetail_set
+                              .filter(reporting_period__is_active=True, record_status=2, is_rejected=False)
+                              .values_list('id', flat=True))
+        self.closed_ids = set(self.institute.projectdetail_set
+                              .filter(reporting_period__is_active=False)
+                              .values_list('id', flat=True))
+
+    def login(self, institute):
+        self.client.login(username=leader(institute).email, password=PASSWORD)
+
+    def data_ids(self, **params):
+        params['institute'] = self.institute.id
+        response = self.client.get(reverse('results-data'), params)
+        self.assertEqual(response.status_code, 200)
+        return set(p['id'] for p in json.loads(response.content)['projects'])
+
+    def columnar_ids(self):
+        response = self.client.get(reverse('results-data'),
+                                   {'institute': self.institute.id, 'format': 'columnar'})
+        self.assertEqual(response.status_code, 200)
+        return set(p['id'] for p in decode_columnar(response.content)[1])
+
+    def changes(self):
+        return self.client.get(reverse('results-changes'), {'institute': self.institute.id, 'since': 0})
+
+    def export_names(self):
+        response = self.client.get(reverse('results-export'), {'institute': self.institute.id})
+        self.assertEqual(response.status_code, 200)
+        rows = list(csv.reader(StringIO.StringIO(''.join(response.streaming_content))))
+        column = rows[0].index('Project Name')
+        return set(row[column] for row in rows[1:])
+
+    def assertOnlyClosed(self):
+        self.assertEqual(self.data_ids(), self.closed_ids)
+        self.assertEqual(self.data_ids(reporting_period=active_period(self.institute).id), set())
+        self.assertEqual(self.columnar_ids(), self.closed_ids)
+        self.assertEqual(self.changes().status_code, 403)
+        names = self.export_names()
+        self.assertEqual(len(names), len(self.closed_ids))
+        self.assertFalse(names & set(self.institute.projectdetail_set
+                                     .filter(id__in=self.active_ids)
+                                     .values_list('name', flat=True)))
+
+    def test_anonymous(self):
+        self.assertOnlyClosed()
+
+    def test_other_institute(self):
+        self.login(self.other_institute)
+        self.assertOnlyClosed()
+
+    def test_own_institute(self):
+        self.login(self.institute)
+        self.assertEqual(self.data_ids(), self.closed_ids | self.active_ids)
+        self.assertEqual(self.columnar_ids(), self.closed_ids | self.active_ids)
+        self.assertEqual(len(self.export_names()), len(self.closed_ids | self.active_ids))
+
+        response = self.changes()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(p['id'] for p in json.loads(response.content)['projects']),
+                         self.active_ids)
+
+
+class ResultsExportTest(TestCase):
+    def test_filename(self):
+        institute = create_institute(u'Universit\xe9 de Test')
+        response = self.client.get(reverse('results-export'), {'institute': institute.id})
+        self.assertEqual(
+            response['Content-Disposition'],
+            "attachment; filename*=UTF-8''Herana%%20results%%20-%%20Universit%%C3%%A9%%20de%%20Test%%20-%%20%s.csv"
+            % date.today())
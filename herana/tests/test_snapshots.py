@@ -0,0 +1,74 @@
+import json
+
+from django.core.files.storage import default_storage
+from django.test import TestCase
+
+from herana.models import Institute
+from herana.periods import close_reporting_period
+from herana.snapshots import INDEX_FIELDS, index_projects, snapshot_url
+
+from helpers import use_temporary_storage, closed_period, create_institute, create_project
+
+
+def project(status, duration, org_level_1, org_level_2=None):
+    return {
+        'status': status,
+        'duration': duration,
+        'org_level_1': org_level_1,
+        'org_level_2': org_level_2,
+        'org_level_3': None,
+    }
+
+
+class IndexProjectsTest(TestCase):
+    def test_delta_encoding(self):
+        projects = [
+            project(1, 4, 'Science', 'Physics'),
+            project(2, 4, 'Science'),
+            project(1, 3, 'Law', 'Tax'),
+            project(1, 0, 'Science', 'Physics'),
+            project(2, 0, 'Law'),
+        ]
+        index = index_projects(projects)
+
+        self.assertEqual(set(index), set(INDEX_FIELDS))
+        self.assertEqual(index['status'], {1: [0, 2, 1], 2: [1, 3]})
+        self.assertEqual(index['duration'], {4: [0, 1], 3: [2], 0: [3, 1]})
+        self.assertEqual(index['org_level_1'], {'Science': [0, 1, 2], 'Law': [2, 2]})
+        # Projects without a unit at a level aren't indexed there
+        self.assertEqual(index['org_level_2'], {'Physics': [0, 3], 'Tax': [2]})
+        self.assertEqual(index['org_level_3'], {})
+
+    def test_positions(self):
+        projects = [project(1 + n % 2, n % 5, 'Unit %d' % (n % 7)) for n in range(100)]
+        for field, postings in index_projects(projects).items():
+            for value, deltas in postings.items():
+                positions = [sum(deltas[:i + 1]) for i in range(len(deltas))]
+                self.assertEqual(positions, [i for i, p in enumerate(projects) if p[field] == value])
+
+
+class SnapshotTest(TestCase):
+    def setUp(self):
+        use_temporary_storage(self)
+        self.institute = create_institute()
+
+    def test_close_reporting_period(self):
+        reporting_period = self.institute.reporting_period.get(is_active=True)
+        shown = create_project(self.institute, reporting_period=reporting_period)
+        create_project(self.institute, reporting_period=reporting_period, record_status=1)
+        self.assertIsNone(snapshot_url(reporting_period))
+
+        close_reporting_period(reporting_period)
+        name = reporting_period.results_snapshot
+        self.assertEqual(snapshot_url(reporting_period), default_storage.url(name))
+        with default_storage.open(name) as f:
+            snapshot = json.loads(f.read())
+        self.assertEqual([p['id'] for p in snapshot['projects']], [shown.id])
+        institute = Institute.objects.get(pk=self.institute.pk)
+        self.assertTrue(default_storage.exists(institute.results_export))
+
+    def test_snapshot_in_older_format(self):
+        reporting_period = closed_period(self.institute)
+        reporting_period.results_snapshot = '%d/%d.v1.0123456789ab.json' % (
+            self.institute.id, reporting_period.id)
+        self.assertIsNone(snapshot_url(reporting_period))
@@ -0,0 +1,139 @@
+import base64
+import hashlib
+import hmac
+import json
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.urlresolvers import reverse
+from django.test import TestCase, override_settings
+
+from herana.botopatch import S3Storage
+from herana.forms import ProjectOutputForm
+from herana.models import ProjectOutputType
+from herana.uploads import attachment_key, attachment_content_type
+
+from helpers import PASSWORD, use_temporary_storage, create_institute, create_project, leader
+
+
+class AttachmentUploadTest(TestCase):
+    """
+    The presigned POST round trip, with LocalUploadStorage standing in
+    for the bucket.
+    """
+    def setUp(self):
+        use_temporary_storage(self)
+        self.institute = create_institute()
+        self.project = create_project(self.institute)
+        self.client.login(username=leader(self.institute).email, password=PASSWORD)
+
+    def presign(self, filename):
+        response = self.client.post(reverse('admin:herana_projectdetail_attachment_upload'),
+                                    {'filename': filename})
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def upload(self, presigned, content, **changes):
+        data = dict((field['name'], field['value']) for field in presigned['fields'])
+        data.update(changes)
+        data['file'] = SimpleUploadedFile('upload', content)
+        return self.client.post(presigned['action'], data)
+
+    def output_form(self, key):
+        return ProjectOutputForm(data={
+            'project': self.project.pk,
+            'type': ProjectOutputType.objects.first().pk,
+            'attachment_key': key,
+        })
+
+    def test_round_trip(self):
+        presigned = self.presign('Annual report.pdf')
+        key = presigned['key']
+        self.assertTrue(key.endswith('/Annual_report.pdf'))
+        self.assertIn({'name': 'Content-Type', 'value': 'application/pdf'}, presigned['fields'])
+
+        self.assertEqual(self.upload(presigned, 'report').status_code, 204)
+        with default_storage.open(key) as f:
+            self.assertEqual(f.read(), 'report')
+
+        form = self.output_form(key)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['attachment'], key)
+
+    def test_content_type_from_extension(self):
+        self.assertEqual(attachment_content_type('a/b/data.XLSX'),
+                         'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        self.assertEqual(attachment_content_type('a/b/page.html'), 'application/octet-stream')
+        self.assertEqual(attachment_content_type('a/b/image.svg'), 'application/octet-stream')
+        self.assertEqual(attachment_content_type('a/b/README'), 'application/octet-stream')
+
+    def test_expired_policy(self):
+        key = attachment_key('report.pdf')
+        presigned = default_storage.presigned_post(key, 100, 'application/pdf', expires_in=-1)
+        self.assertEqual(self.upload(presigned, 'report').status_code, 403)
+        self.assertFalse(default_storage.exists(key))
+
+    def test_forged_policy(self):
+        presigned = self.presign('report.pdf')
+        self.assertEqual(self.upload(presigned, 'report', policy='forged').status_code, 403)
+        self.assertFalse(default_storage.exists(presigned['key']))
+
+    def test_oversize_file(self):
+        key = attachment_key('report.pdf')
+        presigned = default_storage.presigned_post(key, 10, 'application/pdf')
+        self.assertEqual(self.upload(presigned, 'x' * 11).status_code, 400)
+        self.assertFalse(default_storage.exists(key))
+        self.assertEqual(self.upload(presigned, 'x' * 10).status_code, 204)
+
+    def test_mismatched_key(self):
+        presigned = self.presign('report.pdf')
+        other_key = attachment_key('report.pdf')
+        self.assertEqual(self.upload(presigned, 'report', key=other_key).status_code, 400)
+        self.assertFalse(default_storage.exists(other_key))
+
+    def test_mismatched_content_type(self):
+        presigned = self.presign('report.pdf')
+        response = self.upload(presigned, '<script></script>', **{'Content-Type': 'text/html'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(default_storage.exists(presigned['key']))
+
+    def test_form_rejects_key_not_uploaded(self):
+        form = self.output_form(attachment_key('report.pdf'))
+        self.assertFalse(form.is_valid())
+        self.assertIn('attachment', form.errors)
+
+    def test_form_rejects_other_keys(self):
+        default_storage.save('attachments/1/report.pdf', SimpleUploadedFile('report.pdf', 'report'))
+        form = self.output_form('attachments/1/report.pdf')
+        self.assertFalse(form.is_valid())
+        self.assertIn('attachment', form.errors)
+
+
+@override_settings(AWS_S3_HOST='s3-eu-west-1.amazonaws.com')
+class S3PresignedPostTest(TestCase):
+    def setUp(self):
+        self.storage = S3Storage(access_key='AKIDEXAMPLE', secret_key='secret', bucket='herana-test')
+
+    def test_policy(self):
+        key = attachment_key('report.pdf')
+        presigned = self.storage.presigned_post(key, 100, 'application/pdf')
+        fields = dict((field['name'], field['value']) for field in presigned['fields'])
+        self.assertEqual(presigned['action'], 'https://herana-test.s3-eu-west-1.amazonaws.com/')
+        self.assertEqual(fields['key'], key)
+        self.assertEqual(fields['Content-Type'], 'application/pdf')
+
+        conditions = json.loads(base64.b64decode(fields['policy']))['conditions']
+        self.assertIn({'bucket': 'herana-test'}, conditions)
+        self.assertIn({'key': key}, conditions)
+        self.assertIn({'Content-Type': 'application/pdf'}, conditions)
+        self.assertIn(['content-length-range', 0, 100], conditions)
+        # Nothing is left for the browser to choose
+        self.assertEqual([c for c in conditions if isinstance(c, list) and c[0] == 'starts-with'], [])
+
+        date, region = fields['x-amz-credential'].split('/')[1:3]
+        self.assertEqual(region, 'eu-west-1')
+        signing_key = 'AWS4secret'
+        for part in (date, region, 's3', 'aws4_request'):
+            signing_key = hmac.new(signing_key, part, hashlib.sha256).digest()
+        self.assertEqual(fields['x-amz-signature'],
+                         hmac.new(signing_key, fields['policy'], hashlib.sha256).hexdigest())
@@ -0,0 +1,109 @@
+"""
+Direct uploads of project output attachments from the browser to the file
+storage, so that large files never pass through the app servers.
+
+The project form asks ProjectDetailAdmin.attachment_upload_view for a
+presigned POST to a new key, the browser posts the file straight to the
+storage with it and the form only submits the key, see ProjectOutputForm
+and javascript/uploads.js.
+
+S3Storage presigns the POST for the bucket. LocalUploadStorage is a
+stand-in for development and tests which signs it for LocalUploadView.
+
+The Content-Type of an upload is set here from its extension and signed
+with the rest of the POST, rather than taken from the browser, so that
+attachments are only served from the bucket as the types outputs are
+expected to be, and e.g. never as HTML.
+"""
+import os
+import re
+import time
+import uuid
+
+from django.core import signing
+from django.core.files.storage import FileSystemStorage
+from django.core.urlresolvers import reverse
+from django.utils.text import get_valid_filename
+
+
+ATTACHMENT_UPLOAD_PREFIX = 'attachments/uploads/'
+ATTACHMENT_MAX_SIZE = 100 * 1024 * 1024
+UPLOAD_EXPIRES_IN = 60 * 60
+
+ATTACHMENT_KEY_RE = re.compile(r'^%s[0-9a-f]{32}/[^/]+$' % re.escape(ATTACHMENT_UPLOAD_PREFIX))
+
+# Attachments with other extensions are stored as ATTACHMENT_DEFAULT_TYPE
+ATTACHMENT_CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'doc': 'application/msword',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'gif': 'image/gif',
+    'jpeg': 'image/jpeg',
+    'jpg': 'image/jpeg',
+    'odp': 'application/vnd.oasis.opendocument.presentation',
+    'ods': 'application/vnd.oasis.opendocument.spreadsheet',
+    'odt': 'application/vnd.oasis.opendocument.text',
+    'pdf': 'application/pdf',
+    'png': 'image/png',
+    'ppt': 'application/vnd.ms-powerpoint',
+    'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    'rtf': 'application/rtf',
+    'txt': 'text/plain',
+    'xls': 'application/vnd.ms-excel',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'zip': 'application/zip',
+}
+ATTACHMENT_DEFAULT_TYPE = 'application/octet-stream'
+
+
+def attachment_key(filename):
+    """
+    Return a new, unique storage key for an attachment upload.
+    """
+    return '%s%s/%s' % (ATTACHMENT_UPLOAD_PREFIX, uuid.uuid4().hex,
+                        get_valid_filename(os.path.basename(filename)))
+
+
+def is_attachment_key(key):
+    return bool(ATTACHMENT_KEY_RE.match(key))
+
+
+def attachment_content_type(key):
+    """
+    Return the Content-Type an attachment is stored as.
+    """
+    extension = os.path.splitext(key)[1].lstrip('.').lower()
+    return ATTACHMENT_CONTENT_TYPES.get(extension, ATTACHMENT_DEFAULT_TYPE)
+
+
+class LocalUploadStorage(FileSystemStorage):
+    """
+    File system storage which accepts presigned POST uploads like
+    S3Storage, signed with the secret key for LocalUploadView.
+    """
+    def presigned_post(self, name, max_size, content_type, expires_in=UPLOAD_EXPIRES_IN):
+        policy = signing.dumps({
+            'key': name,
+            'max_size': max_size,
+            'content_type': content_type,
+            'expires': time.time() + expires_in,
+        }, salt='herana.uploads')
+        return {
+            'action': reverse('local-upload'),
+            'fields': [
+                {'name': 'key', 'value': name},
+                {'name': 'Content-Type', 'value': content_type},
+                {'name': 'policy', 'value': policy},
+            ],
+        }
+
+    def check_policy(self, policy):
+        """
+        Return the key, maximum size and content type of a policy from
+        presigned_post(), raise signing.BadSignature if it's invalid or
+        expired.
+        """
+        policy = signing.loads(policy, salt='herana.uploads')
+        if policy['expires'] < time.time():
+            raise signing.SignatureExpired("The policy expired")
+        return policy['key'], policy['max_size'], policy['content_type']
@@ -1,13 +1,26 @@
+from django.conf import settings
 from django.conf.urls import patterns, include, url
+from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
 from django.contrib import admin
-from views import ResultsView
+from views import (
+    ResultsView, ResultsDataView, ResultsChangesView, ResultsExportView, ResultsComparisonView,
+    ResultsBenchmarkView, OrgLevelAutocompleteLookup, LocalUploadView)
 
 admin.site.index_title = 'Dashboard'
 
 urlpatterns = patterns('',
     url(r'^$', 'herana.views.home', name='home'),
     url(r'^results/$', ResultsView.as_view(), name='results'),
+    url(r'^results/data/$', ResultsDataView.as_view(), name='results-data'),
+    url(r'^results/changes/$', ResultsChangesView.as_view(), name='results-changes'),
+    url(r'^results/export/$', ResultsExportView.as_view(), name='results-export'),
+    url(r'^results/comparison/$', ResultsComparisonView.as_view(), name='results-comparison'),
+    url(r'^results/benchmark/$', ResultsBenchmarkView.as_view(), name='results-benchmark'),
+    url(r'^uploads/local/$', LocalUploadView.as_view(), name='local-upload'),
+    # Replaces grappelli's own lookup, reversed by the same name
+    url(r'^grappelli/lookup/autocomplete/$', OrgLevelAutocompleteLookup.as_view(),
+        name='grp_autocomplete_lookup'),
     url(r'^grappelli/', include('grappelli.urls')),
     url(r'^accounts/', include('registration.backends.default.urls')),
 
@@ -17,3 +30,6 @@ urlpatterns = patterns('',
     url(r'^reset/(?P<uidb64>[0-9A-Za-z_\-]+)/(?P<token>.+)/$', auth_views.password_reset_confirm, name='password_reset_confirm'),
     url(r'^reset/done/$', auth_views.password_reset_complete, name='password_reset_complete'),
 )
+
+# Only when DEBUG is on, production files are stored on S3
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
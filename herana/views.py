@@ -1,14 +1,36 @@
 import json
-import StringIO
-from datetime import date
-from collections import OrderedDict, Mapping
-import xlsxwriter
-
-from django.shortcuts import render
+import tempfile
+import time
+from datetime import date, datetime
+from wsgiref.util import FileWrapper
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.shortcuts import render, redirect
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import View
-from django.http import HttpResponse
-
-from models import Institute, ProjectDetail
+from django.http import (
+    HttpResponse, StreamingHttpResponse, JsonResponse,
+    Http404, HttpResponseForbidden, HttpResponseBadRequest)
+
+from grappelli.settings import AUTOCOMPLETE_LIMIT
+from grappelli.views.related import AutocompleteLookup
+
+from models import Institute, ProjectDetail, ReportingPeriod
+from forms import ResultsFilterForm, ResultsChangesForm, ResultsExportForm, ResultsComparisonForm
+from results import (
+    SCORE_PREFETCH, can_view_active_results, visible_projects, project_institutes,
+    filter_projects, unit_legend, project_dicts, encode_columnar,
+    changed_projects, changes_version, project_changes, iter_project_dicts)
+from snapshots import snapshot_url, export_snapshot_url, export_filename, build_export
+from exports import build_xlsx, build_comparison_xlsx, csv_lines, write_parquet, attachment_disposition
+from comparison import comparison_scores, compare_institutes
+from uploads import LocalUploadStorage
+from autocomplete import AUTOCOMPLETE_MODELS, unit_suggestions
 
 
 def home(request):
@@ -30,26 +52,21 @@ class ResultsView(View):
                 is_rejected=False,
                 is_deleted=False,
                 reporting_period__is_active=active)\
-            .prefetch_related('institute', 'strategic_objectives', 'student_nature', 'student_types',
+            .prefetch_related('institute', 'reporting_period', 'student_types',
                               'org_level_1', 'org_level_2', 'org_level_3',
                               'org_level_1__institute', 'org_level_2__institute', 'org_level_3__institute',
-                              'adv_group_rep', 'team_members', 'focus_area')
+                              'focus_area', *SCORE_PREFETCH)
         if institute:
             projects = projects.filter(institute=institute)
         return projects
 
 
     def get(self, request, *args, **kwargs):
-        # Get projects for closed reporting periods
-        projects = self.get_projects()
-        # Get unique instances of institutes for these projects
-        institutes = {proj.institute for proj in projects}
+        # Get institutes with projects in closed reporting periods
+        institutes = set(project_institutes(self.get_projects()))
 
         data = {}
 
-        data['projects'] = [p.as_dict() for p in projects]
-
-        active_projects = []
         if request.user.is_authenticated():
             if request.user.is_superuser:
                 # Get active period projects for all institutes
@@ -62,15 +79,24 @@ class ResultsView(View):
                     institute=user_institute)
                 data['user_institute'] =  user_institute.as_dict()
 
-        # Add institutes for active period projects
-        institutes.update([proj.institute for proj in active_projects])
+            # Add institutes for active period projects
+            institutes.update(project_institutes(active_projects))
 
         data['institutes'] = [
             i.as_dict(user=request.user, add_reporting_periods=True)
             for i in institutes
         ]
-        data['projects'].extend([p.as_dict() for p in active_projects])
 
+        # Closed periods are loaded from their static snapshots, changes
+        # are only watched for in the active one
+        periods = ReportingPeriod.objects.in_bulk([
+            rp['id'] for i in data['institutes'] for rp in i['reporting_periods']])
+        for i in data['institutes']:
+            for rp in i['reporting_periods']:
+                rp['is_active'] = periods[rp['id']].is_active
+                rp['snapshot'] = snapshot_url(periods[rp['id']])
+
+        # Projects are fetched per institute from ResultsDataView
         has_results = True if data['institutes'] else False
 
         context = {
@@ -86,104 +112,205 @@ class ResultsView(View):
     def post(self, request, *args, **kwargs):
         institute = Institute.objects.get(id=int(request.POST.get('institute_id')))
 
-        if request.user.is_authenticated():
-            if request.user.is_superuser:
-                projects = self.get_projects(active=True, institute=institute)
-            else:
-                if request.user.get_user_institute() == institute:
-                    projects = self.get_projects(active=True, institute=institute)
-                else:
-                    projects = self.get_projects(institute=institute)
+        if not can_view_active_results(request.user, institute):
+            # Closed period results are published as a static file
+            url = export_snapshot_url(institute)
+            if url:
+                return redirect(url)
+            xlsx = build_export(institute)
         else:
-            projects = self.get_projects(institute=institute)
+            projects = self.get_projects(active=True, institute=institute)
+            xlsx = build_xlsx(institute, project_dicts(projects))
+
+        response = HttpResponse(xlsx, content_type='application/vnd.ms-excel')
+        response['Content-Disposition'] = attachment_disposition(export_filename(institute, date.today()))
 
-        xlsx = build_xlsx(institute, [p.as_dict() for p in projects])
+        return response
 
-        filename = 'Herana results - %s - %s' % (institute.name, date.today())
 
-        response = HttpResponse(xlsx, content_type='application/vnd.ms-excel')
-        response['Content-Disposition'] = 'attachment; filename=%s.xlsx' % filename
+class ResultsDataView(View):
+    """
+    Return the chart points and unit legend for an institute's results,
+    with the results page filters applied.
 
+    Pass format=columnar for the binary encoding in results.encode_columnar().
+    """
+    def get(self, request, *args, **kwargs):
+        form = ResultsFilterForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        filters = form.cleaned_data
+
+        # Active period results are only visible to the institute's own users
+        projects = visible_projects(request.user, filters['institute'])
+
+        units = unit_legend(projects, filters['org_level'])
+        points = filter_projects(
+            projects,
+            reporting_period=filters['reporting_period'],
+            org_level=filters['org_level'],
+            status=filters['status'],
+            duration=filters['duration'],
+            hidden_units=filters['hidden_units'])
+
+        if request.GET.get('format') == 'columnar':
+            return HttpResponse(encode_columnar(units, points),
+                                content_type='application/octet-stream')
+        return JsonResponse({'units': units, 'projects': points})
+
+
+class ResultsChangesView(View):
+    """
+    Long-poll for the projects finalised, rescored or removed in the active
+    reporting period of an institute since the cursor, which the results
+    page merges into its chart, see results.project_changes().
+
+    Waits up to TIMEOUT seconds for a change, checking the institute's
+    change counter in the cache every INTERVAL, see results.bump_changes(),
+    which only parks a greenlet on the gevent workers. The database
+    connection is closed while waiting, so that waiting requests don't hold
+    connections. The timeout is kept below the router's 30 seconds.
+    """
+    TIMEOUT = 20
+    INTERVAL = 2
+    EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+    def get(self, request, *args, **kwargs):
+        form = ResultsChangesForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        institute = form.cleaned_data['institute']
+        if not can_view_active_results(request.user, institute):
+            return HttpResponseForbidden()
+
+        if form.cleaned_data['since'] is None:
+            # The first request is only answered with a cursor
+            return self.changes(timezone.now(), [], [])
+        since = datetime.fromtimestamp(form.cleaned_data['since'], timezone.utc)
+
+        version = changes_version(institute)
+        if not changed_projects(institute, since).exists():
+            connection.close()
+            deadline = time.time() + self.TIMEOUT
+            while changes_version(institute) == version and time.time() < deadline:
+                time.sleep(self.INTERVAL)
+
+        # Taken before reading, changes made during the read are sent next time
+        cursor = timezone.now()
+        points, removed = project_changes(institute, since, form.cleaned_data['org_level'])
+        return self.changes(cursor, points, removed)
+
+    def changes(self, cursor, points, removed):
+        return JsonResponse({
+            'cursor': (cursor - self.EPOCH).total_seconds(),
+            'projects': points,
+            'removed': removed,
+        })
+
+
+class ResultsExportView(View):
+    """
+    Stream the results of an institute as CSV, or as Parquet with
+    format=parquet, with the same columns as the XLSX export. Active
+    period results are only included for the institute's own users.
+
+    Projects are read a chunk at a time, see results.iter_project_dicts().
+    CSV lines are sent as they're written. Parquet files can only be read
+    once complete, so they're written to a temporary file first.
+    """
+    def get(self, request, *args, **kwargs):
+        form = ResultsExportForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        institute = form.cleaned_data['institute']
+        projects = iter_project_dicts(visible_projects(request.user, institute))
+
+        if form.cleaned_data['format'] == 'parquet':
+            output = tempfile.TemporaryFile()
+            write_parquet(institute, projects, output)
+            output.seek(0)
+            response = StreamingHttpResponse(FileWrapper(output), content_type='application/octet-stream')
+        else:
+            response = StreamingHttpResponse(csv_lines(institute, projects), content_type='text/csv')
+
+        response['Content-Disposition'] = attachment_disposition(
+            export_filename(institute, date.today(), form.cleaned_data['format']))
         return response
 
 
-def build_xlsx(institute, projects):
-    output = StringIO.StringIO()
-    workbook = xlsxwriter.Workbook(output)
+class ResultsComparisonView(View):
+    """
+    Compare the results of institutes across their closed reporting
+    periods, see comparison.compare_institutes(). Only for the global admin.
 
-    ws = workbook.add_worksheet('Results')
+    Pass format=xlsx for a workbook of the comparison.
+    """
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_superuser:
+            return HttpResponseForbidden()
+        form = ResultsComparisonForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+
+        rows = compare_institutes(comparison_scores(form.cleaned_data['institute']))
+
+        if form.cleaned_data['format'] == 'xlsx':
+            response = HttpResponse(build_comparison_xlsx(rows), content_type='application/vnd.ms-excel')
+            response['Content-Disposition'] = attachment_disposition(
+                'Herana comparison - %s.xlsx' % date.today())
+            return response
+        return JsonResponse({'institutes': rows})
+
+
+class ResultsBenchmarkView(View):
+    """
+    Time the results graph's SVG and canvas renderers
+    with generated points, see graph-benchmark.js.
+    """
+    @method_decorator(staff_member_required)
+    def dispatch(self, request, *args, **kwargs):
+        return super(ResultsBenchmarkView, self).dispatch(request, *args, **kwargs)
 
-    col = 0
-    sheet_headings = create_report_headings(institute)
+    def get(self, request, *args, **kwargs):
+        data = {'institutes': {}, 'user_institute': None}
+        return render(request, 'results_benchmark.html', {'data': json.dumps(data)})
+
+
+class OrgLevelAutocompleteLookup(AutocompleteLookup):
+    """
+    Grappelli's autocomplete lookup, which ranks and caches the suggestions
+    for the org levels, see herana.autocomplete, and only suggests the units
+    of their own institute to users other than the global admin.
+    """
+    def get_data(self):
+        if self.model not in AUTOCOMPLETE_MODELS:
+            return super(OrgLevelAutocompleteLookup, self).get_data()
+        units = self.get_filtered_queryset(self.model._default_manager.all())
+        user = self.request.user
+        if not user.is_superuser:
+            units = units.filter(institute=user.get_user_institute())
+        return unit_suggestions(units, self.GET['term'], AUTOCOMPLETE_LIMIT)
+
+
+class LocalUploadView(View):
+    """
+    Accept the presigned POST uploads of LocalUploadStorage, standing in
+    for the S3 bucket in development and tests. Answers like S3 does.
+    """
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        if not isinstance(default_storage, LocalUploadStorage):
+            raise Http404
+        return super(LocalUploadView, self).dispatch(request, *args, **kwargs)
 
-    for k, v in sheet_headings.iteritems():
-        row = 0
-        if not isinstance(v, OrderedDict):
-            ws.write(row, col, v)
-            write_values(ws, col, projects, k)
-            col += 1
-        else:
-            for child_k, child_v in v.iteritems():
-                ws.write(row, col, child_v)
-                write_values(ws, col, projects, child_k, parent_key=k)
-                col += 1
-
-    workbook.close()
-    output.seek(0)
-    return output.read()
-
-
-def write_values(ws, col, projects, key, parent_key=None):
-    row = 1
-    for proj in projects:
-        if not parent_key:
-            if key == 'reporting_period':
-                ws.write(row, col, proj[key]['name'])
-            elif key == 'duration':
-                ws.write(row, col, DURATION[proj[key]])
-            elif key == 'status':
-                ws.write(row, col, STATUS[proj[key]])
-            elif key == 'institute':
-                ws.write(row, col, proj['institute']['name'])
-            else:
-                ws.write(row, col, proj[key])
-        else:
-            ws.write(row, col, proj[parent_key][key])
-        row += 1
-
-
-def create_report_headings(institute):
-    return OrderedDict([
-        ('institute', 'Institute'),
-        ('name', 'Project Name'),
-        ('org_level_1', '1 - %s' % (institute.org_level_1_name if institute.org_level_1_name else '')),
-        ('org_level_2', '2 - %s' % (institute.org_level_2_name if institute.org_level_2_name else '')),
-        ('org_level_3', '3 - %s' % (institute.org_level_3_name if institute.org_level_3_name else '')),
-        ('reporting_period', 'Period captured'),
-        ('duration', 'Duration'),
-        ('status', 'Status'),
-        ('score', OrderedDict([
-            ('a_1', 'Alignment of objectives'),
-            ('a_2', 'Initiation/agenda-setting'),
-            ('a_3', 'External stakeholders'),
-            ('a_4', 'Funding'),
-            ('y', 'Articulation Total'),
-            ('c_1', 'Generates new knowledge or product'),
-            ('c_2', 'Dissemination'),
-            ('c_3_a', 'Teaching/curriculum development'),
-            ('c_3_b', 'Formal teaching/learning of students'),
-            ('c_4', 'Links to academic network'),
-            ('x', 'Academic Core Total')
-        ]))
-    ])
-
-DURATION = {
-    0: '0-1.99',
-    1: '2-2.99',
-    2: '3-3.99',
-    3: '4-4.99',
-    4: '5+'}
-
-STATUS = {
-    1: 'Complete',
-    2: 'Ongoing'}
+    def post(self, request, *args, **kwargs):
+        try:
+            key, max_size, content_type = default_storage.check_policy(request.POST.get('policy', ''))
+        except signing.BadSignature:
+            return HttpResponseForbidden()
+        upload = request.FILES.get('file')
+        if request.POST.get('key') != key or request.POST.get('Content-Type') != content_type \
+                or not upload or upload.size > max_size:
+            return HttpResponseBadRequest()
+        default_storage.save(key, upload)
+        return HttpResponse(status=204)
@@ -11,6 +11,6 @@ import os
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "herana.settings")
 
 from django.core.wsgi import get_wsgi_application
-from whitenoise.django import DjangoWhiteNoise
+from herana.pipeline import HeranaWhiteNoise
 application = get_wsgi_application()
-application = DjangoWhiteNoise(application)
+application = HeranaWhiteNoise(application)